@@ -1,153 +1,125 @@
 from __future__ import annotations
+import time
+_IMPORT_T0 = time.perf_counter()
 from flask import (
-    Flask, render_template, request, redirect, send_file,
-    send_from_directory, session, url_for, flash, jsonify
+    Flask, render_template, request, redirect, current_app,
+    send_from_directory, session, url_for, flash, jsonify,
+    Response, stream_with_context
 )
 from functools import wraps
-import sqlite3, qrcode, io, secrets, os, json, csv, math
+import sqlite3, io, secrets, os, json, csv, math, codecs, importlib, threading
 from datetime import date, datetime
-from flask_babel import Babel
+from extras import pool as db_pool
+from extras import archive, backup, changefeed, fragcache, maintenance, metrics, migrations, profiler, qrcache, rollup, roster, search, sse, translations, writequeue
+from extras.qrcache import qr_cache
+from extras.conditional import conditional
+# qrcode / PIL は QR の画面で初めて読む（extras/qrcache.py・extras/badges.py）。flask_babel は BABEL=1 のときだけ
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_T0
 
 # ===== 基本設定 =====
 APP_ROOT = os.path.dirname(__file__)
 DB_PATH = os.environ.get("DB_PATH") or os.path.join(APP_ROOT, "care.db")
 APP_SECRET = os.environ.get("APP_SECRET") or os.urandom(16)
 
-app = Flask(__name__)
-app.secret_key = APP_SECRET
-
-# ===== Babel / i18n =====
-app.config["BABEL_DEFAULT_LOCALE"] = "ja"
-app.config["BABEL_DEFAULT_TIMEZONE"] = "Asia/Tokyo"
-app.config["LANGUAGES"] = ["ja", "en"]
-babel = Babel(app)
-
-def get_locale():
-    lang = session.get("lang")
-    if lang in app.config["LANGUAGES"]:
-        return lang
-    return request.accept_languages.best_match(app.config["LANGUAGES"]) or "ja"
-
-babel.init_app(app, locale_selector=get_locale)
-
-def _load_json_translations():
-    base = APP_ROOT
-    candidates = [
-        lambda lang: os.path.join(base, "translations", f"{lang}.json"),
-        lambda lang: os.path.join(base, f"{lang}.json"),
-    ]
-    data = {}
-    for lang in app.config["LANGUAGES"]:
-        loaded = {}
-        for fn in candidates:
-            p = fn(lang)
-            if os.path.exists(p):
-                try:
-                    with open(p, encoding="utf-8") as f:
-                        loaded = json.load(f)
-                except Exception as e:
-                    print(f"[i18n] load fail {p}: {e}")
-                    loaded = {}
-                break
-        data[lang] = loaded
-    return data
-
-TRANSLATIONS = _load_json_translations()
-
-def _t(key, **kwargs):
-    s = TRANSLATIONS.get(get_locale(), {}).get(key, key)
-    if kwargs:
-        try: s = s % kwargs
-        except Exception: pass
-    return s
-
-_ = _t
-app.jinja_env.globals.update(_=_, get_locale=get_locale)
-
-@app.get("/set_language/<lang>")
+# ===== ルート表 =====
+# ルートは import 時には app に付けず表に積んでおき、create_app() がまとめて登録する
+class RouteTable:
+    def __init__(self):
+        self.rules = []           # (rule, endpoint, view, options)
+        self.error_handlers = []  # (code または例外, view)
+
+    def route(self, rule, **options):
+        def deco(f):
+            self.rules.append((rule, options.pop("endpoint", f.__name__), f, options))
+            return f
+        return deco
+
+    def get(self, rule, **options):
+        return self.route(rule, methods=["GET"], **options)
+
+    def post(self, rule, **options):
+        return self.route(rule, methods=["POST"], **options)
+
+    def errorhandler(self, code_or_exc):
+        def deco(f):
+            self.error_handlers.append((code_or_exc, f))
+            return f
+        return deco
+
+    def register(self, app):
+        for rule, endpoint, view, options in self.rules:
+            app.add_url_rule(rule, endpoint, view, **options)
+        for code_or_exc, view in self.error_handlers:
+            app.register_error_handler(code_or_exc, view)
+
+routes = RouteTable()
+
+# ===== i18n =====
+# ロケールはリクエストごとに 1 回だけ決めて g に持つ（テンプレの _() は束縛済みの関数を直接呼ぶ）
+get_locale = translations.get_locale
+# カタログは extras.translations がプロセスで 1 回だけ読む（ja.json / en.json + extras/i18n.T）
+_t = _ = translations.gettext
+
+@routes.get("/set_language/<lang>")
 def set_language(lang):
-    lang = (lang or "ja").lower()
-    if lang in app.config["LANGUAGES"]:
-        session["lang"] = lang
+    if translations.set_locale(lang):
         flash(_("言語を切り替えました。"))
     return redirect(request.referrer or url_for("home"))
 
-@app.get("/i18n/reload")
-def i18n_reload():
-    global TRANSLATIONS
-    TRANSLATIONS = _load_json_translations()
-    flash(_("言語を切り替えました。"))
-    return redirect(request.referrer or url_for("home"))
-
-@app.get("/i18n/debug")
+@routes.get("/i18n/debug")
 def i18n_debug():
     lang = get_locale()
-    return {"current_lang": lang, "keys_loaded": len(TRANSLATIONS.get(lang, {}))}
+    # 未翻訳キーの件数（言語ごと、多い順）と読み込み状況
+    return {"current_lang": lang, "keys_loaded": len(translations.catalogs.catalog(lang)),
+            **translations.catalogs.stats()}
 
 # ===== DB =====
 def dict_factory(cursor, row):
     return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False)
-    conn.row_factory = dict_factory
-    conn.execute("PRAGMA foreign_keys=ON;")
-    conn.execute("PRAGMA journal_mode=WAL;")
-    conn.execute("PRAGMA synchronous=NORMAL;")
-    return conn
+# 接続はプールから借りる（PRAGMA は作成時に 1 回だけ。リクエスト終了で返却）
+# 書き込みレーン（既定 1 本）と mode=ro の読み取りレーンを分ける
+DB_POOL = DB_READ_POOL = None
+# 利用者名簿（id・名前）のキャッシュ。利用者の追加・削除で invalidate する
+ROSTER = None
+# WRITE_BEHIND=1 のときは記録/引継ぎの INSERT を書き込みスレッドにまとめてコミットさせる
+WRITE_QUEUE = None
+
+def bind_db(db_path):
+    # DB はプロセスに 1 つ（create_app の DB_PATH で差し替える）
+    global DB_PATH, DB_POOL, DB_READ_POOL, ROSTER, WRITE_QUEUE
+    DB_PATH = db_path
+    DB_POOL = db_pool.get_pool(db_path)
+    DB_READ_POOL = db_pool.get_pool(db_path, readonly=True)
+    ROSTER = roster.get_roster(db_path)
+    WRITE_QUEUE = writequeue.get_queue(db_path)
+
+def get_connection(readonly=False):
+    # 参照だけの処理は readonly=True（WAL の読み手として書き込みロックを取らない）
+    return db_pool.get_db(DB_READ_POOL if readonly else DB_POOL, row_factory=dict_factory)
+
+def run_write(fn):
+    # fn(conn) をコミットまで終えて戻り値を返す
+    if WRITE_QUEUE is not None:
+        return WRITE_QUEUE.run(fn)
+    try:
+        with get_connection() as conn:
+            return fn(conn)
+    except sqlite3.OperationalError as e:
+        # 書き込みロックが取れない → キュー経由と同じく 503 で再送してもらう
+        if writequeue.is_busy(e):
+            raise writequeue.WriteTimeout(f"database is locked: {e}") from e
+        raise
+    finally:
+        # 書き込みレーンは既定 1 本。リクエストの残り（描画など）の間、他の書き手を待たせない
+        release_writer()
+
+def release_writer():
+    db_pool.release_db(pool=DB_POOL)
 
 def init_db():
-    with get_connection() as conn:
-        c = conn.cursor()
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS users(
-          id INTEGER PRIMARY KEY AUTOINCREMENT,
-          name TEXT NOT NULL, age INTEGER, gender TEXT,
-          room_number TEXT, notes TEXT
-        )""")
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS staff(
-          id INTEGER PRIMARY KEY AUTOINCREMENT,
-          name TEXT NOT NULL UNIQUE,
-          password TEXT NOT NULL,
-          role TEXT NOT NULL,
-          login_token TEXT
-        )""")
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS records(
-          id INTEGER PRIMARY KEY AUTOINCREMENT,
-          user_id INTEGER NOT NULL,
-          meal TEXT, medication TEXT, toilet TEXT, condition TEXT, memo TEXT,
-          staff_name TEXT,
-          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-          FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-        )""")
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS handover(
-          id INTEGER PRIMARY KEY AUTOINCREMENT,
-          h_date TEXT NOT NULL,
-          shift TEXT NOT NULL,
-          note TEXT NOT NULL,
-          staff TEXT NOT NULL,
-          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )""")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_records_user_id ON records(user_id)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_records_created ON records(created_at DESC)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_handover_date ON handover(h_date, shift)")
-        conn.commit()
-    # 初回管理者の自動作成
-    with get_connection() as conn:
-        c = conn.cursor()
-        c.execute("SELECT COUNT(*) AS cnt FROM staff WHERE role='admin'")
-        if (c.fetchone()["cnt"] or 0) == 0:
-            c.execute("INSERT OR IGNORE INTO staff(name,password,role) VALUES(?,?,?)",
-                      ("admin","admin","admin"))
-            conn.commit()
-
-if not os.path.exists(DB_PATH):
-    init_db()
-else:
-    init_db()
+    # スキーマは extras/migrations.py で版管理（最新なら user_version を読むだけ）
+    migrations.ensure(DB_PATH)
 
 # ===== 認可 =====
 def login_required(f):
@@ -168,17 +140,70 @@ def admin_required(f):
     return w
 
 # ===== 共通 =====
-def paginate(total: int, page: int, per_page: int):
+# 件数は表示用の目安なので毎回 COUNT(*) せず短時間キャッシュする
+COUNT_TTL = int(os.environ.get("COUNT_TTL") or 30)
+_count_cache: dict = {}
+
+def cached_count(conn, sql, params=(), ttl=COUNT_TTL):
+    key = (sql, tuple(params))
+    now = time.monotonic()
+    hit = _count_cache.get(key)
+    if hit and now - hit[1] < ttl:
+        return hit[0]
+    total = conn.execute(sql, params).fetchone()["cnt"]
+    if len(_count_cache) > 256:
+        _count_cache.clear()
+    _count_cache[key] = (total, now)
+    return total
+
+def keyset_fetch(conn, select_sql, where, params, id_col, per_page,
+                 before_id=None, after_id=None, offset=0):
+    # id DESC 順のキーセット取得。after_id 指定時は昇順で取って並べ直す
+    conds, params = list(where), list(params)
+    if after_id is not None:
+        conds.append(f"{id_col} > ?"); params.append(after_id); order = "ASC"
+    else:
+        if before_id is not None:
+            conds.append(f"{id_col} < ?"); params.append(before_id)
+        order = "DESC"
+    sql = select_sql
+    if conds:
+        sql += " WHERE " + " AND ".join(conds)
+    sql += f" ORDER BY {id_col} {order} LIMIT ? OFFSET ?"
+    rows = conn.execute(sql, params + [per_page + 1, offset]).fetchall()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if order == "ASC":
+        rows.reverse()
+    return rows, has_more
+
+def paginate(total: int, page: int, per_page: int, rows=None,
+             before_id=None, after_id=None, has_more=False):
     pages = max(1, math.ceil(total / per_page))
     page = max(1, min(page, pages))
-    return {
+    pg = {
         "page": page, "per_page": per_page, "pages": pages, "total": total,
         "has_prev": page > 1, "has_next": page < pages,
         "prev_page": page-1 if page>1 else None, "next_page": page+1 if page<pages else None,
+        "keyset": before_id is not None or after_id is not None,
+        "next_cursor": None, "prev_cursor": None,
     }
+    if pg["keyset"]:
+        # カーソル指定時はページ番号を持たない（total は概算）
+        pg.update(page=None, prev_page=None, next_page=None,
+                  has_next=has_more if after_id is None else True,
+                  has_prev=True if after_id is None else has_more)
+    if rows:
+        # ページ番号モードでも次/前カーソルを出し、以降の移動はキーセットで行う
+        if pg["has_next"]: pg["next_cursor"] = rows[-1]["id"]
+        if pg["has_prev"]: pg["prev_cursor"] = rows[0]["id"]
+    return pg
+
+def cursor_args():
+    return request.args.get("before_id", type=int), request.args.get("after_id", type=int)
 
 # ===== 画面 =====
-@app.get("/")
+@routes.get("/")
 def home():
     try:
         return render_template("home.html")
@@ -192,7 +217,7 @@ def home():
         )
 
 # スタッフ登録/ログイン
-@app.route("/staff_register", methods=["GET","POST"])
+@routes.route("/staff_register", methods=["GET","POST"])
 def staff_register():
     if request.method == "POST":
         name = (request.form.get("name") or "").strip()
@@ -213,12 +238,12 @@ def staff_register():
                 flash(_("同名のスタッフがすでに存在します。"))
     return render_template("staff_register.html")
 
-@app.route("/staff_login", methods=["GET","POST"])
+@routes.route("/staff_login", methods=["GET","POST"])
 def staff_login():
     if request.method == "POST":
         name = request.form.get("name")
         password = request.form.get("password")
-        with get_connection() as conn:
+        with get_connection(readonly=True) as conn:
             c = conn.cursor()
             c.execute("SELECT name, role FROM staff WHERE name=? AND password=?", (name,password))
             row = c.fetchone()
@@ -229,19 +254,19 @@ def staff_login():
         flash(_("名前またはパスワードが間違っています。"))
     return render_template("staff_login.html")
 
-@app.get("/logout")
+@routes.get("/logout")
 def logout():
     session.clear()
     flash(_("ログアウトしました。"))
     return redirect(url_for("home"))
 
-@app.get("/admin")
+@routes.get("/admin")
 @admin_required
 def admin_page():
     return render_template("admin.html")
 
 # === 追加: 管理画面からスタッフ登録（admin専用） ===
-@app.post("/admin/staff/add")
+@routes.post("/admin/staff/add")
 @admin_required
 def admin_staff_add():
     name = (request.form.get("name") or "").strip()
@@ -264,17 +289,62 @@ def admin_staff_add():
             flash(f"既存スタッフ「{name}」の情報を更新しました（role={role}）。")
     return redirect(url_for("admin_page"))
 
+# === バックアップ（backup API で少しずつコピー。実行はバックグラウンド） ===
+@routes.post("/admin/backup")
+@admin_required
+def admin_backup():
+    started = backup.start_background(DB_PATH)
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"started": started, **backup.status()}), 202 if started else 409
+    flash("バックアップを開始しました。" if started else "バックアップは実行中です。")
+    return redirect(url_for("admin_page"))
+
+@routes.get("/admin/backup")
+@admin_required
+def admin_backup_status():
+    return jsonify({**backup.status(), "snapshots": [os.path.basename(p) for p in backup.snapshots(DB_PATH)]})
+
+# === 翻訳の再読み込み（共有版数を上げ、他のワーカーも次の確認時に読み直す） ===
+@routes.post("/i18n/reload")
+@admin_required
+def i18n_reload():
+    version = translations.bump(DB_PATH)
+    keys = translations.catalogs.reload()
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"version": version, "keys": keys})
+    flash("翻訳を再読み込みしました。")
+    return redirect(request.referrer or url_for("admin_page"))
+
+# === SQL プロファイラ（文ごとの集計・遅い文・リクエストごとの繰り返し） ===
+@routes.route("/admin/profiler", methods=["GET", "POST"])
+@admin_required
+def admin_profiler():
+    if request.method == "POST":
+        action = request.form.get("action")
+        if action == "on":
+            profiler.enable()
+        elif action == "off":
+            profiler.disable()
+        elif action == "reset":
+            profiler.reset()
+        return redirect(url_for("admin_profiler"))
+    report = profiler.report()
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(report)
+    return render_template("admin_profiler.html", report=report)
+
 # スタッフ一覧・削除・QR
-@app.get("/staff_list")
+@routes.get("/staff_list")
 @admin_required
+@conditional("staff")
 def staff_list():
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn, fragcache.snapshot(conn, ("staff",)) as versions:
         c = conn.cursor()
         c.execute("SELECT id, name, password, role, login_token FROM staff ORDER BY id")
         staff = c.fetchall()
-    return render_template("staff_list.html", staff_list=staff)
+    return render_template("staff_list.html", staff_list=staff, versions=versions)
 
-@app.route("/delete_staff/<int:sid>", methods=["POST","GET"])
+@routes.route("/delete_staff/<int:sid>", methods=["POST","GET"])
 @admin_required
 def delete_staff(sid):
     with get_connection() as conn:
@@ -284,7 +354,7 @@ def delete_staff(sid):
     flash(_("スタッフを削除しました。"))
     return redirect(url_for("staff_list"))
 
-@app.route("/generate_qr", methods=["GET","POST"])
+@routes.route("/generate_qr", methods=["GET","POST"])
 @admin_required
 def generate_qr():
     if request.method == "POST":
@@ -293,34 +363,57 @@ def generate_qr():
         token = secrets.token_hex(8)
         with get_connection() as conn:
             c = conn.cursor()
+            old = c.execute("SELECT login_token FROM staff WHERE name=?", (name,)).fetchone()
             c.execute("UPDATE staff SET role=?, login_token=? WHERE name=?", (role, token, name))
             if c.rowcount == 0:
                 c.execute("INSERT INTO staff(name, role, password, login_token) VALUES(?,?,?,?)",
                           (name, role, "pass", token))
             conn.commit()
-        host = request.host.split(":")[0]
-        login_url = f"http://{host}:5000/login/{token}"
-        img = qrcode.make(login_url)
-        buf = io.BytesIO(); img.save(buf, format="PNG"); buf.seek(0)
-        return send_file(buf, mimetype="image/png")
-    with get_connection() as conn:
+        # PNG の描画中に書き込みレーンを握らない
+        release_writer()
+        if old:
+            qr_cache.invalidate_token(old["login_token"])
+        return qrcache.png_response(qrcache.login_url(token), max_age=0)
+    with get_connection(readonly=True) as conn:
         c = conn.cursor()
         c.execute("SELECT name FROM staff ORDER BY id")
         names = [r["name"] for r in c.fetchall()]
     return render_template("generate_qr.html", names=names)
 
-@app.get("/qr/<token>.png")
+@routes.get("/qr/<token>.png")
 @admin_required
 def qr_png(token):
-    host = request.host.split(":")[0]
-    login_url = f"http://{host}:5000/login/{token}"
-    img = qrcode.make(login_url)
-    buf = io.BytesIO(); img.save(buf, format="PNG"); buf.seek(0)
-    return send_file(buf, mimetype="image/png")
+    # スタッフ一覧で全員分を並べるので PNG はキャッシュから返す（?size= は 1〜20）
+    return qrcache.png_response(qrcache.login_url(token), qrcache.size_arg())
 
-@app.get("/login/<token>")
-def login_by_qr(token):
+@routes.post("/admin/badges")
+@admin_required
+def admin_badges():
+    # 選んだスタッフ（all=1 なら全員）の QR バッジを A4 シートにまとめて返す（format=pdf|png）
+    from extras import badges  # qrcode / PIL をここで初めて読む
+    ids = [int(i) for i in request.form.getlist("staff_ids") if i.isdigit()]
+    if not ids and request.form.get("all") != "1":
+        flash("バッジを作るスタッフを選んでください。")
+        return redirect(url_for("staff_list"))
+    fmt = "png" if request.form.get("format") == "png" else "pdf"
     with get_connection() as conn:
+        issued = badges.issue_tokens(conn, ids or None, request.form.get("reissue") == "1")
+    for _name, _role, _token, old_token in issued:
+        qr_cache.invalidate_token(old_token)
+    items = [(name, role, qrcache.login_url(token)) for name, role, token, _old in issued]
+    # 描画中は DB を使わないので接続は先に返す
+    db_pool.release_db()
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if fmt == "pdf":
+        body, mimetype, fname = badges.stream_pdf(items), "application/pdf", f"badges_{ts}.pdf"
+    else:
+        body, mimetype, fname = badges.stream_zip(items), "application/zip", f"badges_{ts}.zip"
+    return Response(body, mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="{fname}"'})
+
+@routes.get("/login/<token>")
+def login_by_qr(token):
+    with get_connection(readonly=True) as conn:
         c = conn.cursor()
         c.execute("SELECT name, role FROM staff WHERE login_token=?", (token,))
         row = c.fetchone()
@@ -331,16 +424,17 @@ def login_by_qr(token):
     return redirect(url_for("home"))
 
 # 利用者
-@app.get("/users")
+@routes.get("/users")
 @admin_required
+@conditional("users")
 def users_page():
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn, fragcache.snapshot(conn, ("users",)) as versions:
         c = conn.cursor()
         c.execute("SELECT id, name, age, gender, room_number, notes FROM users ORDER BY id")
         users = c.fetchall()
-    return render_template("users.html", users=users)
+    return render_template("users.html", users=users, versions=versions)
 
-@app.route("/add_user", methods=["GET","POST"])
+@routes.route("/add_user", methods=["GET","POST"])
 @admin_required
 def add_user():
     if request.method == "POST":
@@ -356,179 +450,542 @@ def add_user():
                 (name, age, gender, room, notes)
             )
             conn.commit()
+        ROSTER.invalidate()
         flash(_("利用者を登録しました。"))
         return redirect(url_for("users_page"))
     return render_template("add_user.html")
 
-@app.get("/delete_user/<int:user_id>")
+@routes.get("/delete_user/<int:user_id>")
 @admin_required
 def delete_user(user_id):
     with get_connection() as conn:
         c = conn.cursor()
         c.execute("DELETE FROM users WHERE id=?", (user_id,))
         conn.commit()
+    ROSTER.invalidate()
     flash(_("利用者を削除しました。"))
     return redirect(url_for("users_page"))
 
+@routes.get("/api/users/<int:user_id>/summary")
+@login_required
+def api_user_summary(user_id):
+    # 日次集計テーブルから読む（records は走査しない）
+    days = max(1, min(request.args.get("days", 30, type=int), 366))
+    with get_connection(readonly=True) as conn:
+        return jsonify(rollup.summary(conn, user_id, days))
+
+@routes.get("/api/users/<int:user_id>/history")
+@login_required
+def api_user_history(user_id):
+    # 利用者の記録をアーカイブ分も含めて新しい順に（?before_id= で続き）
+    limit = max(1, min(request.args.get("limit", 100, type=int), 500))
+    before_id, after_id = cursor_args()
+    with get_connection(readonly=True) as conn:
+        rows, has_more = keyset_fetch(archive.history(conn, DB_PATH), RECORD_SELECT_ALL,
+            ["r.user_id = ?"], [user_id], "r.id", limit, before_id, after_id)
+    return jsonify({"records": rows, **api_cursors(rows, has_more, before_id, after_id)})
+
 # 記録
-@app.get("/records")
+RECORD_SELECT = """
+        SELECT r.id, u.name AS user_name, r.meal, r.medication, r.toilet, r.condition,
+               r.memo, r.staff_name, r.created_at
+          FROM records r JOIN users u ON r.user_id = u.id"""
+# アーカイブ分も含めて読むとき（archive.history を通した読み取り接続で使う）
+RECORD_SELECT_ALL = RECORD_SELECT.replace("FROM records r", "FROM records_all r")
+
+@routes.get("/records")
 @login_required
+@conditional("records", "users")
 def records():
     page = int(request.args.get("page", 1))
     per_page = max(1, min(int(request.args.get("per_page", 20)), 100))
-    with get_connection() as conn:
-        c = conn.cursor()
-        c.execute("SELECT COUNT(*) AS cnt FROM records")
-        total = c.fetchone()["cnt"]
+    before_id, after_id = cursor_args()
+    keyset = before_id is not None or after_id is not None
+    # 一覧の断片キャッシュの版は行と同じ読み取りトランザクションで取る
+    with get_connection(readonly=True) as conn, fragcache.snapshot(conn, ("records", "users")) as versions:
+        total = cached_count(conn, "SELECT COUNT(*) AS cnt FROM records")
         pg = paginate(total, page, per_page)
-        offset = (pg["page"] - 1) * pg["per_page"]
-        c.execute("""
-        SELECT r.id, u.name AS user_name, r.meal, r.medication, r.toilet, r.condition,
-               r.memo, r.staff_name, r.created_at
-          FROM records r JOIN users u ON r.user_id = u.id
-         ORDER BY r.id DESC
-         LIMIT ? OFFSET ?
-        """, (pg["per_page"], offset))
-        rows = c.fetchall()
-    return render_template("records.html", rows=rows, pg=pg)
-
-@app.get("/records/export.csv")
+        offset = 0 if keyset else (pg["page"] - 1) * pg["per_page"]
+        rows, has_more = keyset_fetch(conn, RECORD_SELECT,
+            [], [], "r.id", pg["per_page"], before_id, after_id, offset)
+    pg = paginate(total, page, per_page, rows, before_id, after_id, has_more)
+    return render_template("records.html", rows=rows, pg=pg, versions=versions)
+
+EXPORT_FIELDS = ["id","user_name","meal","medication","toilet","condition","memo","staff_name","created_at"]
+EXPORT_CHUNK = 500
+
+@routes.get("/records/export.csv")
 @admin_required
 def export_records_csv():
-    with get_connection() as conn:
-        c = conn.cursor()
-        c.execute("""
-        SELECT r.id, u.name AS user_name, r.meal, r.medication, r.toilet, r.condition,
-               r.memo, r.staff_name, r.created_at
-          FROM records r JOIN users u ON r.user_id = u.id
-         ORDER BY r.id DESC
-        """)
-        rows = c.fetchall()
-    buf = io.StringIO()
-    writer = csv.DictWriter(buf, fieldnames=[
-        "id","user_name","meal","medication","toilet","condition","memo","staff_name","created_at"
-    ])
-    writer.writeheader()
-    for r in rows: writer.writerow(r)
-    mem = io.BytesIO(buf.getvalue().encode("utf-8-sig"))
+    # ?from=YYYY-MM-DD&to=YYYY-MM-DD&user_id= で絞り込み（いずれも任意）。include_archive=1 でアーカイブ分も
+    where, params = [], []
+    try:
+        d_from = request.args.get("from")
+        d_to = request.args.get("to")
+        if d_from:
+            where.append("r.created_at >= ?"); params.append(date.fromisoformat(d_from).isoformat())
+        if d_to:
+            where.append("r.created_at < date(?, '+1 day')"); params.append(date.fromisoformat(d_to).isoformat())
+    except ValueError:
+        return _("日付の形式が正しくありません。"), 400
+    user_id = request.args.get("user_id", type=int)
+    if user_id is not None:
+        where.append("r.user_id = ?"); params.append(user_id)
+    include_archive = request.args.get("include_archive") == "1"
+    sql = RECORD_SELECT_ALL if include_archive else RECORD_SELECT
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY r.id DESC"
+
+    def generate():
+        # fetchmany で少しずつ読み、書いた分だけ送る（全件をメモリに載せない）
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        yield codecs.BOM_UTF8 + buf.getvalue().encode("utf-8")
+        conn = get_connection(readonly=True)
+        c = (archive.history(conn, DB_PATH) if include_archive else conn).cursor()
+        try:
+            c.execute(sql, params)
+            while True:
+                rows = c.fetchmany(EXPORT_CHUNK)
+                if not rows:
+                    break
+                buf.seek(0); buf.truncate()
+                writer.writerows(rows)
+                yield buf.getvalue().encode("utf-8")
+        finally:
+            c.close()
+
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    return send_file(mem, as_attachment=True,
-                     download_name=f"records_{ts}.csv", mimetype="text/csv")
+    return Response(stream_with_context(generate()), mimetype="text/csv",
+                    headers={"Content-Disposition": f'attachment; filename="records_{ts}.csv"'})
 
-@app.get("/api/records")
+@routes.get("/api/records")
 @login_required
+@conditional("records", "users")
 def api_records():
-    with get_connection() as conn:
-        c = conn.cursor()
-        c.execute("""
-        SELECT r.id, u.name AS user_name, r.meal, r.medication, r.toilet, r.condition,
-               r.memo, r.staff_name, r.created_at
-          FROM records r JOIN users u ON r.user_id = u.id
-         ORDER BY r.id DESC LIMIT 200
-        """)
-        rows = c.fetchall()
-    return jsonify({"records": rows})
+    since = request.args.get("since", type=int)
+    if since is not None:
+        return api_changes("records", RECORD_SELECT, "r.id", since)
+    limit = max(1, min(request.args.get("limit", 200, type=int), 500))
+    before_id, after_id = cursor_args()
+    with get_connection(readonly=True) as conn:
+        seq = changefeed.head(conn)
+        rows, has_more = keyset_fetch(conn, RECORD_SELECT,
+            [], [], "r.id", limit, before_id, after_id)
+    return jsonify({"records": rows, "seq": seq, **api_cursors(rows, has_more, before_id, after_id)})
+
+def api_changes(tbl, select_sql, id_col, since, where=(), params=()):
+    # ?since=<seq> の差分同期：前回以降に追加/更新された行と削除された id だけ返す
+    with get_connection(readonly=True) as conn:
+        feed = changefeed.changes_since(conn, tbl, since)
+        rows = []
+        ids = feed["upserts"]
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i+500]
+            conds = list(where) + [f"{id_col} IN ({','.join('?' * len(chunk))})"]
+            rows += conn.execute(select_sql + " WHERE " + " AND ".join(conds) + f" ORDER BY {id_col} DESC",
+                                 list(params) + chunk).fetchall()
+    return jsonify({tbl: rows, "deleted": feed["deletes"], "seq": feed["seq"],
+                    "reset": feed["reset"], "more": feed["more"]})
+
+def api_cursors(rows, has_more, before_id, after_id):
+    # next_cursor → ?before_id=（古い方へ） / prev_cursor → ?after_id=（新しい方へ）
+    older = has_more if after_id is None else True
+    newer = (before_id is not None) if after_id is None else has_more
+    return {
+        "next_cursor": rows[-1]["id"] if rows and older else None,
+        "prev_cursor": rows[0]["id"] if rows and newer else None,
+    }
 
-@app.route("/add_record", methods=["GET","POST"])
+RECORD_INSERT = """
+    INSERT INTO records(user_id, meal, medication, toilet, condition, memo, staff_name)
+    VALUES(?,?,?,?,?,?,?)
+"""
+BATCH_MAX = 200
+
+def insert_records(items, staff_name):
+    # 複数行をまとめて検証し、1 トランザクションの executemany で入れる。行ごとの結果を返す
+    results, good = [None] * len(items), []
+    ids = set()
+    for it in items:
+        try:
+            ids.add(int(it.get("user_id")))
+        except (AttributeError, TypeError, ValueError):
+            pass
+    # user_id の存在確認は名簿キャッシュで（名簿に無い id だけ DB を見る）
+    known = ROSTER.known(ids)
+    for i, it in enumerate(items):
+        if not isinstance(it, dict):
+            results[i] = {"index": i, "ok": False, "error": "invalid row"}
+            continue
+        try:
+            user_id = int(it.get("user_id"))
+        except (TypeError, ValueError):
+            results[i] = {"index": i, "ok": False, "error": "user_id required"}
+            continue
+        if user_id not in known:
+            results[i] = {"index": i, "ok": False, "error": "unknown user_id", "user_id": user_id}
+            continue
+        good.append((i, (user_id, it.get("meal"), it.get("medication"), it.get("toilet"),
+                         it.get("condition"), it.get("memo"), staff_name)))
+    if good:
+        def _insert(w):
+            c = w.cursor()
+            c.row_factory = None
+            c.executemany(RECORD_INSERT, [p for _, p in good])
+            # 書き込みロック中の AUTOINCREMENT なので id は連番になる
+            return c.execute("SELECT last_insert_rowid()").fetchone()[0]
+        last = run_write(_insert)
+        first = last - len(good) + 1
+        for k, (i, p) in enumerate(good):
+            results[i] = {"index": i, "ok": True, "id": first + k, "user_id": p[0]}
+    return results
+
+@routes.post("/api/records/batch")
+@login_required
+def api_records_batch():
+    # JSON 配列（または {"records": [...]}）で複数記録を一括登録
+    items = request.get_json(silent=True)
+    if isinstance(items, dict):
+        items = items.get("records")
+    if not isinstance(items, list) or not items:
+        return {"ok": False, "error": "JSON array required"}, 400
+    if len(items) > BATCH_MAX:
+        return {"ok": False, "error": f"too many rows (max {BATCH_MAX})"}, 413
+    results = insert_records(items, session.get("staff_name"))
+    inserted = sum(1 for r in results if r["ok"])
+    return jsonify({"ok": inserted == len(results), "inserted": inserted,
+                    "failed": len(results) - inserted, "results": results})
+
+@routes.route("/add_record", methods=["GET","POST"])
 @login_required
 def add_record():
-    with get_connection() as conn:
-        c = conn.cursor()
-        c.execute("SELECT id, name FROM users ORDER BY id")
-        users = c.fetchall()
     if request.method == "POST":
-        user_id    = request.form.get("user_id")
+        user_ids = request.form.getlist("user_ids")
+        if user_ids:
+            # 一括入力：選んだ利用者全員に同じ内容で記録
+            fields = {k: request.form.get(k) for k in ("meal", "medication", "toilet", "condition", "memo")}
+            results = insert_records([dict(fields, user_id=u) for u in user_ids], session.get("staff_name"))
+            ok = sum(1 for r in results if r["ok"])
+            flash(_("%(n)s 件の記録を保存しました。", n=ok))
+            if ok < len(results):
+                flash(_("%(n)s 件は保存できませんでした。", n=len(results) - ok))
+            return redirect(url_for("records"))
+        user_id    = request.form.get("user_id", type=int)
+        if user_id is None or not ROSTER.known({user_id}):
+            flash(_("利用者が見つかりません。"))
+            return redirect(url_for("add_record"))
         meal       = request.form.get("meal")
         medication = request.form.get("medication")
         toilet     = request.form.get("toilet")
         condition  = request.form.get("condition")
         memo       = request.form.get("memo")
         staff_name = session.get("staff_name")
-        with get_connection() as conn:
-            c = conn.cursor()
-            c.execute("""
-                INSERT INTO records(user_id, meal, medication, toilet, condition, memo, staff_name)
-                VALUES(?,?,?,?,?,?,?)
-            """, (user_id, meal, medication, toilet, condition, memo, staff_name))
-            conn.commit()
+        run_write(lambda w: w.execute(
+            RECORD_INSERT, (user_id, meal, medication, toilet, condition, memo, staff_name)).lastrowid)
         flash(_("記録を保存しました。"))
         return redirect(url_for("records"))
-    return render_template("add_record.html", users=users)
+    # 選択肢の断片は名簿を読んだときの版で引く（DB の最新版だと名簿の確認間隔ぶん古い HTML が残る）
+    users, versions = ROSTER.snapshot()
+    if request.args.get("batch"):
+        return render_template("add_record_batch.html", users=users, versions=versions)
+    return render_template("add_record.html", users=users, versions=versions)
 
 # 引継ぎ
-@app.route("/handover", methods=["GET","POST"])
+def handover_date():
+    # ?date= が無ければ今日（日付が変わったら別の内容として ETag も変わる）
+    return request.args.get("date") or date.today().isoformat()
+
+def handover_cache_control():
+    # 過去日の引継ぎは締まっているので長めにキャッシュさせる
+    d = request.args.get("date")
+    if d and d < date.today().isoformat():
+        return "private, max-age=86400"
+    return None
+
+HANDOVER_SELECT = sse.HANDOVER_SELECT
+
+@routes.route("/handover", methods=["GET","POST"])
 @login_required
+@conditional("handover", cache_control=handover_cache_control, vary=handover_date)
 def handover():
     if request.method == "POST":
         h_date = request.form.get("h_date") or date.today().isoformat()
         shift  = request.form.get("shift") or "day"
         note   = request.form.get("note") or ""
         staff  = session.get("staff_name") or ""
-        with get_connection() as conn:
-            c = conn.cursor()
-            c.execute("INSERT INTO handover(h_date, shift, note, staff) VALUES(?,?,?,?)",
-                      (h_date, shift, note, staff))
-            conn.commit()
+        new_id = run_write(lambda w: w.execute(
+            "INSERT INTO handover(h_date, shift, note, staff) VALUES(?,?,?,?)",
+            (h_date, shift, note, staff)).lastrowid)
+        with get_connection(readonly=True) as conn:
+            sse.publish_handover(conn, new_id)
         flash(_("引継ぎを追加しました。"))
         return redirect(url_for("handover"))
-    h_date = request.args.get("date") or date.today().isoformat()
+    h_date = handover_date()
     page = int(request.args.get("page", 1))
     per_page = max(1, min(int(request.args.get("per_page", 50)), 200))
-    with get_connection() as conn:
-        c = conn.cursor()
-        c.execute("SELECT COUNT(*) AS cnt FROM handover WHERE h_date=?", (h_date,))
-        total = c.fetchone()["cnt"]
+    before_id, after_id = cursor_args()
+    keyset = before_id is not None or after_id is not None
+    with get_connection(readonly=True) as conn, fragcache.snapshot(conn, ("handover",)) as versions:
+        total = cached_count(conn, "SELECT COUNT(*) AS cnt FROM handover WHERE h_date=?", (h_date,))
         pg = paginate(total, page, per_page)
-        offset = (pg["page"] - 1) * pg["per_page"]
-        c.execute("""
-        SELECT id, h_date, shift, note, staff, created_at
-          FROM handover
-         WHERE h_date = ?
-         ORDER BY id DESC
-         LIMIT ? OFFSET ?
-        """, (h_date, pg["per_page"], offset))
-        rows = c.fetchall()
-    return render_template("handover.html", rows=rows, today=h_date, pg=pg)
-
-@app.get("/api/handover")
+        offset = 0 if keyset else (pg["page"] - 1) * pg["per_page"]
+        rows, has_more = keyset_fetch(conn, HANDOVER_SELECT,
+            ["h_date = ?"], [h_date], "id", pg["per_page"], before_id, after_id, offset)
+    pg = paginate(total, page, per_page, rows, before_id, after_id, has_more)
+    return render_template("handover.html", rows=rows, today=h_date, pg=pg, versions=versions)
+
+@routes.get("/api/handover")
 @login_required
+@conditional("handover", cache_control=handover_cache_control, vary=handover_date)
 def api_handover():
+    h_date = handover_date()
+    since = request.args.get("since", type=int)
+    if since is not None:
+        return api_changes("handover", HANDOVER_SELECT, "id", since, ["h_date = ?"], [h_date])
+    limit = max(1, min(request.args.get("limit", 300, type=int), 500))
+    before_id, after_id = cursor_args()
+    with get_connection(readonly=True) as conn:
+        seq = changefeed.head(conn)
+        rows, has_more = keyset_fetch(conn, HANDOVER_SELECT,
+            ["h_date = ?"], [h_date], "id", limit, before_id, after_id)
+    return jsonify({"handover": rows, "seq": seq, **api_cursors(rows, has_more, before_id, after_id)})
+
+@routes.get("/api/handover/stream")
+@login_required
+def api_handover_stream():
+    # 新しい引継ぎを SSE で配信（?date=&shift=、再接続は Last-Event-ID）
     h_date = request.args.get("date") or date.today().isoformat()
-    with get_connection() as conn:
-        c = conn.cursor()
-        c.execute("""
-        SELECT id, h_date, shift, note, staff, created_at
-          FROM handover
-         WHERE h_date = ?
-         ORDER BY id DESC
-         LIMIT 300
-        """, (h_date,))
-        rows = c.fetchall()
-    return jsonify({"handover": rows})
+    shift = request.args.get("shift") or None
+    last_id = request.headers.get("Last-Event-ID", type=int)
+    if last_id is None:
+        last_id = request.args.get("last_id", type=int)
+    events = sse.handover_events
+    try:
+        q = events.subscribe()
+    except sse.TooManySubscribers:
+        return {"ok": False, "error": "too many subscribers"}, 503, {"Retry-After": "10"}
+    initial = []
+    if last_id is not None:
+        initial = events.replay(last_id)
+        if initial is None:
+            # バッファより古い → DB から 1 回だけ取り直す
+            with get_connection(readonly=True) as conn:
+                rows = conn.execute(HANDOVER_SELECT + " WHERE h_date=? AND id>? ORDER BY id",
+                                    (h_date, last_id)).fetchall()
+            initial = [(r["id"], r, {"date": r["h_date"], "shift": r["shift"]}) for r in rows]
+    # 長時間つなぎっぱなしになるので接続はここでプールに返す
+    db_pool.release_db()
+
+    def match(attrs):
+        return attrs.get("date") == h_date and (shift is None or attrs.get("shift") == shift)
+
+    return Response(stream_with_context(sse.stream(events, q, match, initial, "handover", last_id)),
+                    mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# 検索
+def run_search():
+    # /search と /api/search 共通：?q=&kind=records|handover&user_id=&staff=&from=&to=&page=
+    kind = "handover" if request.args.get("kind") == "handover" else "records"
+    q = (request.args.get("q") or "").strip()
+    page = max(1, request.args.get("page", 1, type=int))
+    per_page = max(1, min(request.args.get("per_page", 20, type=int), 100))
+    f = {
+        "user_id": request.args.get("user_id", type=int),
+        "staff": (request.args.get("staff") or "").strip() or None,
+        "date_from": request.args.get("from") or None,
+        "date_to": request.args.get("to") or None,
+    }
+    rows, has_more = [], False
+    if q:
+        with get_connection(readonly=True) as conn:
+            rows, has_more = search.search(conn, kind, q, limit=per_page,
+                                           offset=(page - 1) * per_page, **f)
+    pg = {"page": page, "per_page": per_page, "has_prev": page > 1, "has_next": has_more,
+          "prev_page": page - 1 if page > 1 else None, "next_page": page + 1 if has_more else None}
+    return kind, q, f, rows, pg
+
+@routes.get("/search")
+@login_required
+def search_page():
+    kind, q, f, rows, pg = run_search()
+    return render_template("search.html", kind=kind, q=q, f=f, rows=rows, pg=pg, users=ROSTER.get())
+
+@routes.get("/api/search")
+@login_required
+def api_search():
+    kind, q, f, rows, pg = run_search()
+    return jsonify({"kind": kind, "q": q, "results": rows, "page": pg["page"], "has_next": pg["has_next"]})
 
 # 雑多
-@app.get("/favicon.ico")
+@routes.get("/favicon.ico")
 def favicon():
-    ico = os.path.join(app.root_path, "static", "favicon.ico")
+    ico = os.path.join(current_app.root_path, "static", "favicon.ico")
     if os.path.exists(ico):
-        return send_from_directory(os.path.join(app.root_path, "static"), "favicon.ico", mimetype="image/vnd.microsoft.icon")
+        return send_from_directory(os.path.join(current_app.root_path, "static"), "favicon.ico", mimetype="image/vnd.microsoft.icon")
     return ("", 204)
 
-@app.get("/healthz")
+@routes.get("/healthz")
 def healthz():
     try:
-        with get_connection() as conn:
+        with get_connection(readonly=True) as conn:
             conn.execute("SELECT 1").fetchone()
-        return {"ok": True, "db": "up", "time": datetime.now().isoformat()}
+            maint = maintenance.stats(conn, DB_PATH)
+        return {"ok": True, "db": "up", "time": datetime.now().isoformat(),
+                "pool": {"write": DB_POOL.stats(), "read": DB_READ_POOL.stats()},
+                "write_queue": WRITE_QUEUE.stats() if WRITE_QUEUE is not None else None,
+                "maintenance": maint,
+                "qr_cache": qr_cache.stats(), "fragment_cache": fragcache.frag_cache.stats(),
+                "roster": ROSTER.stats(), "startup": current_app.extensions.get("startup")}
     except Exception as e:
         return {"ok": False, "db": "down", "error": str(e)}, 500
 
-@app.errorhandler(404)
+@routes.get("/metrics")
+def metrics_page():
+    # Prometheus 形式。管理者か METRICS_TOKEN / METRICS_ALLOW で許可したものだけ（extras/metrics.py）
+    if not metrics.allowed(session):
+        return _("管理者権限が必要です。"), 403
+    extra = {}
+    for lane, p in (("write", DB_POOL), ("read", DB_READ_POOL)):
+        st = p.stats()
+        extra[f"db_pool_{lane}_in_use"] = st["in_use"]
+        extra[f"db_pool_{lane}_waits_total"] = st["waits"]
+    if WRITE_QUEUE is not None:
+        extra["write_queue_depth"] = WRITE_QUEUE.stats()["depth"]
+    return Response(metrics.render(extra), mimetype="text/plain; version=0.0.4")
+
+@routes.errorhandler(writequeue.QueueFull)
+@routes.errorhandler(writequeue.WriteTimeout)
+def write_queue_full(e):
+    # 書き込みキューが詰まっている・書き込みスレッドが返事をしない → 少し待って再送してもらう
+    current_app.logger.warning("write queue: %s: %s", type(e).__name__, e)
+    return _("混み合っています。しばらくしてから再度お試しください。"), 503, {"Retry-After": "2"}
+
+@routes.errorhandler(404)
 def not_found(e):
     try:
         return render_template("404.html"), 404
     except Exception:
         return "Not Found", 404
 
+# ===== アプリの組み立て =====
+# 追加で載せられる extras の Blueprint（名前: (モジュール, 変数名, 既定の url_prefix)）。選んだものだけ import する
+# 多くは本体と同じ URL を持つので、並べて載せるときは url_prefix を付ける（例 BLUEPRINTS="records:/v2,lang"）
+BLUEPRINTS = {
+    "auth":        ("extras.auth", "auth_bp", None),
+    "records":     ("extras.records_bp", "records_bp", None),
+    "users":       ("extras.users_bp", "users_bp", None),
+    "handover":    ("extras.handover_bp", "handover_bp", None),
+    "staff_admin": ("extras.staff_admin", "staff_admin_bp", "/admin/staff"),
+    "staff_legacy": ("extras.staff_amin", "staff_admin_bp", None),
+    "lang":        ("extras.i18n_routes", "lang_bp", "/i18n"),
+}
+
+def parse_blueprints(spec):
+    # "records:/v2,lang" / ["records", ("lang", "/i18n")] / {"records": "/v2"} → [(名前, url_prefix), ...]
+    if not spec:
+        return []
+    if isinstance(spec, str):
+        spec = [s.strip() for s in spec.split(",") if s.strip()]
+    items = spec.items() if isinstance(spec, dict) else spec
+    out = []
+    for item in items:
+        if isinstance(item, str):
+            name, _sep, prefix = item.partition(":")
+            item = (name, prefix or None)
+        name, prefix = item
+        if name not in BLUEPRINTS:
+            raise ValueError(f"unknown blueprint: {name} (choices: {', '.join(BLUEPRINTS)})")
+        out.append((name, prefix))
+    return out
+
+def register_blueprints(app, spec):
+    for name, prefix in parse_blueprints(spec):
+        module, attr, default_prefix = BLUEPRINTS[name]
+        bp = getattr(importlib.import_module(module), attr)
+        app.register_blueprint(bp, url_prefix=prefix or default_prefix)
+        print(f"[app] blueprint {name} at {prefix or default_prefix or '/'}")
+
+
+class StartupTimer:
+    # 起動の段階ごとの所要時間（秒）
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.steps = {"import": IMPORT_SECONDS}
+
+    def step(self, name, fn, *a, **kw):
+        t = time.perf_counter()
+        try:
+            return fn(*a, **kw)
+        finally:
+            self.steps[name] = self.steps.get(name, 0.0) + time.perf_counter() - t
+
+    def report(self):
+        total = time.perf_counter() - self.t0 + IMPORT_SECONDS
+        return {"total": round(total, 4), "steps": {k: round(v, 4) for k, v in self.steps.items()}}
+
+
+def _init_babel(app):
+    # flask_babel は読み込みが重く、翻訳は extras.translations で足りているので BABEL=1 のときだけ
+    from flask_babel import Babel
+    Babel(app, locale_selector=get_locale)
+
+def _env_flag(name, default="0"):
+    return os.environ.get(name, default).lower() in ("1", "true", "on")
+
+def create_app(config=None):
+    # config（dict）で DB_PATH / SECRET_KEY / BLUEPRINTS / BABEL / MAINTENANCE を上書きできる（省略時は環境変数）
+    timer = StartupTimer()
+    cfg = {
+        "DB_PATH": DB_PATH,
+        "SECRET_KEY": APP_SECRET,
+        "BLUEPRINTS": os.environ.get("BLUEPRINTS") or "",
+        "BABEL": _env_flag("BABEL"),
+        # WAL チェックポイント・optimize・夜間の vacuum / アーカイブ移動（MAINT_INTERVAL=0 でも無効）
+        "MAINTENANCE": _env_flag("MAINTENANCE", "1"),
+        "BABEL_DEFAULT_LOCALE": "ja",
+        "BABEL_DEFAULT_TIMEZONE": "Asia/Tokyo",
+        "LANGUAGES": translations.LANGUAGES,
+    }
+    cfg.update(config or {})
+
+    app = Flask(__name__)
+    app.config.update(cfg)
+
+    timer.step("db", bind_db, cfg["DB_PATH"])
+    timer.step("db", init_db)
+    # 翻訳・HTML 断片キャッシュ・接続の返却・/metrics・SQL プロファイラ（SQL_PROFILE=1 か管理画面で有効化）
+    timer.step("translations", translations.init_app, app, DB_PATH)
+    for ext in (fragcache, db_pool, metrics, profiler):
+        timer.step("extensions", ext.init_app, app)
+    if cfg["BABEL"]:
+        timer.step("babel", _init_babel, app)
+    timer.step("routes", routes.register, app)
+    timer.step("blueprints", register_blueprints, app, cfg["BLUEPRINTS"])
+    if cfg["MAINTENANCE"]:
+        timer.step("maintenance", maintenance.start, DB_PATH)
+
+    app.extensions["startup"] = report = timer.report()
+    print(f"[app] started in {report['total'] * 1000:.0f}ms (" +
+          ", ".join(f"{k} {v * 1000:.0f}ms" for k, v in report["steps"].items()) + ")")
+    return app
+
+
+# `from app import app`・`flask --app app`・`gunicorn app:app` 用。初めて参照されたときに組み立てる
+_app = None
+_app_lock = threading.Lock()
+
+def __getattr__(name):
+    global _app
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _app_lock:
+        if _app is None:
+            _app = create_app()
+    return _app
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    create_app().run(host="0.0.0.0", port=5000, debug=True)
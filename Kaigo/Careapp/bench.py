@@ -0,0 +1,285 @@
+# bench.py
+# 主要画面の負荷試験（/records の深いページ、/api/records、CSV 出力、/add_record の連続投稿、/handover）
+# Flask のテストクライアント（--url なし）か、起動中のサーバーへの HTTP（--url あり）で並列に叩き、
+# シナリオごとに p50/p95/p99 とスループットを出す。結果は JSON に残し、--compare で前回と比べる
+import os, sys, argparse, json, random, subprocess, textwrap, threading, time
+import http.cookiejar, urllib.error, urllib.parse, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.environ.get("DB_PATH") or os.path.join(APP_ROOT, "care.db")
+DEFAULT_OUT = os.path.join(APP_ROOT, "bench_results")
+SCENARIOS = ["records_page", "records_cursor", "api_records", "export_csv", "add_record", "handover"]
+# --compare で悪化とみなす割合（%）
+THRESHOLD = 10.0
+
+
+# ===== 対象データ =====
+def load_context(db_path):
+    # シナリオが使う id・日付の範囲を DB から読む（サーバーと同じ DB を指定する）
+    import sqlite3
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        n, lo, hi = conn.execute("SELECT COUNT(*), MIN(id), MAX(id) FROM records").fetchone()
+        users = [r[0] for r in conn.execute("SELECT id FROM users ORDER BY id")]
+        d_lo, d_hi = conn.execute("SELECT MIN(h_date), MAX(h_date) FROM handover").fetchone()
+        c_lo, c_hi = conn.execute("SELECT MIN(created_at), MAX(created_at) FROM records").fetchone()
+    finally:
+        conn.close()
+    if not n or not users:
+        raise SystemExit("[ERROR] 記録がありません。先に seed_data.py でデータを入れてください。")
+    today = date.today().isoformat()
+    return {"records": n, "min_id": lo, "max_id": hi, "users": users,
+            "h_from": d_lo or today, "h_to": d_hi or today,
+            "c_from": (c_lo or today)[:10], "c_to": (c_hi or today)[:10]}
+
+def _day(rng, lo, hi):
+    a, b = date.fromisoformat(lo), date.fromisoformat(hi)
+    return (a + timedelta(days=rng.randint(0, max(0, (b - a).days)))).isoformat()
+
+
+# ===== シナリオ（1 回分の (method, path, form) を返す） =====
+def make_request(name, rng, ctx, per_page=20):
+    if name == "records_page":
+        # ページ番号で後ろの方（OFFSET が大きい）を開く
+        last = max(1, ctx["records"] // per_page)
+        return "GET", f"/records?page={rng.randint(max(1, last * 9 // 10), last)}&per_page={per_page}", None
+    if name == "records_cursor":
+        # 同じ深さをキーセット（before_id）で開く
+        return "GET", f"/records?before_id={rng.randint(ctx['min_id'], ctx['max_id'])}&per_page={per_page}", None
+    if name == "api_records":
+        return "GET", f"/api/records?limit=200&before_id={rng.randint(ctx['min_id'], ctx['max_id'])}", None
+    if name == "export_csv":
+        # 30 日分
+        d = _day(rng, ctx["c_from"], ctx["c_to"])
+        to = (date.fromisoformat(d) + timedelta(days=30)).isoformat()
+        return "GET", f"/records/export.csv?from={d}&to={to}", None
+    if name == "add_record":
+        from extras.i18n import T
+        ja = T["ja"]
+        return "POST", "/add_record", {
+            "user_id": rng.choice(ctx["users"]), "meal": rng.choice(ja["meal_choices"]),
+            "medication": rng.choice(ja["med_choices"]), "toilet": rng.choice(ja["toilet_choices"]),
+            "condition": rng.choice(ja["cond_choices"]), "memo": "bench"}
+    if name == "handover":
+        return "GET", f"/handover?date={_day(rng, ctx['h_from'], ctx['h_to'])}", None
+    raise ValueError(name)
+
+
+# ===== ドライバ =====
+class ClientDriver:
+    # Flask のテストクライアント（同じプロセス内。ネットワークとサーバーの分は含まない）
+    def __init__(self, db_path, user):
+        os.environ["DB_PATH"] = db_path
+        sys.path.insert(0, APP_ROOT)
+        from app import app
+        self.app, self.user = app, user
+        self._local = threading.local()
+
+    def _client(self):
+        c = getattr(self._local, "client", None)
+        if c is None:
+            c = self._local.client = self.app.test_client()
+            with c.session_transaction() as s:
+                s["staff_name"], s["staff_role"] = self.user, "admin"
+        return c
+
+    def send(self, method, path, form):
+        r = self._client().open(path, method=method, data=form)
+        body = r.get_data()  # CSV などのストリームも最後まで読む
+        r.close()
+        return r.status_code, len(body)
+
+
+class HttpDriver:
+    # 起動中のサーバーへ urllib で投げる（スレッドごとにログイン済みの Cookie を持つ）
+    def __init__(self, base_url, user, password, timeout=60):
+        self.base = base_url.rstrip("/")
+        self.user, self.password, self.timeout = user, password, timeout
+        self._local = threading.local()
+
+    def _opener(self):
+        o = getattr(self._local, "opener", None)
+        if o is None:
+            o = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+                                            _NoRedirect())
+            data = urllib.parse.urlencode({"name": self.user, "password": self.password}).encode()
+            try:
+                o.open(self.base + "/staff_login", data, timeout=self.timeout).read()
+                ok = False  # 200 はログイン画面の再表示（失敗）
+            except urllib.error.HTTPError as e:
+                ok = e.code == 302
+            if not ok:
+                raise RuntimeError(f"ログインできません: {self.user}")
+            self._local.opener = o
+        return o
+
+    def send(self, method, path, form):
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        req = urllib.request.Request(self.base + path, data=data, method=method)
+        try:
+            with self._opener().open(req, timeout=self.timeout) as r:
+                return r.status, len(r.read())
+        except urllib.error.HTTPError as e:
+            return e.code, len(e.read() or b"")
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # 投稿後の 302 はそのまま結果として数える（リダイレクト先の画面までは測らない）
+    def redirect_request(self, *a, **kw):
+        return None
+
+
+# ===== 計測 =====
+def percentile(values, p):
+    if not values:
+        return None
+    s = sorted(values)
+    k = (len(s) - 1) * p / 100
+    f = int(k)
+    c = min(f + 1, len(s) - 1)
+    return s[f] + (s[c] - s[f]) * (k - f)
+
+def run_scenario(driver, name, ctx, requests, concurrency, seed, warmup=0):
+    # 乱数はワーカーごとに seed から作る（同じ引数なら同じ URL 列）
+    def worker(i, n):
+        rng = random.Random(f"{seed}:{name}:{i}")
+        lat, errors, size = [], 0, 0
+        for j in range(n):
+            method, path, form = make_request(name, rng, ctx)
+            t0 = time.perf_counter()
+            try:
+                status, nbytes = driver.send(method, path, form)
+            except Exception as e:
+                status, nbytes = None, 0
+                print(f"[bench] {name}: {e}")
+            dt = time.perf_counter() - t0
+            if j < warmup:
+                continue
+            if status is None or status >= 400:
+                errors += 1
+            lat.append(dt)
+            size += nbytes
+        return lat, errors, size
+
+    per = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        parts = list(ex.map(lambda a: worker(*a), [(i, n + warmup) for i, n in enumerate(per)]))
+    wall = time.perf_counter() - t0
+    lat = [x for p in parts for x in p[0]]
+    ms = [x * 1000 for x in lat]
+    return {"requests": len(lat), "errors": sum(p[1] for p in parts), "bytes": sum(p[2] for p in parts),
+            "concurrency": concurrency, "seconds": round(wall, 3),
+            "rps": round(len(lat) / wall, 2) if wall else None,
+            "mean_ms": round(sum(ms) / len(ms), 2) if ms else None,
+            **{f"p{p}_ms": round(percentile(ms, p), 2) if ms else None for p in (50, 95, 99)},
+            "max_ms": round(max(ms), 2) if ms else None}
+
+
+# ===== 比較 =====
+METRICS = [("p50_ms", 1), ("p95_ms", 1), ("p99_ms", 1), ("rps", -1)]
+
+def compare(current, baseline, threshold=THRESHOLD):
+    # 悪化（遅延は増加、rps は減少）が threshold % を超えたものを返す
+    regressions = []
+    for key in ("driver", "concurrency", "requests"):
+        if baseline.get(key) != current.get(key):
+            print(f"[INFO] 前回と {key} が違います: {baseline.get(key)} -> {current.get(key)}")
+    print(f"\n{'scenario':16} {'metric':8} {'base':>10} {'now':>10} {'diff':>8}")
+    for name, now in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        for key, sign in METRICS:
+            a, b = base.get(key), now.get(key)
+            if not a or b is None:
+                continue
+            diff = (b - a) / a * 100
+            bad = diff * sign > threshold
+            print(f"{name:16} {key:8} {a:>10} {b:>10} {diff:>+7.1f}%{'  <-- 悪化' if bad else ''}")
+            if bad:
+                regressions.append({"scenario": name, "metric": key, "base": a, "now": b, "diff": round(diff, 1)})
+    return regressions
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_ROOT,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    p = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=textwrap.dedent(
+            f"""\
+            主要画面の負荷試験。結果は --out に JSON で保存します。
+            例:  python seed_data.py --db bench.db --years 2
+                 python bench.py --db bench.db
+                 python bench.py --db bench.db --url http://127.0.0.1:5000 -c 16
+                 python bench.py --db bench.db --compare bench_results/前回.json
+            シナリオ: {', '.join(SCENARIOS)}
+            """))
+    p.add_argument("--db", default=DEFAULT_DB, help=f"DBパス（既定: {DEFAULT_DB}）。--url のときはサーバーと同じ DB を指定")
+    p.add_argument("--url", help="起動中のサーバー（例 http://127.0.0.1:5000）。省略時はテストクライアント")
+    p.add_argument("--user", default="admin", help="ログインするスタッフ名（既定: admin）")
+    p.add_argument("--password", default="admin", help="--url のときのパスワード（既定: admin）")
+    p.add_argument("--scenarios", default=",".join(SCENARIOS), help="カンマ区切り（既定: 全部）")
+    p.add_argument("-n", "--requests", type=int, default=200, help="シナリオごとのリクエスト数（既定: 200）")
+    p.add_argument("-c", "--concurrency", type=int, default=4, help="並列数（既定: 4）")
+    p.add_argument("--warmup", type=int, default=2, help="ワーカーごとの捨てリクエスト数（既定: 2）")
+    p.add_argument("--seed", type=int, default=42, help="乱数シード（既定: 42）")
+    p.add_argument("--out", default=DEFAULT_OUT, help=f"結果の保存先（既定: {DEFAULT_OUT}）")
+    p.add_argument("--label", default="", help="結果に付けるメモ")
+    p.add_argument("--compare", help="比べる前回の結果 JSON")
+    p.add_argument("--threshold", type=float, default=THRESHOLD, help=f"悪化とみなす割合 %%（既定: {THRESHOLD}）")
+    p.add_argument("--yes", "-y", action="store_true", help="既定の care.db にも確認なしで add_record を書き込む")
+    args = p.parse_args()
+
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in names if s not in SCENARIOS]
+    if unknown:
+        print(f"[ERROR] 不明なシナリオ: {', '.join(unknown)}")
+        sys.exit(2)
+    db_path = os.path.abspath(args.db)
+    if not os.path.exists(db_path):
+        print(f"[ERROR] DBが見つかりません: {db_path}")
+        sys.exit(2)
+    if "add_record" in names and db_path == os.path.abspath(os.path.join(APP_ROOT, "care.db")) and not args.yes:
+        print("[ERROR] add_record は記録を書き込みます（memo='bench'）。本番の care.db では実行しません。"
+              "--db で別のファイルを指定するか、--scenarios から add_record を外してください（強行は --yes）。")
+        sys.exit(1)
+
+    ctx = load_context(db_path)
+    print(f"[INFO] DB: {db_path} records={ctx['records']} residents={len(ctx['users'])}")
+    driver = HttpDriver(args.url, args.user, args.password) if args.url else ClientDriver(db_path, args.user)
+    result = {"at": datetime.now().isoformat(timespec="seconds"), "git": _git_rev(), "label": args.label,
+              "driver": "http" if args.url else "client", "url": args.url,
+              "db": {"path": db_path, "records": ctx["records"], "residents": len(ctx["users"])},
+              "requests": args.requests, "concurrency": args.concurrency, "seed": args.seed, "scenarios": {}}
+
+    print(f"\n{'scenario':16} {'n':>6} {'err':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8}")
+    for name in names:
+        r = run_scenario(driver, name, ctx, args.requests, args.concurrency, args.seed, args.warmup)
+        result["scenarios"][name] = r
+        print(f"{name:16} {r['requests']:>6} {r['errors']:>5} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+              f"{r['p99_ms']:>8} {r['rps']:>8}")
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"bench_{datetime.now():%Y%m%d_%H%M%S}.json")
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        result["compared_to"], result["regressions"] = args.compare, regressions
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n[OK] 保存しました: {path}")
+    if regressions:
+        print(f"[ERROR] {len(regressions)} 件の悪化（> {args.threshold}%）")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# extras/archive.py
+# 古い記録・引継ぎを別ファイルのアーカイブ DB に移す（ATTACH して参照も可能）
+from __future__ import annotations
+import argparse, os, time
+from datetime import datetime
+from urllib.parse import quote
+
+from extras import pool as db_pool
+from extras import rollup
+
+# 保持期間（日）。これより古い行をアーカイブへ移す
+RETENTION_DAYS = int(os.environ.get("ARCHIVE_DAYS") or 365)
+BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH") or 500)
+# バッチ間の休み（秒）。この間に日中の書き込みが割り込める
+PAUSE = float(os.environ.get("ARCHIVE_PAUSE") or 0.2)
+# 定期実行の間隔（秒、0 で無効）と実行してよい時間帯（"1-5" なら 1:00〜5:59）。実行は extras/maintenance
+INTERVAL = int(os.environ.get("ARCHIVE_INTERVAL") or 0)
+HOURS = os.environ.get("ARCHIVE_HOURS") or "1-5"
+ALIAS = "archive"
+
+# テーブルごとの「古さ」の判定列（先にあるものを使う）
+AGE_COLUMNS = {
+    "records": ("created_at",),
+    "handover": ("h_date", "on_date", "created_at"),
+}
+
+last_run: dict = {}
+
+
+def archive_path(db_path):
+    # 既定は本体と同じ場所の <名前>_archive.db
+    return os.environ.get("ARCHIVE_PATH") or os.path.splitext(db_path)[0] + "_archive.db"
+
+def _columns(conn, table, schema="main"):
+    rows = conn.execute("SELECT name FROM pragma_table_info(?, ?)", (table, schema)).fetchall()
+    return [r["name"] if isinstance(r, dict) else r[0] for r in rows]
+
+def _first(row):
+    return (tuple(row.values()) if isinstance(row, dict) else tuple(row))[0]
+
+def attach(conn, path, readonly=False):
+    # conn に ALIAS 名で ATTACH する。readonly はファイルが無ければ False を返す
+    if readonly:
+        if not os.path.exists(path):
+            return False
+        conn.execute("ATTACH DATABASE ? AS " + ALIAS, (f"file:{quote(os.path.abspath(path))}?mode=ro",))
+    else:
+        conn.execute("ATTACH DATABASE ? AS " + ALIAS, (path,))
+    return True
+
+def install(conn, tables=tuple(AGE_COLUMNS)):
+    # アーカイブ側のテーブルは本体の列をそのまま写し、archived_at を足す。本体の列追加にも追従
+    for t in tables:
+        cols = _columns(conn, t)
+        have = _columns(conn, t, ALIAS)
+        if not have:
+            conn.execute(f"CREATE TABLE {ALIAS}.{t} AS SELECT * FROM main.{t} WHERE 0")
+            conn.execute(f"ALTER TABLE {ALIAS}.{t} ADD COLUMN archived_at TEXT")
+        else:
+            for c in cols:
+                if c not in have:
+                    conn.execute(f'ALTER TABLE {ALIAS}.{t} ADD COLUMN "{c}"')
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {ALIAS}.idx_{t}_id ON {t}(id)")
+    if "records" in tables:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {ALIAS}.idx_records_user ON records(user_id, id)")
+
+def _age_column(conn, table):
+    cols = _columns(conn, table)
+    return next((c for c in AGE_COLUMNS[table] if c in cols), None)
+
+def _cutoff(col, days):
+    # created_at は日時、h_date / on_date は日付の文字列
+    fn = "datetime" if col == "created_at" else "date"
+    return f"{col} < {fn}('now', '-{int(days)} days')"
+
+def move_batch(conn, table, days=RETENTION_DAYS, batch=BATCH_SIZE):
+    # 1 バッチ分を移す。移した件数を返す（conn は isolation_level=None、アーカイブ ATTACH 済み）
+    col = _age_column(conn, table)
+    if col is None:
+        return 0
+    ids = [_first(r) for r in conn.execute(
+        f"SELECT id FROM main.{table} WHERE {_cutoff(col, days)} ORDER BY id LIMIT ?", (batch,)).fetchall()]
+    if not ids:
+        return 0
+    marks = ",".join("?" * len(ids))
+    cols = ", ".join(f'"{c}"' for c in _columns(conn, table))
+    # WAL では複数ファイルにまたがるコミットが一体にならないため、
+    # 先にアーカイブへ書いて確定 → アーカイブにある id だけ本体から消す（途中で落ちても失わない）
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(f"INSERT OR IGNORE INTO {ALIAS}.{table}({cols}, archived_at) "
+                     f"SELECT {cols}, CURRENT_TIMESTAMP FROM main.{table} WHERE id IN ({marks})", ids)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # 日次集計は過去分として残す（削除トリガーで差し引かせない）
+        with rollup.paused(conn):
+            n = conn.execute(f"DELETE FROM main.{table} WHERE id IN ({marks}) "
+                             f"AND id IN (SELECT id FROM {ALIAS}.{table})", ids).rowcount
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return n
+
+def run(db_path, days=RETENTION_DAYS, batch=BATCH_SIZE, max_batches=None, pause=PAUSE,
+        tables=tuple(AGE_COLUMNS), path=None):
+    # 短いトランザクションを繰り返して移す。テーブルごとの件数を返す
+    path = path or archive_path(db_path)
+    conn = db_pool.connect(db_path)
+    conn.isolation_level = None
+    moved = {t: 0 for t in tables}
+    t0 = time.monotonic()
+    try:
+        # 集計トリガーが rollup_pause を見る定義になっていることを先に保証する
+        rollup.install(conn)
+        attach(conn, path)
+        install(conn, tables)
+        for t in tables:
+            n_batches = 0
+            while max_batches is None or n_batches < max_batches:
+                n = move_batch(conn, t, days, batch)
+                moved[t] += n
+                n_batches += 1
+                if n < batch:
+                    break
+                time.sleep(pause)
+    finally:
+        conn.close()
+    last_run.update(at=datetime.now().isoformat(timespec="seconds"), moved=moved,
+                    seconds=round(time.monotonic() - t0, 3))
+    print(f"[archive] moved {moved} -> {path}")
+    return moved
+
+def status(db_path, days=RETENTION_DAYS, path=None):
+    path = path or archive_path(db_path)
+    conn = db_pool.connect(db_path, readonly=True, pragmas=db_pool.READONLY_PRAGMAS)
+    try:
+        attached = attach(conn, path, readonly=True)
+        out = {"archive_path": path, "days": days}
+        for t in AGE_COLUMNS:
+            col = _age_column(conn, t)
+            due = _first(conn.execute(f"SELECT COUNT(*) FROM main.{t} WHERE {_cutoff(col, days)}").fetchone()) if col else 0
+            archived = _first(conn.execute(f"SELECT COUNT(*) FROM {ALIAS}.{t}").fetchone()) \
+                if attached and _columns(conn, t, ALIAS) else 0
+            out[t] = {"due": due, "archived": archived}
+        return out
+    finally:
+        conn.close()
+
+
+# ===== 参照用：本体とアーカイブを UNION ALL で見る（プールの読み取り接続ごとに 1 回だけ用意） =====
+def _install_history(conn, path):
+    # ALIAS に読み取り専用で ATTACH し、records_all / handover_all（TEMP VIEW）を作り直す。
+    # アーカイブに載せたテーブルを返す（ファイルやテーブルがまだ無ければ本体だけのビュー）
+    if any((tuple(r.values()) if isinstance(r, dict) else tuple(r))[1] == ALIAS
+           for r in conn.execute("PRAGMA database_list").fetchall()):
+        conn.execute("DETACH DATABASE " + ALIAS)
+    attached = attach(conn, path, readonly=True)
+    covered = []
+    # 読み取りレーンは query_only。TEMP のビューを作る間だけ外す（本体は mode=ro なので書けないまま）
+    query_only = _first(conn.execute("PRAGMA query_only").fetchone())
+    conn.execute("PRAGMA query_only=OFF")
+    try:
+        for t in AGE_COLUMNS:
+            cols = _columns(conn, t)
+            sql = "SELECT " + ", ".join(f'"{c}"' for c in cols) + f" FROM main.{t}"
+            have = set(_columns(conn, t, ALIAS)) if attached else set()
+            if have:
+                arch = ", ".join(f'"{c}"' if c in have else f'NULL AS "{c}"' for c in cols)
+                sql += f" UNION ALL SELECT {arch} FROM {ALIAS}.{t}"
+                covered.append(t)
+            conn.execute(f"DROP VIEW IF EXISTS temp.{t}_all")
+            conn.execute(f"CREATE TEMP VIEW {t}_all AS {sql}")
+    finally:
+        conn.execute(f"PRAGMA query_only={int(query_only)}")
+    return tuple(covered)
+
+def history(conn, db_path, path=None):
+    # records_all / handover_all を読める状態にして conn を返す（リクエストの読み取り接続をそのまま使う）
+    # 接続ごとに 1 回だけ作る。アーカイブがまだ無かった接続は、ファイルができていれば作り直す
+    path = path or archive_path(db_path)
+    state = getattr(conn, "_archive_history", None)
+    if state is not None and state[0] == path and (
+            len(state[1]) == len(AGE_COLUMNS) or not os.path.exists(path) or conn.in_transaction):
+        return conn
+    conn._archive_history = (path, _install_history(conn, path))
+    return conn
+
+def _on_connect(conn, pool):
+    if pool.readonly:
+        history(conn, pool.path)
+
+db_pool.connect_hooks.append(_on_connect)
+
+
+def main():
+    p = argparse.ArgumentParser(description="古い記録・引継ぎをアーカイブDBへ移す")
+    p.add_argument("command", choices=["run", "status"])
+    p.add_argument("--db", default=os.environ.get("DB_PATH") or "care.db", help="DBパス（既定: care.db）")
+    p.add_argument("--archive", help="アーカイブDBパス（既定: <DB名>_archive.db）")
+    p.add_argument("--days", type=int, default=RETENTION_DAYS, help=f"保持日数（既定: {RETENTION_DAYS}）")
+    p.add_argument("--batch", type=int, default=BATCH_SIZE, help=f"1 バッチの件数（既定: {BATCH_SIZE}）")
+    p.add_argument("--max-batches", type=int, help="テーブルごとのバッチ数上限（既定: 全件）")
+    args = p.parse_args()
+    if args.command == "run":
+        moved = run(args.db, args.days, args.batch, args.max_batches, path=args.archive)
+        print(f"[OK] archived: {moved}")
+    else:
+        for k, v in status(args.db, args.days, args.archive).items():
+            print(f"{k}: {v}")
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from extras.db import get_conn
+from extras.db import get_conn, init_blueprint
 from extras.i18n import _
 
 auth_bp = Blueprint("auth_bp", __name__)
+init_blueprint(auth_bp)
 
 @auth_bp.route("/staff_register", methods=["GET","POST"])
 def staff_register():
@@ -26,7 +27,7 @@ def staff_login():
     if request.method == "POST":
         name = request.form.get("name")
         password = request.form.get("password")
-        with get_conn() as conn:
+        with get_conn(readonly=True) as conn:
             c = conn.cursor()
             c.execute("SELECT name, role FROM staff WHERE name=? AND password=?", (name, password))
             row = c.fetchone()
@@ -0,0 +1,191 @@
+# extras/backup.py
+# 稼働中の care.db のオンラインバックアップ（sqlite3 の backup API。WAL の読み手なので書き込みは止めない）
+from __future__ import annotations
+import argparse, glob, gzip, json, os, shutil, sqlite3, tempfile, threading, time
+from datetime import datetime
+
+from extras import pool as db_pool
+
+KEEP = int(os.environ.get("BACKUP_KEEP") or 14)
+# 1 ステップでコピーするページ数（-1 は 1 回で全部）と、ステップ間の休み（秒）
+# 分けてコピーすると、途中で他の接続がコミットするたびに 1 ページ目からやり直しになる
+PAGES = int(os.environ.get("BACKUP_PAGES") or -1)
+SLEEP = float(os.environ.get("BACKUP_SLEEP") or 0.01)
+# 分けてコピーするとき、やり直しがこの回数か秒数を超えたら 1 回でのコピーに切り替える
+MAX_RESTARTS = int(os.environ.get("BACKUP_MAX_RESTARTS") or 5)
+DEADLINE = float(os.environ.get("BACKUP_DEADLINE") or 60)
+COMPRESS = os.environ.get("BACKUP_GZIP", "1").lower() in ("1", "true", "on")
+LOG_NAME = "backup_log.jsonl"
+
+
+def backup_dir(db_path):
+    return os.environ.get("BACKUP_DIR") or os.path.join(os.path.dirname(os.path.abspath(db_path)), "backups")
+
+def _prefix(db_path):
+    return os.path.splitext(os.path.basename(db_path))[0] + "_"
+
+def snapshots(db_path, dest=None):
+    # 新しい順
+    dest = dest or backup_dir(db_path)
+    files = glob.glob(os.path.join(dest, _prefix(db_path) + "*.db")) + \
+            glob.glob(os.path.join(dest, _prefix(db_path) + "*.db.gz"))
+    return sorted(files, reverse=True)
+
+def verify(path):
+    # スナップショットを開いて integrity_check。gz は一時ファイルに展開して確認する
+    tmp = None
+    try:
+        if path.endswith(".gz"):
+            fd, tmp = tempfile.mkstemp(suffix=".db")
+            with os.fdopen(fd, "wb") as out, gzip.open(path, "rb") as src:
+                shutil.copyfileobj(src, out)
+        conn = sqlite3.connect(tmp or path)
+        try:
+            return conn.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            conn.close()
+    finally:
+        if tmp:
+            os.remove(tmp)
+
+def rotate(db_path, keep=KEEP, dest=None):
+    removed = []
+    for path in snapshots(db_path, dest)[keep:]:
+        os.remove(path)
+        removed.append(path)
+    return removed
+
+class _GiveUp(Exception):
+    pass
+
+def _copy(src, part, pages, sleep, steps):
+    # 書き込みが多くて分割コピーが終わらないときは _GiveUp
+    t0 = time.monotonic()
+    last = {"remaining": None}
+
+    def progress(status, remaining, total):
+        steps["n"] += 1
+        steps["pages"] = total
+        if last["remaining"] is not None and remaining > last["remaining"]:
+            steps["restarts"] += 1
+        last["remaining"] = remaining
+        if pages > 0 and (steps["restarts"] > MAX_RESTARTS or time.monotonic() - t0 > DEADLINE):
+            raise _GiveUp()
+
+    dst = sqlite3.connect(part)
+    try:
+        src.backup(dst, pages=pages, progress=progress, sleep=sleep)
+        return dst.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        dst.close()
+
+def run(db_path, dest=None, pages=PAGES, sleep=SLEEP, compress=COMPRESS, keep=KEEP):
+    # 1 回分のスナップショットを作る。結果（パス・サイズ・所要時間など）を dict で返す
+    dest = dest or backup_dir(db_path)
+    os.makedirs(dest, exist_ok=True)
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(dest, f"{_prefix(db_path)}{ts}.db")
+    n = 1
+    while glob.glob(path + "*"):
+        # 同じ秒に 2 回目が来ても上書きしない
+        n += 1
+        path = os.path.join(dest, f"{_prefix(db_path)}{ts}_{n}.db")
+    part = path + ".part"
+    t0 = time.monotonic()
+    steps = {"n": 0, "pages": 0, "restarts": 0, "fallback": False}
+
+    src = db_pool.connect(db_path, readonly=True, pragmas=db_pool.READONLY_PRAGMAS)
+    try:
+        try:
+            check = _copy(src, part, pages, sleep, steps)
+        except _GiveUp:
+            # 1 回でコピーする（読み取りトランザクション 1 本で終わるので、書き込み中でも必ず終わる）
+            print(f"[backup] {steps['restarts']} restarts, copying in one step")
+            os.remove(part)
+            steps["fallback"] = True
+            check = _copy(src, part, -1, 0, steps)
+        copied = time.monotonic() - t0
+    finally:
+        src.close()
+    if check != "ok":
+        os.replace(part, path + ".corrupt")
+        result = {"ok": False, "path": path + ".corrupt", "error": check}
+    else:
+        raw = os.path.getsize(part)
+        if compress:
+            with open(part, "rb") as f, gzip.open(path + ".gz", "wb", compresslevel=6) as out:
+                shutil.copyfileobj(f, out)
+            os.remove(part)
+            path += ".gz"
+        else:
+            os.replace(part, path)
+        result = {"ok": True, "path": path, "db_bytes": raw, "bytes": os.path.getsize(path),
+                  "removed": [os.path.basename(p) for p in rotate(db_path, keep, dest)]}
+    result.update(at=datetime.now().isoformat(timespec="seconds"), pages=steps["pages"],
+                  steps=steps["n"], restarts=steps["restarts"], fallback=steps["fallback"], copy_seconds=round(copied, 3),
+                  seconds=round(time.monotonic() - t0, 3))
+    # 容量計画用に 1 行ずつ残す
+    with open(os.path.join(dest, LOG_NAME), "a", encoding="utf-8") as f:
+        f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    print(f"[backup] {'OK' if result['ok'] else 'NG'} {result['path']} "
+          f"{result.get('bytes', 0)} bytes in {result['seconds']}s (copy {result['copy_seconds']}s, "
+          f"{result['pages']} pages / {result['steps']} steps)")
+    return result
+
+
+# ===== 管理画面からのバックグラウンド実行（同時に 1 本まで） =====
+_lock = threading.Lock()
+_state = {"running": False, "started_at": None, "last": None}
+
+def start_background(db_path, **kw):
+    # 走っていなければスレッドで開始して True。実行中なら False
+    with _lock:
+        if _state["running"]:
+            return False
+        _state.update(running=True, started_at=datetime.now().isoformat(timespec="seconds"))
+
+    def work():
+        try:
+            result = run(db_path, **kw)
+        except Exception as e:
+            print(f"[backup] failed: {e}")
+            result = {"ok": False, "error": str(e), "at": datetime.now().isoformat(timespec="seconds")}
+        with _lock:
+            _state.update(running=False, last=result)
+
+    threading.Thread(target=work, name="backup", daemon=True).start()
+    return True
+
+def status():
+    with _lock:
+        return dict(_state)
+
+
+def main():
+    p = argparse.ArgumentParser(description="care.db のオンラインバックアップ（世代管理・圧縮・整合性確認）")
+    p.add_argument("command", choices=["run", "list", "verify"])
+    p.add_argument("path", nargs="?", help="verify 時のスナップショット（省略時は最新）")
+    p.add_argument("--db", default=os.environ.get("DB_PATH") or "care.db", help="DBパス（既定: care.db）")
+    p.add_argument("--dest", help="保存先（既定: DB と同じ場所の backups/）")
+    p.add_argument("--keep", type=int, default=KEEP, help=f"残す世代数（既定: {KEEP}）")
+    p.add_argument("--pages", type=int, default=PAGES, help=f"1 ステップのページ数（-1 で 1 回。既定: {PAGES}）")
+    p.add_argument("--sleep", type=float, default=SLEEP, help=f"ステップ間の休み秒（既定: {SLEEP}）")
+    p.add_argument("--no-gzip", action="store_true", help="圧縮しない")
+    args = p.parse_args()
+    if args.command == "run":
+        r = run(args.db, args.dest, args.pages, args.sleep, not args.no_gzip and COMPRESS, args.keep)
+        raise SystemExit(0 if r["ok"] else 1)
+    if args.command == "list":
+        for path in snapshots(args.db, args.dest):
+            print(f"{os.path.getsize(path):>12}  {path}")
+        return
+    path = args.path or next(iter(snapshots(args.db, args.dest)), None)
+    if path is None:
+        print("[ERROR] スナップショットがありません。")
+        raise SystemExit(1)
+    check = verify(path)
+    print(f"[{'OK' if check == 'ok' else 'NG'}] {path}: {check}")
+    raise SystemExit(0 if check == "ok" else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# extras/badges.py
+# QR ログインバッジの一括発行（QR 描画はプロセスプールで並列、A4 シートに並べて PDF / PNG(zip) で少しずつ出す）
+from __future__ import annotations
+import argparse, atexit, io, multiprocessing, os, secrets, threading, zipfile, zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import qrcode
+from PIL import Image, ImageDraw, ImageFont
+
+# A4 縦 150dpi に 3 列 x 4 行
+SHEET_W, SHEET_H = 1240, 1754
+COLS, ROWS = 3, 4
+MARGIN = 60
+QR_PX = 280
+WORKERS = int(os.environ.get("BADGE_WORKERS") or os.cpu_count() or 1)
+# これより少なければプロセスを立てずにその場で描く
+PARALLEL_MIN = int(os.environ.get("BADGE_PARALLEL_MIN") or 12)
+# 日本語の名前を描くためのフォント（無ければ PIL 既定。既定フォントは漢字が出ない）
+FONT_CANDIDATES = [
+    os.environ.get("BADGE_FONT") or "",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/fonts-japanese-gothic.ttf",
+    "/usr/share/fonts/opentype/ipafont-gothic/ipag.ttf",
+    "/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc",
+    "C:\\Windows\\Fonts\\meiryo.ttc",
+    "C:\\Windows\\Fonts\\msgothic.ttc",
+]
+
+
+def _font(size):
+    for path in FONT_CANDIDATES:
+        if path and os.path.exists(path):
+            return ImageFont.truetype(path, size)
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:  # Pillow < 10.1
+        return ImageFont.load_default()
+
+def render_qr(url):
+    # ワーカープロセスで実行：QR を QR_PX 角の白黒画像にして生バイトで返す（pickle が軽い）
+    img = qrcode.make(url, border=2).convert("L").resize((QR_PX, QR_PX), Image.NEAREST)
+    return img.tobytes()
+
+# spawn のプロセスプールはプロセスに 1 つ（初回の大きな発行で作り、リクエストごとには立てない）
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor(workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_executor.shutdown, cancel_futures=True)
+        return _executor
+
+def _drop_executor(ex):
+    global _executor
+    with _executor_lock:
+        if _executor is ex:
+            _executor = None
+    ex.shutdown(wait=False, cancel_futures=True)
+
+def _render_all(urls, workers=WORKERS):
+    # 入力順に QR を返す。件数が多いときだけプロセスプールで並列に描く
+    if workers <= 1 or len(urls) < PARALLEL_MIN:
+        yield from map(render_qr, urls)
+        return
+    ex = _get_executor(workers)
+    try:
+        yield from ex.map(render_qr, urls, chunksize=max(1, len(urls) // (workers * 4)))
+    except BrokenProcessPool:
+        # ワーカーが落ちたプールは使えないので捨てる（次の発行で作り直す）
+        _drop_executor(ex)
+        raise
+
+def sheets(badges, workers=WORKERS):
+    # badges: [(name, role, url), ...] → 1 枚ずつ PIL 画像を返す（全シートはメモリに載せない）
+    per_sheet = COLS * ROWS
+    cell_w = (SHEET_W - MARGIN * 2) // COLS
+    cell_h = (SHEET_H - MARGIN * 2) // ROWS
+    name_font, role_font = _font(40), _font(28)
+    sheet = draw = None
+    qrs = _render_all([b[2] for b in badges], workers)
+    for i, ((name, role, _url), raw) in enumerate(zip(badges, qrs)):
+        k = i % per_sheet
+        if k == 0:
+            if sheet is not None:
+                yield sheet
+            sheet = Image.new("L", (SHEET_W, SHEET_H), 255)
+            draw = ImageDraw.Draw(sheet)
+        x = MARGIN + (k % COLS) * cell_w
+        y = MARGIN + (k // COLS) * cell_h
+        # 切り取り線
+        draw.rectangle([x + 4, y + 4, x + cell_w - 4, y + cell_h - 4], outline=180, width=2)
+        sheet.paste(Image.frombytes("L", (QR_PX, QR_PX), raw), (x + (cell_w - QR_PX) // 2, y + 16))
+        draw.text((x + cell_w // 2, y + QR_PX + 30), name or "", fill=0, font=name_font, anchor="mt")
+        draw.text((x + cell_w // 2, y + QR_PX + 78), role or "", fill=90, font=role_font, anchor="mt")
+    if sheet is not None:
+        yield sheet
+
+
+# ===== 出力（ストリーミング） =====
+class _Sink(io.RawIOBase):
+    # zipfile の書き込み先。溜まった分を取り出して送る
+    def __init__(self):
+        self.parts = []
+    def writable(self):
+        return True
+    def write(self, b):
+        self.parts.append(bytes(b))
+        return len(b)
+    def take(self):
+        out, self.parts = b"".join(self.parts), []
+        return out
+
+def stream_zip(badges, workers=WORKERS):
+    # シートごとに PNG を作って zip に足し、書けた分だけ返す
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:
+        for n, sheet in enumerate(sheets(badges, workers), 1):
+            buf = io.BytesIO()
+            sheet.save(buf, format="PNG", optimize=True)
+            zf.writestr(f"badges_{n:03d}.png", buf.getvalue())
+            yield sink.take()
+    yield sink.take()
+
+def stream_pdf(badges, workers=WORKERS):
+    # シートができるたびに 1 ページ分（画像・描画命令・ページ）を書いて返す。ページ一覧（2 番）と xref は最後
+    # PIL の PDF 保存はファイル全体を書き終えるまで返せないので、ここで最小限の PDF を組む
+    offsets = {}
+    pos = 0
+    def obj(num, body, stream=None):
+        nonlocal pos
+        offsets[num] = pos
+        out = f"{num} 0 obj\n".encode() + body
+        if stream is not None:
+            out += b"\nstream\n" + stream + b"\nendstream"
+        out += b"\nendobj\n"
+        pos += len(out)
+        return out
+    head = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    pos = len(head)
+    yield head + obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+    # 150dpi の画素をポイント（1/72 インチ）に
+    w, h = SHEET_W * 72 / 150, SHEET_H * 72 / 150
+    pages = []
+    def page(sheet):
+        img, content, num = 3 + len(pages) * 3, 4 + len(pages) * 3, 5 + len(pages) * 3
+        pages.append(num)
+        data = zlib.compress(sheet.tobytes(), 6)
+        draw = f"q {w:.2f} 0 0 {h:.2f} 0 0 cm /Im0 Do Q".encode()
+        return (obj(img, f"<< /Type /XObject /Subtype /Image /Width {SHEET_W} /Height {SHEET_H} "
+                         f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode "
+                         f"/Length {len(data)} >>".encode(), data)
+                + obj(content, f"<< /Length {len(draw)} >>".encode(), draw)
+                + obj(num, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {w:.2f} {h:.2f}] "
+                           f"/Resources << /XObject << /Im0 {img} 0 R >> >> /Contents {content} 0 R >>".encode()))
+    for sheet in sheets(badges, workers):
+        yield page(sheet)
+    if not pages:
+        yield page(Image.new("L", (SHEET_W, SHEET_H), 255))
+    kids = " ".join(f"{n} 0 R" for n in pages)
+    tail = obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    size = max(offsets) + 1
+    xref = [f"xref\n0 {size}\n0000000000 65535 f \n"]
+    xref += [f"{offsets[n]:010d} 00000 n \n" for n in range(1, size)]
+    yield tail + ("".join(xref) + f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{pos}\n%%EOF\n").encode()
+
+
+# ===== トークン発行 =====
+def issue_tokens(conn, staff_ids=None, reissue=False):
+    # 対象スタッフ（None なら全員）の [(name, role, token, 旧token), ...] を返す
+    # 未発行の人だけ発行する。reissue=True なら全員作り直す（旧 token は QR キャッシュの破棄用）
+    sql = "SELECT id, name, role, login_token FROM staff"
+    params = []
+    if staff_ids:
+        sql += f" WHERE id IN ({','.join('?' * len(staff_ids))})"
+        params = list(staff_ids)
+    rows = [tuple(r.values()) if isinstance(r, dict) else tuple(r)
+            for r in conn.execute(sql + " ORDER BY id", params).fetchall()]
+    out, updates = [], []
+    for sid, name, role, token in rows:
+        old = None
+        if reissue or not token:
+            old, token = token, secrets.token_hex(8)
+            updates.append((token, sid))
+        out.append((name, role, token, old))
+    if updates:
+        conn.executemany("UPDATE staff SET login_token=? WHERE id=?", updates)
+    conn.commit()
+    return out
+
+
+def main():
+    import sqlite3
+    p = argparse.ArgumentParser(description="QRログインバッジを一括作成（PDF または PNG の zip）")
+    p.add_argument("ids", nargs="*", type=int, help="スタッフID（省略時は全員）")
+    p.add_argument("--db", default=os.environ.get("DB_PATH") or "care.db", help="DBパス（既定: care.db）")
+    p.add_argument("--host", default="localhost", help="ログインURLのホスト名（既定: localhost）")
+    p.add_argument("--format", choices=["pdf", "png"], default="pdf")
+    p.add_argument("--out", "-o", help="出力ファイル（既定: badges.pdf / badges.zip）")
+    p.add_argument("--reissue", action="store_true", help="発行済みのトークンも作り直す")
+    p.add_argument("--workers", type=int, default=WORKERS, help=f"並列数（既定: {WORKERS}）")
+    args = p.parse_args()
+    conn = sqlite3.connect(args.db)
+    try:
+        issued = issue_tokens(conn, args.ids, args.reissue)
+    finally:
+        conn.close()
+    badges = [(name, role, f"http://{args.host}:5000/login/{token}") for name, role, token, _ in issued]
+    out = args.out or ("badges.pdf" if args.format == "pdf" else "badges.zip")
+    gen = stream_pdf if args.format == "pdf" else stream_zip
+    with open(out, "wb") as f:
+        for chunk in gen(badges, args.workers):
+            f.write(chunk)
+    print(f"[OK] {len(badges)} badges -> {out}")
+
+if __name__ == "__main__":
+    main()
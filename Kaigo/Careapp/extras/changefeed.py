@@ -0,0 +1,66 @@
+# extras/changefeed.py
+# 差分同期用の変更ログ（トリガーで records / handover の追加・更新・削除を記録）
+from __future__ import annotations
+
+FEED_TABLES = ("records", "handover")
+MAX_CHANGES = 1000
+
+def install(conn, tables=FEED_TABLES):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS change_log(
+      seq INTEGER PRIMARY KEY AUTOINCREMENT,
+      tbl TEXT NOT NULL,
+      row_id INTEGER NOT NULL,
+      op TEXT NOT NULL,
+      changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_change_log_tbl ON change_log(tbl, seq)")
+    for t in tables:
+        # 利用者削除の ON DELETE CASCADE で消えた記録も DELETE トリガーで拾える
+        for op, ref in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {t}_changelog_{op.lower()}
+            AFTER {op} ON {t}
+            BEGIN
+              INSERT INTO change_log(tbl, row_id, op) VALUES('{t}', {ref}.id, '{op[0]}');
+            END""")
+
+def head(conn):
+    row = conn.execute("SELECT MAX(seq) FROM change_log").fetchone()
+    return _first(row) or 0
+
+def changes_since(conn, tbl, since, limit=MAX_CHANGES):
+    # since より後の変更を行ごとに畳み込んで返す（最後の操作が有効）
+    oldest = _first(conn.execute("SELECT MIN(seq) FROM change_log").fetchone())
+    if oldest is not None and since < oldest - 1:
+        # 古いログは prune 済み → クライアントは全件取り直し
+        return {"seq": head(conn), "upserts": [], "deletes": [], "reset": True, "more": False}
+    # 先に先頭 seq を確定させ、読んでいる間の追加を取りこぼさない
+    top = head(conn)
+    rows = conn.execute(
+        "SELECT seq, row_id, op FROM change_log WHERE tbl=? AND seq>? AND seq<=? ORDER BY seq LIMIT ?",
+        (tbl, since, top, limit + 1)).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    last = {}
+    for r in rows:
+        seq, row_id, op = _tuple(r)
+        last[row_id] = op
+    seq = _tuple(rows[-1])[0] if more else max(since, top)
+    return {
+        "seq": seq,
+        "upserts": [i for i, op in last.items() if op != "D"],
+        "deletes": [i for i, op in last.items() if op == "D"],
+        "reset": False,
+        "more": more,
+    }
+
+def prune(conn, keep_days=7):
+    conn.execute("DELETE FROM change_log WHERE changed_at < datetime('now', ?)", (f"-{int(keep_days)} days",))
+
+def _tuple(row):
+    # row_factory が dict でもタプルでも扱えるように
+    return tuple(row.values()) if isinstance(row, dict) else tuple(row)
+
+def _first(row):
+    return _tuple(row)[0] if row is not None else None
@@ -0,0 +1,51 @@
+# extras/conditional.py
+# ETag による条件付き GET（テーブルの変更カウンタから検証子を作る）
+# Last-Modified は出さない（table_versions の時刻は秒単位なので、同じ秒の 2 回目の書き込みを見逃す）
+from __future__ import annotations
+import hashlib
+from functools import wraps
+
+from flask import make_response, request, session
+from extras.db import get_conn
+from extras.versions import get_versions
+
+DEFAULT_CACHE_CONTROL = "private, no-cache"
+
+def _validator(tables, vary=None):
+    versions = get_versions(get_conn(readonly=True), tables)
+    # 表示内容は利用者・言語・クエリで変わるのでそれも混ぜる
+    parts = [request.endpoint or "", request.full_path,
+             session.get("staff_name") or "", session.get("staff_role") or "", session.get("lang") or "",
+             request.headers.get("Accept-Language", "")]
+    parts += [f"{t}:{versions.get(t, (0, None))[0]}" for t in tables]
+    if vary is not None:
+        # URL に出ない既定値（「今日」など）で中身が変わるものを足す
+        parts.append(str(vary()))
+    return hashlib.blake2s("|".join(parts).encode("utf-8"), digest_size=12).hexdigest()
+
+def _not_modified(etag):
+    return bool(request.if_none_match) and request.if_none_match.contains_weak(etag)
+
+def conditional(*tables, cache_control=None, vary=None):
+    # cache_control: 文字列、または None を返してよい callable（既定は毎回再検証）
+    # vary: 検証子に混ぜる値を返す callable（省略可）
+    def deco(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            # flash 待ちがあると本文が変わるので素通し
+            if request.method not in ("GET", "HEAD") or session.get("_flashes"):
+                return f(*args, **kwargs)
+            etag = _validator(tables, vary)
+            cc = cache_control() if callable(cache_control) else cache_control
+            cc = cc or DEFAULT_CACHE_CONTROL
+            if _not_modified(etag):
+                resp = make_response("", 304)
+            else:
+                resp = make_response(f(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+            resp.set_etag(etag, weak=True)
+            resp.headers["Cache-Control"] = cc
+            return resp
+        return wrapper
+    return deco
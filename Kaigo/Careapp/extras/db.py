@@ -1,66 +1,34 @@
-import sqlite3
-import os
+from flask import current_app, has_app_context
+from extras import pool as db_pool
+from extras import migrations, roster, writequeue
 
 DB_PATH = "care.db"
 
-def get_conn():
-    return sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False)
+def _db_path():
+    # アプリ側で DB_PATH が設定されていればそれに合わせる
+    if has_app_context():
+        return current_app.config.get("DB_PATH", DB_PATH)
+    return DB_PATH
 
-def init_db():
-    first = not os.path.exists(DB_PATH)
+def get_conn(readonly=False):
+    # 共有プールの接続（リクエスト終了時に返却される）。参照だけなら readonly=True
+    return db_pool.get_db(db_pool.get_pool(_db_path(), readonly=readonly))
+
+def get_roster():
+    # 利用者名簿のキャッシュ（id・名前）。利用者を追加・削除したら .invalidate()
+    return roster.get_roster(_db_path())
+
+def run_write(fn):
+    # fn(conn) をコミットまで終えて戻り値を返す（WRITE_BEHIND 時は書き込みキュー経由）
+    q = writequeue.get_queue(_db_path())
+    if q is not None:
+        return q.run(fn)
     with get_conn() as conn:
-        c = conn.cursor()
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS users(
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              name TEXT,
-              age INTEGER,
-              gender TEXT,
-              room_number TEXT,
-              notes TEXT
-            )
-        """)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS records(
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              user_id INTEGER,
-              meal TEXT,
-              medication TEXT,
-              toilet TEXT,
-              condition TEXT,
-              memo TEXT,
-              staff_name TEXT,
-              created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-              FOREIGN KEY(user_id) REFERENCES users(id)
-            )
-        """)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS staff(
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              name TEXT UNIQUE,
-              password TEXT,
-              role TEXT,
-              login_token TEXT
-            )
-        """)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS handover(
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              on_date TEXT,
-              shift TEXT,
-              resident_id INTEGER,
-              priority INTEGER,
-              title TEXT,
-              body TEXT,
-              created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
+        return fn(conn)
 
-        # 既存 DB の不足カラムを補修
-        try:
-            c.execute("SELECT room_number, notes FROM users LIMIT 1")
-        except sqlite3.OperationalError:
-            c.execute("ALTER TABLE users ADD COLUMN room_number TEXT")
-            c.execute("ALTER TABLE users ADD COLUMN notes TEXT")
-            conn.commit()
+# Blueprint 側で呼ぶ：登録先アプリに接続返却の teardown を仕込む
+init_blueprint = db_pool.init_blueprint
+
+def init_db():
+    # スキーマは extras/migrations.py の版管理に一本化（最新なら user_version を読むだけ）
+    migrations.ensure(_db_path())
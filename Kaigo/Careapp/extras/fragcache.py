@@ -0,0 +1,130 @@
+# extras/fragcache.py
+# 一覧テーブルなどの HTML 断片を LRU で保持する（キー: 断片名・言語・クエリ・テーブル変更カウンタ）
+# 書き込みはトリガーで table_versions が上がるので、どのルートから書かれても次の表示で作り直される
+from __future__ import annotations
+import collections, contextlib, os, threading, time
+
+from flask import render_template, request
+from markupsafe import Markup
+
+from extras import translations
+from extras.db import get_conn
+from extras.versions import get_versions
+
+MAX_ENTRIES = int(os.environ.get("FRAG_CACHE_SIZE") or 256)  # 0 で無効
+MAX_BYTES = int(os.environ.get("FRAG_CACHE_BYTES") or 16 * 1024 * 1024)
+
+
+class FragmentCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> (html, 描画秒, {tbl: version})
+        self._items: collections.OrderedDict = collections.OrderedDict()
+        self._bytes = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self.render_seconds = self.saved_seconds = 0.0
+        self.blocks: dict = {}
+
+    def _count(self, block, field):
+        b = self.blocks.setdefault(block, {"hits": 0, "misses": 0})
+        b[field] += 1
+
+    def _drop(self, key):
+        html = self._items.pop(key)[0]
+        self._bytes -= len(html)
+
+    def get(self, key, block):
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is None:
+                self.misses += 1
+                self._count(block, "misses")
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += hit[1]
+            self._count(block, "hits")
+            return hit[0]
+
+    def put(self, key, html, seconds, vers):
+        with self._lock:
+            self.render_seconds += seconds
+            # 同じテーブルの古い版の断片は二度と当たらないので先に捨てる
+            stale = [k for k, v in self._items.items()
+                     if any(v[2].get(t, n) < n for t, n in vers.items())]
+            for k in stale:
+                self._drop(k)
+            self.invalidations += len(stale)
+            if key in self._items:
+                self._drop(key)
+            self._items[key] = (html, seconds, vers)
+            self._bytes += len(html)
+            while self._items and (len(self._items) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._items)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            n, nbytes = len(self._items), self._bytes
+            blocks = {k: dict(v) for k, v in self.blocks.items()}
+        total = self.hits + self.misses
+        return {"entries": n, "max_entries": self.max_entries, "bytes": nbytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+                "render_seconds": round(self.render_seconds, 4),
+                "saved_seconds": round(self.saved_seconds, 4), "blocks": blocks}
+
+
+# プロセス全体で共有
+frag_cache = FragmentCache()
+
+
+@contextlib.contextmanager
+def snapshot(conn, tables):
+    # 行と版数を同じ読み取りトランザクションで取る。yield した {tbl: version} を fragment(versions=...) に渡す
+    # （描画時に別に読むと、その間の書き込みで古い HTML が新しい版のキーで残る）
+    own = not conn.in_transaction
+    if own:
+        conn.execute("BEGIN")
+    try:
+        yield {t: v[0] for t, v in get_versions(conn, tables).items()}
+    finally:
+        if own:
+            conn.execute("COMMIT")
+
+def fragment(block, template, tables=(), key=(), versions=None, **context):
+    # テンプレから {{ fragment("records_rows", "_records_rows.html", ("records", "users"), versions=versions, rows=rows) }}
+    # context の中身はキーに入らないので、表示が クエリ・key・テーブル の版 で決まる断片だけに使う
+    # versions は行を読んだときの版（snapshot() や Roster.snapshot()）。無ければ描画時に読む（行と食い違うことがある）
+    tables = tuple(tables)
+    if frag_cache.max_entries <= 0:
+        return Markup(render_template(template, **context))
+    if not tables:
+        vers = {}
+    elif versions:
+        vers = {t: versions[t] for t in tables if t in versions}
+    else:
+        vers = {t: v[0] for t, v in get_versions(get_conn(readonly=True), tables).items()}
+    k = (block, request.endpoint, translations.get_locale(), request.host, request.script_root,
+         tuple(sorted(request.args.items(multi=True))), tuple(key), tuple(sorted(vers.items())))
+    html = frag_cache.get(k, block)
+    if html is None:
+        t0 = time.perf_counter()
+        html = render_template(template, **context)
+        frag_cache.put(k, html, time.perf_counter() - t0, vers)
+    return Markup(html)
+
+def init_app(app):
+    app.jinja_env.globals.update(fragment=fragment)
+
+def init_blueprint(bp):
+    # 一覧テンプレを描く Blueprint 用（登録先アプリのテンプレに fragment を足す）
+    bp.add_app_template_global(fragment)
@@ -1,10 +1,14 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from functools import wraps
 from datetime import date
-from extras.db import get_conn
+from extras.db import get_conn, get_roster, init_blueprint, run_write
 from extras.i18n import _
+from extras.sse import publish_handover
+from extras import fragcache
 
 handover_bp = Blueprint("handover_bp", __name__)
+init_blueprint(handover_bp)
+fragcache.init_blueprint(handover_bp)
 
 def login_required(f):
     @wraps(f)
@@ -20,10 +24,9 @@ def login_required(f):
 def handover():
     on_date = request.args.get("date") or date.today().isoformat()
     shift = request.args.get("shift") or "day"
-    with get_conn() as conn:
+    residents = get_roster().get()
+    with get_conn(readonly=True) as conn, fragcache.snapshot(conn, ("handover",)) as versions:
         c = conn.cursor()
-        c.execute("SELECT id, name FROM users ORDER BY id")
-        residents = c.fetchall()
         c.execute("""
             SELECT h.id, h.on_date, h.shift, u.name, h.priority, h.title, h.body, h.created_at
             FROM handover h LEFT JOIN users u ON h.resident_id = u.id
@@ -31,7 +34,8 @@ def handover():
             ORDER BY h.priority ASC, h.id DESC
         """,(on_date, shift))
         items = c.fetchall()
-    return render_template("handover.html", items=items, residents=residents, on_date=on_date, shift=shift)
+    return render_template("handover.html", items=items, residents=residents, on_date=on_date, shift=shift,
+                           versions=versions)
 
 @handover_bp.route("/handover/add", methods=["POST"])
 @login_required
@@ -42,12 +46,12 @@ def handover_add():
     priority = request.form.get("priority") or 2
     title = request.form.get("title") or ""
     body = request.form.get("body") or ""
-    with get_conn() as conn:
-        c = conn.cursor()
-        c.execute("""
+    new_id = run_write(lambda w: w.execute("""
           INSERT INTO handover(on_date, shift, resident_id, priority, title, body)
           VALUES(?,?,?,?,?,?)
-        """,(on_date, shift, resident_id, priority, title, body))
-        conn.commit()
+        """,(on_date, shift, resident_id, priority, title, body)).lastrowid)
+    # 本体の /handover と同じ形で配信する
+    with get_conn(readonly=True) as conn:
+        publish_handover(conn, new_id)
     flash(_("handover_added"))
     return redirect(url_for("handover_bp.handover", date=on_date, shift=shift))
@@ -1,4 +1,6 @@
-from flask import session
+from flask import has_request_context, session
+
+from extras import translations
 
 LANGS = ["ja", "en"]
 
@@ -49,16 +51,15 @@ T = {
     }
 }
 
+# カタログは extras.translations がプロセスで 1 回だけ読んだものを使う
+# ロケールは従来どおりセッション → 既定（ja）。Accept-Language は見ない（本体の get_locale とは別）
 def get_lang():
-    lang = session.get("lang")
-    return lang if lang in LANGS else "ja"
+    lang = session.get("lang") if has_request_context() else None
+    return lang if lang in LANGS else translations.DEFAULT_LANG
 
 def _(key):
-    lang = get_lang()
-    val = T.get(lang, {}).get(key)
-    return val if val is not None else key
+    translations.catalogs.check()
+    return translations.catalogs.bound(get_lang())(key)
 
 def init_i18n(app):
-    @app.context_processor
-    def inject_i18n():
-        return {"_": _, "current_lang": get_lang(), "LANGS": LANGS}
+    translations.init_app(app)
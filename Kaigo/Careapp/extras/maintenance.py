@@ -0,0 +1,238 @@
+# extras/maintenance.py
+# DB の定期メンテナンス（WAL チェックポイント / PRAGMA optimize・ANALYZE / 静かな時間帯の incremental vacuum）
+from __future__ import annotations
+import argparse, contextlib, os, threading, time
+from datetime import datetime
+
+from extras import pool as db_pool
+from extras import archive, changefeed
+
+# 見回り間隔（秒、0 で無効）
+INTERVAL = int(os.environ.get("MAINT_INTERVAL") or 60)
+# WAL がこのサイズを超えたら PASSIVE、さらに大きければ TRUNCATE
+WAL_PASSIVE_BYTES = int(os.environ.get("WAL_PASSIVE_BYTES") or 4 * 1024 * 1024)
+WAL_TRUNCATE_BYTES = int(os.environ.get("WAL_TRUNCATE_BYTES") or 64 * 1024 * 1024)
+OPTIMIZE_EVERY = int(os.environ.get("OPTIMIZE_EVERY") or 6 * 3600)
+ANALYZE_EVERY = int(os.environ.get("ANALYZE_EVERY") or 24 * 3600)
+PRUNE_EVERY = int(os.environ.get("CHANGELOG_PRUNE_EVERY") or 24 * 3600)
+CHANGELOG_KEEP_DAYS = int(os.environ.get("CHANGELOG_KEEP_DAYS") or 7)
+# 静かな時間帯（"2-4" なら 2:00〜4:59）。ANALYZE と vacuum はこの間だけ
+QUIET_HOURS = os.environ.get("MAINT_QUIET_HOURS") or "2-4"
+VACUUM_PAGES = int(os.environ.get("VACUUM_PAGES") or 2000)
+# auto_vacuum が NONE の旧 DB で空きページがこの割合を超えたら、切り替えが要ることを stats に出す
+# 切り替え（全体の VACUUM）は書き込みを止めるので自動ではやらない: python -m extras.maintenance vacuum --convert
+VACUUM_CONVERT_RATIO = float(os.environ.get("VACUUM_CONVERT_RATIO") or 0.2)
+# メンテナンス側は待たずに諦める（日中の書き込みを止めない）
+BUSY_TIMEOUT = float(os.environ.get("MAINT_BUSY_TIMEOUT") or 1)
+
+AUTO_VACUUM = {0: "none", 1: "full", 2: "incremental"}
+
+_last: dict = {}
+_due: dict = {}
+_lock = threading.Lock()
+
+
+def in_hours(hours, now=None):
+    start, _, end = hours.partition("-")
+    h = (now or datetime.now()).hour
+    start, end = int(start), int(end or start)
+    return start <= h <= end if start <= end else (h >= start or h <= end)
+
+def wal_bytes(db_path):
+    try:
+        return os.path.getsize(db_path + "-wal")
+    except OSError:
+        return 0
+
+def _pragma(conn, name):
+    row = conn.execute(f"PRAGMA {name}").fetchone()
+    return tuple(row.values())[0] if isinstance(row, dict) else row[0]
+
+def _record(task, t0, **result):
+    with _lock:
+        _last[task] = {"at": datetime.now().isoformat(timespec="seconds"),
+                       "seconds": round(time.monotonic() - t0, 4), **result}
+
+def _is_due(task, every):
+    now = time.monotonic()
+    with _lock:
+        if now < _due.get(task, 0):
+            return False
+        _due[task] = now + every
+    return True
+
+
+# ===== 各タスク =====
+def checkpoint(conn, db_path, force=None):
+    # WAL の大きさで PASSIVE / TRUNCATE を選ぶ。閾値未満なら何もしない
+    size = wal_bytes(db_path)
+    mode = force or ("TRUNCATE" if size >= WAL_TRUNCATE_BYTES else
+                     "PASSIVE" if size >= WAL_PASSIVE_BYTES else None)
+    if mode is None:
+        return None
+    t0 = time.monotonic()
+    busy, log, done = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    _record("checkpoint", t0, mode=mode, wal_before=size, wal_after=wal_bytes(db_path),
+            busy=busy, log_frames=log, checkpointed=done)
+    return mode
+
+def optimize(conn):
+    t0 = time.monotonic()
+    conn.execute("PRAGMA optimize")
+    _record("optimize", t0)
+
+def analyze(conn):
+    t0 = time.monotonic()
+    conn.execute("ANALYZE")
+    _record("analyze", t0)
+
+def vacuum(conn, pages=VACUUM_PAGES):
+    # incremental なら空きページを pages 分だけ返す。NONE で空きが多ければ切り替えが要ることだけ記録する
+    free, total = _pragma(conn, "freelist_count"), _pragma(conn, "page_count")
+    mode = _pragma(conn, "auto_vacuum")
+    t0 = time.monotonic()
+    if mode == 2:
+        if not free:
+            return None
+        # execute() だと 1 ステップ（1 ページ）で止まるので executescript で最後まで回す
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+        action = "incremental"
+    elif total and free / total >= VACUUM_CONVERT_RATIO:
+        action = "needs_convert"
+    else:
+        return None
+    _record("vacuum", t0, action=action, free_before=free, free_after=_pragma(conn, "freelist_count"))
+    return action
+
+class Locked(Exception):
+    """ほかのプロセスが同じ作業中"""
+
+@contextlib.contextmanager
+def _exclusive(db_path, name):
+    # プロセスをまたいだロック（DB の横にロックファイルを O_EXCL で作る）
+    path = f"{db_path}.{name}.lock"
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        raise Locked(f"{path} exists (another process is running; remove it if stale)")
+    try:
+        os.write(fd, f"{os.getpid()} {datetime.now().isoformat(timespec='seconds')}\n".encode())
+        yield
+    finally:
+        os.close(fd)
+        os.remove(path)
+
+def convert(conn, db_path):
+    # auto_vacuum=NONE → INCREMENTAL（全体の VACUUM。終わるまで書き込みは止まる）。管理者が明示的に実行する
+    if _pragma(conn, "auto_vacuum") == 2:
+        return None
+    with _exclusive(db_path, "vacuum"):
+        free = _pragma(conn, "freelist_count")
+        t0 = time.monotonic()
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        _record("vacuum", t0, action="convert", free_before=free, free_after=_pragma(conn, "freelist_count"))
+    return "convert"
+
+def prune_changelog(conn, keep_days=CHANGELOG_KEEP_DAYS):
+    t0 = time.monotonic()
+    before = conn.total_changes
+    changefeed.prune(conn, keep_days)
+    conn.commit()
+    _record("prune_changelog", t0, deleted=conn.total_changes - before)
+
+
+def run_once(db_path, now=None):
+    # 1 回分の見回り。期限が来たものだけ実行する
+    quiet = in_hours(QUIET_HOURS, now)
+    conn = db_pool.connect(db_path, timeout=BUSY_TIMEOUT)
+    try:
+        checkpoint(conn, db_path)
+        if _is_due("optimize", OPTIMIZE_EVERY):
+            optimize(conn)
+        if _is_due("prune_changelog", PRUNE_EVERY):
+            prune_changelog(conn)
+        if quiet:
+            if _is_due("analyze", ANALYZE_EVERY):
+                analyze(conn)
+            vacuum(conn)
+            # vacuum で WAL が膨らむので静かなうちに切り詰める
+            checkpoint(conn, db_path, force="TRUNCATE")
+    finally:
+        conn.close()
+    # アーカイブ移動は ARCHIVE_INTERVAL > 0 のときだけ、ARCHIVE_HOURS の間に
+    if archive.INTERVAL > 0 and in_hours(archive.HOURS, now) and _is_due("archive", archive.INTERVAL):
+        t0 = time.monotonic()
+        _record("archive", t0, moved=archive.run(db_path))
+
+
+def stats(conn, db_path):
+    # /healthz 用（conn は読み取り接続で可）
+    page_size = _pragma(conn, "page_size")
+    page_count = _pragma(conn, "page_count")
+    with _lock:
+        last = {k: dict(v) for k, v in _last.items()}
+    return {
+        "wal_bytes": wal_bytes(db_path),
+        "db_bytes": page_size * page_count,
+        "page_count": page_count,
+        "freelist_count": _pragma(conn, "freelist_count"),
+        "auto_vacuum": AUTO_VACUUM.get(_pragma(conn, "auto_vacuum")),
+        "running": _thread is not None,
+        "last": last,
+    }
+
+
+# ===== スケジューラ（プロセスに 1 本） =====
+_thread = None
+
+def start(db_path, interval=INTERVAL):
+    global _thread
+    if interval <= 0 or _thread is not None:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                run_once(db_path)
+            except Exception as e:
+                print(f"[maintenance] failed: {e}")
+
+    _thread = threading.Thread(target=loop, name="db-maintenance", daemon=True)
+    _thread.start()
+    return _thread
+
+
+def main():
+    p = argparse.ArgumentParser(description="DBメンテナンス（チェックポイント・optimize/ANALYZE・vacuum）")
+    p.add_argument("command", choices=["checkpoint", "optimize", "analyze", "vacuum", "prune", "stats"])
+    p.add_argument("--db", default=os.environ.get("DB_PATH") or "care.db", help="DBパス（既定: care.db）")
+    p.add_argument("--truncate", action="store_true", help="checkpoint を TRUNCATE で行う")
+    p.add_argument("--convert", action="store_true",
+                   help="vacuum 時、auto_vacuum=NONE の DB を INCREMENTAL に切り替える（全体の VACUUM。書き込みが止まる）")
+    args = p.parse_args()
+    # --convert は書き込みが終わるまで待つ（他の作業は待たずに諦める）
+    conn = db_pool.connect(args.db, timeout=60 if args.convert else BUSY_TIMEOUT)
+    try:
+        if args.command == "checkpoint":
+            checkpoint(conn, args.db, force="TRUNCATE" if args.truncate else "PASSIVE")
+        elif args.command == "optimize":
+            optimize(conn)
+        elif args.command == "analyze":
+            analyze(conn)
+        elif args.command == "vacuum":
+            try:
+                print(f"vacuum: {(convert(conn, args.db) if args.convert else vacuum(conn)) or 'nothing to do'}")
+            except Locked as e:
+                print(f"[ERROR] {e}")
+                raise SystemExit(1)
+        elif args.command == "prune":
+            prune_changelog(conn)
+        for k, v in stats(conn, args.db).items():
+            print(f"{k}: {v}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
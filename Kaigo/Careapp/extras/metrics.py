@@ -0,0 +1,208 @@
+# extras/metrics.py
+# リクエストの所要時間（エンドポイント別ヒストグラム）・ステータス数・DB/描画時間・処理中件数を集計して
+# Prometheus のテキスト形式で出す。記録はスレッドごとの箱に積むだけ（ロックは箱を作るときだけ）
+from __future__ import annotations
+import bisect, hmac, os, threading, time
+
+from flask import before_render_template, g, request, template_rendered
+
+from extras import pool as db_pool
+
+PREFIX = "careapp"
+# 秒。最後に +Inf が付く
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ENABLED = os.environ.get("METRICS", "1").lower() in ("1", "true", "on")
+# 管理者以外（Prometheus など）に /metrics を見せる条件。どちらも未設定なら管理者のみ
+# METRICS_TOKEN: "Authorization: Bearer <token>" で一致すれば許可
+# METRICS_ALLOW: 許可する接続元 IP（カンマ区切り）。リバースプロキシの後ろでは全員がプロキシの IP になるので使わない
+TOKEN = os.environ.get("METRICS_TOKEN") or ""
+ALLOW_ADDRS = tuple(a.strip() for a in (os.environ.get("METRICS_ALLOW") or "").split(",") if a.strip())
+
+
+class _Store:
+    # 1 スレッド分の集計（そのスレッドしか書かない）
+    __slots__ = ("thread", "hist", "status", "db", "queries", "render", "started", "finished",
+                 "render_clock", "render_depth", "render_t0")
+
+    def __init__(self, thread=None):
+        self.thread = thread
+        self.hist: dict = {}      # endpoint -> [バケットごとの件数..., 合計秒]
+        self.status: dict = {}    # (endpoint, method, status) -> 件数
+        self.db: dict = {}        # endpoint -> DB 秒
+        self.queries: dict = {}   # endpoint -> クエリ数
+        self.render: dict = {}    # endpoint -> テンプレ描画秒
+        self.started = self.finished = 0
+        self.render_clock = 0.0   # このスレッドの描画時間の累計（リクエスト前後の差を取る）
+        self.render_depth = 0
+        self.render_t0 = 0.0
+
+    def merge(self, other):
+        for ep, h in list(other.hist.items()):
+            mine = self.hist.setdefault(ep, [0] * (len(BUCKETS) + 2))
+            for i, v in enumerate(h):
+                mine[i] += v
+        for name in ("status", "db", "queries", "render"):
+            mine = getattr(self, name)
+            for k, v in list(getattr(other, name).items()):
+                mine[k] = mine.get(k, 0) + v
+        self.started += other.started
+        self.finished += other.finished
+
+
+_local = threading.local()
+_stores: list = []
+_retired = _Store()   # 終了したスレッドの分をまとめておく
+_lock = threading.Lock()
+
+def _store():
+    s = getattr(_local, "store", None)
+    if s is None:
+        s = _local.store = _Store(threading.current_thread())
+        with _lock:
+            # スレッドを使い捨てるサーバーでも箱が増え続けないよう、終わったスレッドの分を畳む
+            if len(_stores) >= 2 * threading.active_count():
+                _fold()
+            _stores.append(s)
+    return s
+
+def _fold():
+    # _lock 内で呼ぶ
+    alive = []
+    for s in _stores:
+        if s.thread is not None and s.thread.is_alive():
+            alive.append(s)
+        else:
+            _retired.merge(s)
+    _stores[:] = alive
+
+
+# ===== 記録 =====
+def _start():
+    s = _store()
+    s.started += 1
+    db_s, db_q = db_pool.db_time()
+    g._metrics = (time.perf_counter(), db_s, db_q, s.render_clock)
+
+def _finish(status):
+    t = g.pop("_metrics", None)
+    if t is None:
+        return
+    t0, db_s0, db_q0, render0 = t
+    elapsed = time.perf_counter() - t0
+    db_s, db_q = db_pool.db_time()
+    s = _store()
+    ep = request.endpoint or "<unmatched>"
+    h = s.hist.get(ep)
+    if h is None:
+        h = s.hist[ep] = [0] * (len(BUCKETS) + 2)
+    h[bisect.bisect_left(BUCKETS, elapsed)] += 1
+    h[-1] += elapsed
+    key = (ep, request.method, status)
+    s.status[key] = s.status.get(key, 0) + 1
+    s.db[ep] = s.db.get(ep, 0.0) + (db_s - db_s0)
+    s.queries[ep] = s.queries.get(ep, 0) + (db_q - db_q0)
+    s.render[ep] = s.render.get(ep, 0.0) + (s.render_clock - render0)
+    s.finished += 1
+
+def _render_started(sender, template, context, **extra):
+    s = _store()
+    if s.render_depth == 0:
+        s.render_t0 = time.perf_counter()
+    s.render_depth += 1
+
+def _render_done(sender, template, context, **extra):
+    s = _store()
+    s.render_depth = max(0, s.render_depth - 1)
+    if s.render_depth == 0:
+        # 断片（fragment）の入れ子描画は外側の 1 回として数える
+        s.render_clock += time.perf_counter() - s.render_t0
+
+
+def init_app(app):
+    if not ENABLED or "metrics" in app.extensions:
+        return
+    app.extensions["metrics"] = True
+
+    @app.before_request
+    def _metrics_start():
+        if request.endpoint != "static":
+            _start()
+
+    @app.after_request
+    def _metrics_finish(resp):
+        _finish(resp.status_code)
+        return resp
+
+    @app.teardown_request
+    def _metrics_teardown(exc):
+        # after_request まで届かなかった（例外）ものは 500 として数える
+        _finish(500)
+
+    before_render_template.connect(_render_started, app, weak=False)
+    template_rendered.connect(_render_done, app, weak=False)
+
+
+# ===== 出力 =====
+def snapshot():
+    total = _Store()
+    with _lock:
+        _fold()
+        total.merge(_retired)
+        for s in _stores:
+            total.merge(s)
+    return total
+
+def _esc(v):
+    return str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _fmt(v):
+    return repr(round(v, 6)) if isinstance(v, float) else str(v)
+
+def render(extra=None):
+    # extra: {名前: 値} のゲージを追加で出す（プールの使用数など）
+    t = snapshot()
+    out = []
+    name = f"{PREFIX}_request_duration_seconds"
+    out += [f"# HELP {name} Request latency by endpoint.", f"# TYPE {name} histogram"]
+    for ep, h in sorted(t.hist.items()):
+        ep = _esc(ep)
+        acc = 0
+        for le, n in zip(BUCKETS, h):
+            acc += n
+            out.append(f'{name}_bucket{{endpoint="{ep}",le="{le}"}} {acc}')
+        acc += h[len(BUCKETS)]
+        out.append(f'{name}_bucket{{endpoint="{ep}",le="+Inf"}} {acc}')
+        out.append(f'{name}_sum{{endpoint="{ep}"}} {_fmt(h[-1])}')
+        out.append(f'{name}_count{{endpoint="{ep}"}} {acc}')
+    name = f"{PREFIX}_requests_total"
+    out += [f"# HELP {name} Responses by endpoint, method and status.", f"# TYPE {name} counter"]
+    for (ep, method, status), n in sorted(t.status.items()):
+        out.append(f'{name}{{endpoint="{_esc(ep)}",method="{method}",status="{status}"}} {n}')
+    for key, help_, vals in (
+        ("request_db_seconds_total", "Time spent in SQLite (execute and fetch) by endpoint.", t.db),
+        ("request_db_queries_total", "SQL statements executed by endpoint.", t.queries),
+        ("request_render_seconds_total", "Time spent rendering templates by endpoint.", t.render),
+    ):
+        name = f"{PREFIX}_{key}"
+        out += [f"# HELP {name} {help_}", f"# TYPE {name} counter"]
+        for ep, v in sorted(vals.items()):
+            out.append(f'{name}{{endpoint="{_esc(ep)}"}} {_fmt(v)}')
+    name = f"{PREFIX}_requests_in_flight"
+    out += [f"# HELP {name} Requests currently being handled.", f"# TYPE {name} gauge",
+            f"{name} {max(0, t.started - t.finished)}"]
+    # 追加値は既定で gauge。単調増加の累計は名前を *_total にして counter で出す
+    for key, v in (extra or {}).items():
+        name = f"{PREFIX}_{key}"
+        kind = "counter" if key.endswith("_total") else "gauge"
+        out += [f"# TYPE {name} {kind}", f"{name} {_fmt(v)}"]
+    return "\n".join(out) + "\n"
+
+def allowed(session):
+    # 管理者、トークン一致、または明示的に許可した接続元だけ
+    if session.get("staff_role") == "admin":
+        return True
+    if TOKEN:
+        auth = request.headers.get("Authorization", "")
+        if auth.startswith("Bearer ") and hmac.compare_digest(auth[7:].strip(), TOKEN):
+            return True
+    return bool(ALLOW_ADDRS) and request.remote_addr in ALLOW_ADDRS
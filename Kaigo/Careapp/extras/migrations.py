@@ -0,0 +1,220 @@
+# extras/migrations.py
+# 版管理つきスキーマ移行（PRAGMA user_version）。起動時は版番号を 1 回読むだけ
+from __future__ import annotations
+import argparse, os
+
+from extras import pool as db_pool
+from extras import changefeed, rollup, search, versions
+
+# ===== 各ステップ（conn はトランザクション内。冪等に書く：user_version=0 の既存 DB にも流れる） =====
+def _columns(conn, table):
+    rows = conn.execute("SELECT name, \"notnull\" FROM pragma_table_info(?)", (table,)).fetchall()
+    return {r[0]: r[1] for r in rows}
+
+def _add_columns(conn, table, cols):
+    have = _columns(conn, table)
+    for col, decl in cols:
+        if col not in have:
+            print(f"[migrate] {table}: add column {col} {decl}")
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {decl}")
+
+# 引継ぎは app.py（h_date/note/staff）、handover_bp（on_date/title/body）、
+# migrate_handover.py（content/created_by）の 3 系統があったので全列を持たせて相互に埋める
+HANDOVER_COLUMNS = [
+    ("h_date", "TEXT"), ("shift", "TEXT"), ("note", "TEXT"), ("staff", "TEXT"),
+    ("on_date", "TEXT"), ("resident_id", "INTEGER"), ("priority", "INTEGER DEFAULT 2"),
+    ("title", "TEXT"), ("body", "TEXT"), ("content", "TEXT"), ("created_by", "TEXT"),
+    ("created_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"), ("updated_at", "TIMESTAMP"),
+]
+HANDOVER_DDL = "CREATE TABLE IF NOT EXISTS {name}(\n  id INTEGER PRIMARY KEY AUTOINCREMENT,\n  " + \
+    ",\n  ".join(f"{c} {d}" for c, d in HANDOVER_COLUMNS) + "\n)"
+
+def base_tables(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS users(
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      name TEXT NOT NULL, age INTEGER, gender TEXT,
+      room_number TEXT, notes TEXT
+    )""")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS staff(
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      name TEXT NOT NULL UNIQUE,
+      password TEXT NOT NULL,
+      role TEXT NOT NULL,
+      login_token TEXT
+    )""")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS records(
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      user_id INTEGER NOT NULL,
+      meal TEXT, medication TEXT, toilet TEXT, condition TEXT, memo TEXT,
+      staff_name TEXT,
+      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+      FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )""")
+    conn.execute(HANDOVER_DDL.format(name="handover"))
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_records_user_id ON records(user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_records_created ON records(created_at DESC)")
+
+def missing_columns(conn):
+    # 旧 migrate_20251024.py の列補修
+    _add_columns(conn, "users", [("room_number", "TEXT"), ("notes", "TEXT")])
+    _add_columns(conn, "records", [
+        ("meal", "TEXT"), ("medication", "TEXT"), ("toilet", "TEXT"), ("condition", "TEXT"),
+        ("memo", "TEXT"), ("staff_name", "TEXT"), ("created_at", "TIMESTAMP"),
+    ])
+    _add_columns(conn, "staff", [("password", "TEXT"), ("role", "TEXT"), ("login_token", "TEXT")])
+
+def unify_handover(conn):
+    # 旧 app.py の NOT NULL（h_date/note/staff）が残っていると handover_bp から書けないので作り直す
+    cols = _columns(conn, "handover")
+    if any(nn for c, nn in cols.items() if c != "id"):
+        print("[migrate] handover: rebuild without NOT NULL")
+        seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='handover'").fetchone()
+        conn.execute(HANDOVER_DDL.format(name="handover_new"))
+        common = ", ".join(c for c in cols if c == "id" or c in dict(HANDOVER_COLUMNS))
+        conn.execute(f"INSERT INTO handover_new({common}) SELECT {common} FROM handover")
+        # トリガー（変更ログ・全文検索など）は DROP で一緒に消えるので後続ステップで作り直す
+        conn.execute("DROP TABLE handover")
+        conn.execute("ALTER TABLE handover_new RENAME TO handover")
+        if seq is not None:
+            # 削除済みの大きい id を再利用しない
+            conn.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name='handover'", (seq[0],))
+    else:
+        _add_columns(conn, "handover", HANDOVER_COLUMNS)
+    sync = """
+      h_date = coalesce(h_date, on_date, date(created_at)), on_date = coalesce(on_date, h_date, date(created_at)),
+      note = coalesce(note, body, content, title, ''), body = coalesce(body, content, note),
+      staff = coalesce(staff, created_by, ''), created_by = coalesce(created_by, staff)"""
+    conn.execute(f"UPDATE handover SET {sync}")
+    # どちらの系統で INSERT されても、もう一方の列を埋める
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS handover_sync_insert AFTER INSERT ON handover
+    WHEN NEW.h_date IS NULL OR NEW.on_date IS NULL OR NEW.note IS NULL OR NEW.body IS NULL
+      OR NEW.staff IS NULL OR NEW.created_by IS NULL BEGIN
+      UPDATE handover SET {sync} WHERE id = NEW.id;
+    END""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_handover_date ON handover(h_date, shift)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_handover_on_date ON handover(on_date, shift)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_handover_resident ON handover(resident_id)")
+
+def change_feed(conn):
+    changefeed.install(conn)
+
+def table_versions(conn):
+    versions.install(conn)
+
+def full_text_search(conn):
+    # 本文列の扱いが変わったので引継ぎ側のトリガーは作り直して索引も再構築
+    for op in ("insert", "update", "delete"):
+        conn.execute(f"DROP TRIGGER IF EXISTS handover_fts_{op}")
+    existed = conn.execute("SELECT 1 FROM sqlite_master WHERE name='records_fts'").fetchone() is not None
+    if search.install(conn) and existed:
+        search.rebuild(conn)
+
+def short_term_search(conn):
+    # 3 文字未満の語（「転倒」など）用の 2 文字索引。既存 DB は現在の行から作る
+    search.install(conn)
+
+def daily_rollup(conn):
+    rollup.install(conn)
+
+def initial_admin(conn):
+    # 初回管理者の自動作成（以前は起動のたびに確認していた）
+    if conn.execute("SELECT COUNT(*) FROM staff WHERE role='admin'").fetchone()[0] == 0:
+        conn.execute("INSERT OR IGNORE INTO staff(name,password,role) VALUES(?,?,?)",
+                     ("admin", "admin", "admin"))
+
+# 番号は一度出したら変えない。追加は末尾に
+MIGRATIONS = [
+    (1, "base tables", base_tables),
+    (2, "missing columns", missing_columns),
+    (3, "unify handover columns", unify_handover),
+    (4, "change feed", change_feed),
+    (5, "table versions", table_versions),
+    (6, "full-text search", full_text_search),
+    (7, "daily rollup", daily_rollup),
+    (8, "initial admin", initial_admin),
+    (9, "short-term search index", short_term_search),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+# ===== 実行 =====
+def current(conn):
+    row = conn.execute("PRAGMA user_version").fetchone()
+    return tuple(row.values())[0] if isinstance(row, dict) else row[0]
+
+def pending(conn):
+    v = current(conn)
+    return [m for m in MIGRATIONS if m[0] > v]
+
+def upgrade(conn, target=LATEST):
+    # 1 ステップ 1 トランザクション。失敗したらそのステップを巻き戻して例外を上げる
+    conn.isolation_level = None
+    # 新規 DB は空のうちに incremental vacuum を有効にしておく（WAL 化で見出しが書かれているので VACUUM で反映）
+    if current(conn) == 0 and conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 他のワーカーが先に流していれば飛ばす（ロック取得後に読み直す）
+            if current(conn) >= version:
+                conn.execute("ROLLBACK")
+                continue
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            print(f"[migrate] failed at {version}: {name}")
+            raise
+        print(f"[migrate] {version}: {name}")
+        applied.append(version)
+    return applied
+
+def upgrade_path(db_path, target=LATEST):
+    conn = db_pool.connect(db_path)
+    try:
+        return upgrade(conn, target)
+    finally:
+        conn.close()
+
+def ensure(db_path):
+    # 起動時の入口。最新なら版番号を読んで終わり（接続はプールから借りて返す）
+    p = db_pool.get_pool(db_path)
+    conn = p.acquire()
+    try:
+        if current(conn) >= LATEST:
+            return []
+    finally:
+        p.release(conn)
+    return upgrade_path(db_path)
+
+
+def main():
+    p = argparse.ArgumentParser(description="DBスキーマの版管理（PRAGMA user_version）")
+    p.add_argument("command", choices=["status", "upgrade"])
+    p.add_argument("--db", default=os.environ.get("DB_PATH") or "care.db", help="DBパス（既定: care.db）")
+    p.add_argument("--to", type=int, default=LATEST, help=f"この版まで上げる（既定: {LATEST}）")
+    args = p.parse_args()
+    if args.command == "upgrade":
+        applied = upgrade_path(args.db, args.to)
+        print(f"[OK] applied: {applied or 'none'}")
+        return
+    conn = db_pool.connect(args.db)
+    try:
+        v = current(conn)
+    finally:
+        conn.close()
+    print(f"[INFO] DB: {os.path.abspath(args.db)}  version={v} latest={LATEST}")
+    for version, name, _ in MIGRATIONS:
+        print(f"  [{'x' if version <= v else ' '}] {version:3d} {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+# extras/pool.py
+# SQLite 接続プール（app.py と extras の各 Blueprint で共用）
+from __future__ import annotations
+import atexit, contextlib, os, sqlite3, threading, time
+from urllib.parse import quote
+
+from flask import g, has_app_context
+
+DEFAULT_PRAGMAS = (
+    "PRAGMA foreign_keys=ON;",
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+)
+# 読み取り専用レーン（GET 用）は mode=ro で開き、書き込みは query_only で拒否する
+READONLY_PRAGMAS = (
+    "PRAGMA foreign_keys=ON;",
+    "PRAGMA query_only=ON;",
+)
+DEFAULT_SIZE = int(os.environ.get("DB_POOL_SIZE") or 8)
+# 書き込みレーンは既定 1 本（SQLite の書き手は結局 1 つなので Python 側で順番待ちさせる）
+WRITE_LANE_SIZE = int(os.environ.get("DB_WRITE_POOL_SIZE") or 1)
+DEFAULT_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT") or 10)
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """プールが埋まっていて timeout 内に接続を借りられなかった"""
+
+
+# プールが新しい接続を作るたびに hook(conn, pool) を呼ぶ（extras/archive が読み取りレーンにアーカイブを ATTACH する）
+connect_hooks: list = []
+
+
+# ===== クエリ時間の計測（スレッドごとに積算するのでロック不要。extras/metrics が差分を読む） =====
+_clock = threading.local()
+# 文の実行ごとに hook(cursor, sql, parameters, seconds, many) を呼ぶ（extras/profiler が有効な間だけ設定）
+query_hook = None
+
+def db_time():
+    # このスレッドが DB に使った累計（秒, クエリ数）
+    return getattr(_clock, "seconds", 0.0), getattr(_clock, "queries", 0)
+
+def _spent(seconds, query=False):
+    _clock.seconds = getattr(_clock, "seconds", 0.0) + seconds
+    if query:
+        _clock.queries = getattr(_clock, "queries", 0) + 1
+
+
+class TimedCursor(sqlite3.Cursor):
+    # execute と fetch の時間を数える（SELECT は 2 行目以降を fetch 側で読む）
+    def execute(self, sql, parameters=()):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            dt = time.perf_counter() - t0
+            _spent(dt, True)
+            if query_hook is not None:
+                query_hook(self, sql, parameters, dt, False)
+
+    def executemany(self, sql, seq_of_parameters):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            dt = time.perf_counter() - t0
+            _spent(dt, True)
+            if query_hook is not None:
+                query_hook(self, sql, None, dt, True)
+
+    def executescript(self, sql_script):
+        t0 = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            _spent(time.perf_counter() - t0, True)
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _spent(time.perf_counter() - t0)
+
+    def fetchmany(self, size=None):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            _spent(time.perf_counter() - t0)
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _spent(time.perf_counter() - t0)
+
+    def __next__(self):
+        t0 = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            _spent(time.perf_counter() - t0)
+
+
+class TimedConnection(sqlite3.Connection):
+    # conn.execute() も TimedCursor を通す
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def connect(path, timeout=DEFAULT_TIMEOUT, pragmas=DEFAULT_PRAGMAS, readonly=False):
+    # PRAGMA 設定済みの接続を 1 本作る（プール外で専用接続が必要な場合にも使う）
+    if readonly:
+        conn = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True,
+                               timeout=timeout, check_same_thread=False, factory=TimedConnection)
+    else:
+        conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, factory=TimedConnection)
+    for p in pragmas:
+        conn.execute(p)
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, path, size=None, timeout=DEFAULT_TIMEOUT, pragmas=None, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        if size is None:
+            size = DEFAULT_SIZE if readonly else WRITE_LANE_SIZE
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        if pragmas is None:
+            pragmas = READONLY_PRAGMAS if readonly else DEFAULT_PRAGMAS
+        self.pragmas = tuple(pragmas)
+        self._idle: list[sqlite3.Connection] = []
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._closed = False
+        self._stats = {
+            "created": 0, "acquired": 0, "released": 0, "discarded": 0,
+            "waits": 0, "wait_time": 0.0, "max_wait": 0.0, "timeouts": 0, "in_use": 0,
+        }
+
+    # ===== 貸し出し / 返却 =====
+    def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self._closed:
+                raise sqlite3.ProgrammingError("connection pool is closed")
+            waited = False
+            t0 = time.monotonic()
+            while not self._idle and self._stats["in_use"] >= self.size:
+                waited = True
+                left = deadline - time.monotonic()
+                if left <= 0 or self._closed:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"connection pool exhausted ({self.size} in use)")
+                self._cond.wait(left)
+            if waited:
+                w = time.monotonic() - t0
+                self._stats["waits"] += 1
+                self._stats["wait_time"] += w
+                self._stats["max_wait"] = max(self._stats["max_wait"], w)
+            self._stats["in_use"] += 1
+            self._stats["acquired"] += 1
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._stats["created"] += 1
+        if conn is None:
+            # 接続作成と PRAGMA はロックの外で行う
+            try:
+                conn = connect(self.path, self.timeout, self.pragmas, self.readonly)
+                for hook in connect_hooks:
+                    hook(conn, self)
+            except Exception:
+                with self._cond:
+                    self._stats["in_use"] -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def release(self, conn):
+        # 途中で例外が出た接続は未確定のトランザクションを捨ててから戻す
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+            broken = False
+        except sqlite3.Error:
+            broken = True
+        with self._cond:
+            self._stats["in_use"] -= 1
+            self._stats["released"] += 1
+            if broken or self._closed:
+                self._stats["discarded"] += 1
+                conn.close()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    # ===== リクエスト外（スクリプト / 起動処理）用：スレッドに 1 本 =====
+    def thread_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self.acquire()
+        return conn
+
+    def release_thread_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            self.release(conn)
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            s["idle"] = len(self._idle)
+            s["size"] = self.size
+        s["lane"] = "read" if self.readonly else "write"
+        s["wait_time"] = round(s["wait_time"], 4)
+        s["max_wait"] = round(s["max_wait"], 4)
+        return s
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn in idle:
+            conn.close()
+
+
+# ===== プロセス全体のレジストリ（DB パス × レーンごとに 1 プール） =====
+_pools: dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(path, readonly=False, **kw) -> ConnectionPool:
+    key = (os.path.abspath(path), bool(readonly))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(key[0], readonly=readonly, **kw)
+    return pool
+
+def pool_stats():
+    return {f"{path}:{'read' if ro else 'write'}": p.stats() for (path, ro), p in list(_pools.items())}
+
+def close_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for p in pools:
+        p.close()
+
+atexit.register(close_all)
+
+
+# ===== Flask 連携 =====
+def _request_connection(pool):
+    conns = g.setdefault("_db_conns", {})
+    conn = conns.get(pool)
+    if conn is None:
+        conn = conns[pool] = pool.acquire()
+    return conn
+
+def get_db(pool: ConnectionPool, row_factory=None):
+    # リクエスト中はアプリコンテキストに 1 本だけ借りて使い回す
+    conn = _request_connection(pool) if has_app_context() else pool.thread_connection()
+    conn.row_factory = row_factory
+    return conn
+
+@contextlib.contextmanager
+def borrow(pool: ConnectionPool):
+    # キャッシュ類（名簿・翻訳の版数など）が裏で読むとき用。リクエスト中はそのリクエストの接続を
+    # row_factory も変えずに使う（同じプールから 2 本目を借りると、混んだときに自分同士で詰まる）
+    # リクエスト外では借りて、終わったら返す
+    if has_app_context():
+        yield _request_connection(pool)
+        return
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+def release_db(exc=None, pool=None):
+    # リクエストの接続を返す。pool を渡すとそのレーンの 1 本だけ（コミット直後に書き込みレーンを空けるとき）
+    if pool is not None:
+        if not has_app_context():
+            pool.release_thread_connection()
+            return
+        conn = g.get("_db_conns", {}).pop(pool, None)
+        if conn is not None:
+            pool.release(conn)
+        return
+    conns = g.pop("_db_conns", None)
+    if conns:
+        for pool, conn in conns.items():
+            pool.release(conn)
+
+def init_app(app):
+    # teardown で返却する。複数回呼ばれても登録は 1 回だけ
+    if "db_pool" in app.extensions:
+        return
+    app.extensions["db_pool"] = True
+    app.teardown_appcontext(release_db)
+
+def init_blueprint(bp):
+    # Blueprint を登録したアプリにも teardown を仕込む
+    bp.record_once(lambda state: init_app(state.app))
@@ -0,0 +1,168 @@
+# extras/profiler.py
+# SQL プロファイラ（プール接続のカーソルにフックして文ごとの回数・時間を集計）
+# 遅い文は EXPLAIN QUERY PLAN 付きで記録し、全件走査（SCAN）に印を付ける。リクエスト内の同一文の繰り返し（N+1）も数える
+# 実行中に切り替え可能（既定は SQL_PROFILE の値。無効の間はフックを外すので負荷はない）
+from __future__ import annotations
+import collections, json, os, re, threading, time
+from datetime import datetime
+
+from flask import g, has_request_context, request
+
+from extras import pool as db_pool
+
+SLOW_MS = float(os.environ.get("SQL_SLOW_MS") or 50)
+# 1 リクエストで同じ文がこの回数以上なら N+1 の疑いとして残す
+REPEAT_MIN = int(os.environ.get("SQL_REPEAT_MIN") or 5)
+# 遅い文を JSON Lines で追記するファイル（空なら print のみ）
+SLOW_LOG = os.environ.get("SQL_SLOW_LOG") or ""
+MAX_STATEMENTS = 500
+KEEP_SLOW = 200
+KEEP_REQUESTS = 50
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_WS = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+_lock = threading.Lock()
+_local = threading.local()
+_statements: dict = {}      # 正規化 SQL -> 集計
+_slow = collections.deque(maxlen=KEEP_SLOW)
+_requests = collections.deque(maxlen=KEEP_REQUESTS)
+_norm_cache: dict = {}
+_state = {"enabled": False, "since": None}
+
+
+def normalize(sql):
+    # 空白をつぶし、IN (?,?,…) は件数違いを同じ文として扱う
+    n = _norm_cache.get(sql)
+    if n is None:
+        n = _IN_LIST.sub("(?, …)", _WS.sub(" ", sql).strip())
+        if len(_norm_cache) < 2000:
+            _norm_cache[sql] = n
+    return n
+
+def is_full_scan(detail):
+    # "SCAN records" は全件走査。"SCAN t USING (COVERING) INDEX" と "SCAN CONSTANT ROW" は別扱い
+    return detail.startswith("SCAN ") and " USING " not in detail and detail != "SCAN CONSTANT ROW"
+
+def explain(conn, sql, parameters=()):
+    # [(detail), ...] を返す。説明できない文は []
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return []
+    _local.busy = True
+    try:
+        cur = conn.cursor()
+        cur.row_factory = None
+        return [r[3] for r in cur.execute("EXPLAIN QUERY PLAN " + sql, parameters or ()).fetchall()]
+    except Exception:
+        return []
+    finally:
+        _local.busy = False
+
+
+def _hook(cursor, sql, parameters, seconds, many):
+    if getattr(_local, "busy", False):
+        return
+    key = normalize(sql)
+    with _lock:
+        st = _statements.get(key)
+        if st is None:
+            if len(_statements) >= MAX_STATEMENTS:
+                return
+            st = _statements[key] = {"count": 0, "total": 0.0, "max": 0.0, "plan": None, "full_scan": False}
+        st["count"] += 1
+        st["total"] += seconds
+        st["max"] = max(st["max"], seconds)
+        need_plan = st["plan"] is None and not many
+        if need_plan:
+            st["plan"] = []  # 取得中（他スレッドが重ねて取らないように）
+    if need_plan:
+        plan = explain(cursor.connection, sql, parameters)
+        with _lock:
+            st["plan"] = plan
+            st["full_scan"] = any(is_full_scan(d) for d in plan)
+    if seconds * 1000 >= SLOW_MS:
+        _log_slow(key, seconds, st)
+    if has_request_context():
+        per = g.get("_sql_counts")
+        if per is not None:
+            per[key] = per.get(key, 0) + 1
+
+def _log_slow(key, seconds, st):
+    entry = {"at": datetime.now().isoformat(timespec="seconds"), "ms": round(seconds * 1000, 2),
+             "sql": key, "plan": st["plan"],
+             "full_scan": st["full_scan"],
+             "endpoint": request.endpoint if has_request_context() else None}
+    _slow.append(entry)
+    print(f"[sql-slow] {entry['ms']}ms {'[SCAN] ' if entry['full_scan'] else ''}{key[:200]}")
+    if SLOW_LOG:
+        try:
+            with open(SLOW_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"[sql-slow] log write failed: {e}")
+
+
+# ===== 切り替え =====
+def enable():
+    with _lock:
+        _state.update(enabled=True, since=datetime.now().isoformat(timespec="seconds"))
+    db_pool.query_hook = _hook
+
+def disable():
+    db_pool.query_hook = None
+    with _lock:
+        _state["enabled"] = False
+
+def enabled():
+    return _state["enabled"]
+
+def reset():
+    with _lock:
+        _statements.clear()
+        _slow.clear()
+        _requests.clear()
+
+
+# ===== リクエスト単位 =====
+def _request_start():
+    if _state["enabled"]:
+        g._sql_counts = {}
+        g._sql_t0 = time.perf_counter()
+
+def _request_end(resp):
+    counts = g.pop("_sql_counts", None)
+    if counts is None:
+        return resp
+    total = sum(counts.values())
+    repeated = {k: n for k, n in counts.items() if n >= REPEAT_MIN}
+    resp.headers["X-SQL-Queries"] = f"{total}; distinct={len(counts)}; repeated={len(repeated)}"
+    if request.endpoint not in (None, "static", "admin_profiler"):
+        _requests.append({"at": datetime.now().isoformat(timespec="seconds"), "method": request.method,
+                          "path": request.full_path.rstrip("?"), "endpoint": request.endpoint,
+                          "status": resp.status_code, "queries": total, "distinct": len(counts),
+                          "ms": round((time.perf_counter() - g.pop("_sql_t0")) * 1000, 2),
+                          "repeated": dict(sorted(repeated.items(), key=lambda kv: -kv[1]))})
+    return resp
+
+def init_app(app):
+    if "sql_profiler" in app.extensions:
+        return
+    app.extensions["sql_profiler"] = True
+    app.before_request(_request_start)
+    app.after_request(_request_end)
+    if os.environ.get("SQL_PROFILE", "0").lower() in ("1", "true", "on"):
+        enable()
+
+
+def report(top=50):
+    with _lock:
+        stmts = [{"sql": k, **{f: (round(v, 6) if isinstance(v, float) else v) for f, v in st.items()}}
+                 for k, st in _statements.items()]
+        slow, reqs, state = list(_slow), list(_requests), dict(_state)
+    for s in stmts:
+        s["avg_ms"] = round(s["total"] / s["count"] * 1000, 3) if s["count"] else 0
+    stmts.sort(key=lambda s: -s["total"])
+    return {**state, "slow_ms": SLOW_MS, "repeat_min": REPEAT_MIN, "statements": stmts[:top],
+            "full_scans": [s for s in stmts if s["full_scan"]],
+            "slow": slow[::-1], "requests": reqs[::-1]}
@@ -0,0 +1,90 @@
+# extras/qrcache.py
+# ログイン用 QR の PNG を (URL, サイズ) ごとにメモリへ LRU で保持する（qrcode + PIL の再描画を避ける）
+from __future__ import annotations
+import collections, hashlib, io, os, threading
+
+from flask import Response, request
+
+MAX_ENTRIES = int(os.environ.get("QR_CACHE_SIZE") or 256)
+# 管理者しか見ない画像なのでブラウザ側だけに持たせる
+MAX_AGE = int(os.environ.get("QR_MAX_AGE") or 3600)
+SIZES = range(1, 21)  # qrcode の box_size（None は既定の 10）
+
+
+def login_url(token):
+    host = request.host.split(":")[0]
+    return f"http://{host}:5000/login/{token}"
+
+def render(url, size=None):
+    import qrcode  # PIL ごと重いので、最初に描くときに読む
+    img = qrcode.make(url, box_size=size) if size else qrcode.make(url)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class QRCache:
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._items: collections.OrderedDict = collections.OrderedDict()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, url, size=None):
+        # (png, etag) を返す。無ければ描画して入れる（描画はロックの外）
+        key = (url, size)
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return hit
+            self.misses += 1
+        png = render(url, size)
+        item = (png, hashlib.blake2s(png, digest_size=12).hexdigest())
+        with self._lock:
+            self._items[key] = item
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self.evictions += 1
+        return item
+
+    def invalidate_token(self, token):
+        # 再発行で無効になったトークンの画像を捨てる（ホスト名・サイズ違いもまとめて）
+        if not token:
+            return 0
+        suffix = f"/login/{token}"
+        with self._lock:
+            keys = [k for k in self._items if k[0].endswith(suffix)]
+            for k in keys:
+                del self._items[k]
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def stats(self):
+        with self._lock:
+            n = len(self._items)
+            nbytes = sum(len(v[0]) for v in self._items.values())
+        total = self.hits + self.misses
+        return {"entries": n, "max_entries": self.max_entries, "bytes": nbytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / total, 3) if total else None}
+
+
+# プロセス全体で共有（app.py と staff_admin / staff_amin）
+qr_cache = QRCache()
+
+def png_response(url, size=None, max_age=MAX_AGE):
+    # ETag / Cache-Control 付きの PNG。If-None-Match が一致すれば 304
+    png, etag = qr_cache.get(url, size)
+    resp = Response(png, mimetype="image/png")
+    resp.set_etag(etag)
+    resp.cache_control.private = True
+    resp.cache_control.max_age = max_age
+    return resp.make_conditional(request)
+
+def size_arg():
+    size = request.args.get("size", type=int)
+    return size if size in SIZES else None
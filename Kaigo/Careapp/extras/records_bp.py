@@ -1,9 +1,12 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from functools import wraps
-from extras.db import get_conn
+from extras.db import get_conn, get_roster, init_blueprint, run_write
 from extras.i18n import _, T, get_lang
+from extras import fragcache
 
 records_bp = Blueprint("records_bp", __name__)
+init_blueprint(records_bp)
+fragcache.init_blueprint(records_bp)
 
 def login_required(f):
     @wraps(f)
@@ -17,7 +20,7 @@ def login_required(f):
 @records_bp.route("/records")
 @login_required
 def records():
-    with get_conn() as conn:
+    with get_conn(readonly=True) as conn, fragcache.snapshot(conn, ("records", "users")) as versions:
         c = conn.cursor()
         c.execute("""
           SELECT r.id, u.name, r.meal, r.medication, r.toilet, r.condition, r.memo, r.staff_name, r.created_at
@@ -25,16 +28,11 @@ def records():
           ORDER BY r.id DESC
         """)
         rows = c.fetchall()
-    return render_template("records.html", rows=rows)
+    return render_template("records.html", rows=rows, versions=versions)
 
 @records_bp.route("/add_record", methods=["GET","POST"])
 @login_required
 def add_record():
-    with get_conn() as conn:
-        c = conn.cursor()
-        c.execute("SELECT id, name FROM users ORDER BY id")
-        users = c.fetchall()
-
     MEAL_CHOICES = T[get_lang()]["meal_choices"]
     MEDICATION_CHOICES = T[get_lang()]["med_choices"]
     TOILET_CHOICES = T[get_lang()]["toilet_choices"]
@@ -53,19 +51,18 @@ def add_record():
         memo = request.form.get("memo")
         staff_name = session.get("staff_name")
 
-        with get_conn() as conn:
-            c = conn.cursor()
-            c.execute("""
+        run_write(lambda w: w.execute("""
                 INSERT INTO records(user_id,meal,medication,toilet,condition,memo,staff_name)
                 VALUES(?,?,?,?,?,?,?)
-            """,(user_id,meal,medication,toilet,condition,memo,staff_name))
-            conn.commit()
+            """,(user_id,meal,medication,toilet,condition,memo,staff_name)).lastrowid)
         flash(_("rec_saved"))
         return redirect(url_for("records_bp.records"))
 
+    users, versions = get_roster().snapshot()
     return render_template(
         "add_record.html",
         users=users,
+        versions=versions,
         MEAL_CHOICES=MEAL_CHOICES,
         MEDICATION_CHOICES=MEDICATION_CHOICES,
         TOILET_CHOICES=TOILET_CHOICES,
@@ -0,0 +1,182 @@
+# extras/rollup.py
+# 利用者ごと・日ごとの集計（resident_daily_summary）。記録の追加/削除でトリガーが差分更新する
+from __future__ import annotations
+import argparse, os, sqlite3
+from contextlib import contextmanager
+
+# 自由入力の値を分類する。画面の選択肢（extras/i18n.T と add_record.html）の日英両方を拾う
+CATEGORIES = {
+    "meal": {
+        "meal_full":   ("全量", "完食", "All"),
+        "meal_most":   ("8割", "80%"),
+        "meal_half":   ("半分", "Half"),
+        "meal_little": ("1/3", "One third"),
+        "meal_none":   ("ほぼ食べず", "食べられない", "Barely"),
+    },
+    "medication": {
+        "med_done":    ("済", "服用済み", "Done"),
+        "med_partial": ("一部", "Partial"),
+        "med_missed":  ("未", "忘れ", "拒否", "Not yet"),
+        "med_self":    ("自己管理", "Self"),
+    },
+    "toilet": {
+        "toilet_assisted":     ("誘導", "介助", "介助あり", "Guided", "Assisted"),
+        "toilet_incontinence": ("失禁あり", "Incontinence"),
+    },
+    "condition": {
+        "cond_watch":  ("要観察", "不調", "Watch"),
+        "cond_doctor": ("受診", "Visit doctor"),
+        "cond_fever":  ("発熱(37.5℃～)", "発熱", "Fever (37.5℃~)"),
+    },
+}
+# 選択肢にない値（その他の自由入力）の件数も持つ
+OTHER_COLS = {"meal": "meal_other", "medication": "med_other"}
+
+COUNT_COLS = [c for cats in CATEGORIES.values() for c in cats] + list(OTHER_COLS.values())
+# created_at は UTC の CURRENT_TIMESTAMP なので表示日（ローカル日付）に直す
+DAY_MODIFIER = "localtime"
+
+def _day(ref):
+    return f"date(coalesce({ref}.created_at, CURRENT_TIMESTAMP), '{DAY_MODIFIER}')"
+
+def _lit(v):
+    return "'" + v.replace("'", "''") + "'"
+
+def _count_exprs(ref):
+    exprs = []
+    for field, cats in CATEGORIES.items():
+        for col, values in cats.items():
+            exprs.append(f"(CASE WHEN {ref}.{field} IN ({', '.join(map(_lit, values))}) THEN 1 ELSE 0 END)")
+    for field, col in OTHER_COLS.items():
+        known = [v for values in CATEGORIES[field].values() for v in values]
+        exprs.append(f"(CASE WHEN coalesce({ref}.{field}, '') != '' AND {ref}.{field} NOT IN "
+                     f"({', '.join(map(_lit, known))}) THEN 1 ELSE 0 END)")
+    return exprs
+
+def _add_sql(ref):
+    cols = ", ".join(COUNT_COLS)
+    vals = ", ".join(_count_exprs(ref))
+    sets = ", ".join(f"{c} = {c} + excluded.{c}" for c in COUNT_COLS)
+    return f"""
+      INSERT INTO resident_daily_summary(user_id, day, record_count, {cols}, last_record_id, last_staff)
+      VALUES({ref}.user_id, {_day(ref)}, 1, {vals}, {ref}.id, {ref}.staff_name)
+      ON CONFLICT(user_id, day) DO UPDATE SET
+        record_count = record_count + 1, {sets},
+        last_staff = CASE WHEN excluded.last_record_id >= coalesce(last_record_id, 0)
+                          THEN excluded.last_staff ELSE last_staff END,
+        last_record_id = max(coalesce(last_record_id, 0), excluded.last_record_id);"""
+
+def _remove_sql(ref):
+    sets = ", ".join(f"{c} = {c} - {e}" for c, e in zip(COUNT_COLS, _count_exprs(ref)))
+    latest = (f"(SELECT {{col}} FROM records WHERE user_id = {ref}.user_id AND {_day('records')} = "
+              f"resident_daily_summary.day ORDER BY id DESC LIMIT 1)")
+    return f"""
+      UPDATE resident_daily_summary SET
+        record_count = record_count - 1, {sets},
+        last_staff = CASE WHEN last_record_id = {ref}.id THEN {latest.format(col="staff_name")} ELSE last_staff END,
+        last_record_id = CASE WHEN last_record_id = {ref}.id THEN {latest.format(col="id")} ELSE last_record_id END
+      WHERE user_id = {ref}.user_id AND day = {_day(ref)};
+      DELETE FROM resident_daily_summary
+       WHERE user_id = {ref}.user_id AND day = {_day(ref)} AND record_count <= 0;"""
+
+def install(conn):
+    created = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name='resident_daily_summary'").fetchone() is None
+    count_ddl = ",\n      ".join(f"{c} INTEGER NOT NULL DEFAULT 0" for c in COUNT_COLS)
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS resident_daily_summary(
+      user_id INTEGER NOT NULL,
+      day TEXT NOT NULL,
+      record_count INTEGER NOT NULL DEFAULT 0,
+      {count_ddl},
+      last_record_id INTEGER,
+      last_staff TEXT,
+      PRIMARY KEY(user_id, day)
+    ) WITHOUT ROWID""")
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS records_rollup_insert AFTER INSERT ON records BEGIN
+      {_add_sql("NEW")}
+    END""")
+    # rollup_pause に行がある間（アーカイブへの移動中）は削除を集計から引かない
+    conn.execute("CREATE TABLE IF NOT EXISTS rollup_pause(flag INTEGER)")
+    old = conn.execute("SELECT sql FROM sqlite_master WHERE name='records_rollup_delete'").fetchone()
+    if old is not None and "rollup_pause" not in (old["sql"] if isinstance(old, dict) else old[0]):
+        conn.execute("DROP TRIGGER records_rollup_delete")
+    # 利用者削除（CASCADE）時は利用者側のトリガーでまとめて消すので 1 件ずつは引かない
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS records_rollup_delete AFTER DELETE ON records
+    WHEN EXISTS (SELECT 1 FROM users WHERE id = OLD.user_id)
+     AND NOT EXISTS (SELECT 1 FROM rollup_pause) BEGIN
+      {_remove_sql("OLD")}
+    END""")
+    # created_at が NULL → 値入り（旧 DB の補完トリガー）の更新は日付が変わらないので無視
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS records_rollup_update
+    AFTER UPDATE OF user_id, meal, medication, toilet, condition, staff_name, created_at ON records
+    WHEN OLD.created_at IS NOT NULL BEGIN
+      {_remove_sql("OLD")}
+      {_add_sql("NEW")}
+    END""")
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS users_rollup_delete AFTER DELETE ON users BEGIN
+      DELETE FROM resident_daily_summary WHERE user_id = OLD.id;
+    END""")
+    if created:
+        backfill(conn)
+
+@contextmanager
+def paused(conn):
+    # 同じトランザクション内で使う（他の接続からは行が見えない）
+    conn.execute("INSERT INTO rollup_pause(flag) VALUES(1)")
+    try:
+        yield
+    finally:
+        conn.execute("DELETE FROM rollup_pause")
+
+def backfill(conn):
+    # 全記録から集計し直す（既存 DB の初回や不整合時）
+    cols = ", ".join(COUNT_COLS)
+    sums = ", ".join(f"SUM{e}" for e in _count_exprs("records"))
+    conn.execute("DELETE FROM resident_daily_summary")
+    conn.execute(f"""
+    INSERT INTO resident_daily_summary(user_id, day, record_count, {cols}, last_record_id)
+    SELECT user_id, {_day("records")}, COUNT(*), {sums}, MAX(id)
+      FROM records
+     WHERE user_id IN (SELECT id FROM users)
+     GROUP BY user_id, {_day("records")}""")
+    conn.execute("""
+    UPDATE resident_daily_summary
+       SET last_staff = (SELECT staff_name FROM records WHERE id = resident_daily_summary.last_record_id)""")
+
+def summary(conn, user_id, days=30):
+    # 直近 days 日分の日別行と期間合計を返す
+    cur = conn.execute(f"""
+    SELECT day, record_count, {", ".join(COUNT_COLS)}, last_staff
+      FROM resident_daily_summary
+     WHERE user_id = ? AND day >= date('now', '{DAY_MODIFIER}', ?)
+     ORDER BY day""", (user_id, f"-{int(days) - 1} days"))
+    rows = cur.fetchall()
+    if rows and not isinstance(rows[0], dict):
+        names = [d[0] for d in cur.description]
+        rows = [dict(zip(names, r)) for r in rows]
+    totals = {c: sum(r[c] for r in rows) for c in ["record_count"] + COUNT_COLS}
+    return {"user_id": user_id, "days": int(days), "daily": rows, "totals": totals}
+
+
+def main():
+    p = argparse.ArgumentParser(description="利用者日次集計（resident_daily_summary）の作成・再集計")
+    p.add_argument("command", choices=["backfill"])
+    p.add_argument("--db", default=os.environ.get("DB_PATH") or "care.db", help="DBパス（既定: care.db）")
+    args = p.parse_args()
+    conn = sqlite3.connect(args.db)
+    try:
+        install(conn)
+        backfill(conn)
+        conn.commit()
+        n = conn.execute("SELECT COUNT(*) FROM resident_daily_summary").fetchone()[0]
+        print(f"[OK] backfill: {n} rows")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# extras/roster.py
+# 利用者名簿（id と名前だけ）のプロセス内キャッシュ。記録入力の選択肢や user_id の検証で DB を読まない
+# 同じプロセスの追加・削除は invalidate() ですぐ反映。他ワーカーの変更は table_versions を間隔をあけて見て拾う
+from __future__ import annotations
+import os, threading, time
+from typing import NamedTuple
+
+from extras import pool as db_pool
+from extras.versions import get_versions
+
+# 他ワーカーの変更を確認する間隔（秒）
+CHECK_INTERVAL = float(os.environ.get("ROSTER_CHECK_INTERVAL") or 5)
+
+
+class Resident(NamedTuple):
+    # テンプレからは u.id / u.name、u[0] / u[1] のどちらでも読める
+    id: int
+    name: str
+
+
+class Roster:
+    def __init__(self, db_path, check_interval=CHECK_INTERVAL):
+        self.db_path = db_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self.residents: tuple = ()
+        self.by_id: dict = {}
+        self.version = None
+        # (名簿, 版数) の組。別々の属性だと読み直しの途中で食い違うので 1 つで持つ
+        self._current = ((), None)
+        self._next_check = 0.0
+        self._stale = True
+        self.loads = self.hits = 0
+
+    def _read_version(self, conn):
+        return get_versions(conn, ["users"]).get("users", (0, None))[0]
+
+    def _fresh(self):
+        # 読み直しが要らなければ True。間隔が来たときだけ版数を 1 行読む
+        if self._stale:
+            return False
+        if time.monotonic() < self._next_check:
+            return True
+        with db_pool.borrow(db_pool.get_pool(self.db_path, readonly=True)) as conn:
+            version = self._read_version(conn)
+        self._next_check = time.monotonic() + self.check_interval
+        if version != self.version:
+            # ロック内の再確認は間隔内なので True を返してしまう。読み直しが要ることを残しておく
+            self._stale = True
+            return False
+        return True
+
+    def _load(self):
+        with db_pool.borrow(db_pool.get_pool(self.db_path, readonly=True)) as conn:
+            # 版数と名簿を同じ読み取りトランザクションで取る（リクエストの接続が取引中ならその中で読む）
+            own = not conn.in_transaction
+            if own:
+                conn.execute("BEGIN")
+            try:
+                version = self._read_version(conn)
+                rows = conn.execute("SELECT id, name FROM users ORDER BY id").fetchall()
+            finally:
+                if own:
+                    conn.execute("COMMIT")
+        residents = tuple(Resident(*(tuple(r.values()) if isinstance(r, dict) else tuple(r))) for r in rows)
+        self.residents, self.by_id = residents, {r.id: r.name for r in residents}
+        self.version, self._stale = version, False
+        self._current = (residents, version)
+        self._next_check = time.monotonic() + self.check_interval
+        self.loads += 1
+
+    def get(self):
+        if self._fresh():
+            self.hits += 1
+            return self.residents
+        with self._lock:
+            if not self._fresh():
+                self._load()
+        return self.residents
+
+    def snapshot(self):
+        # 名簿と、それを読んだときの users の版数（fragment(versions=...) のキーに使う）
+        self.get()
+        residents, version = self._current
+        return residents, {"users": version}
+
+    def invalidate(self):
+        # 利用者の追加・削除のあとに呼ぶ（次の get で読み直す）
+        self._stale = True
+
+    def name(self, user_id):
+        self.get()
+        return self.by_id.get(user_id)
+
+    def known(self, ids):
+        # 名簿にある id の集合。名簿に無い分だけ DB で確かめる（他ワーカーが追加した直後など）
+        self.get()
+        known = {i for i in ids if i in self.by_id}
+        missing = [i for i in ids if i not in self.by_id]
+        if missing:
+            with db_pool.borrow(db_pool.get_pool(self.db_path, readonly=True)) as conn:
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i:i+500]
+                    rows = conn.execute(
+                        f"SELECT id FROM users WHERE id IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+                    known |= {(tuple(r.values()) if isinstance(r, dict) else tuple(r))[0] for r in rows}
+            if known.difference(self.by_id):
+                self.invalidate()
+        return known
+
+    def stats(self):
+        return {"residents": len(self.residents), "version": self.version,
+                "loads": self.loads, "hits": self.hits}
+
+
+# DB パスごとに 1 つ
+_rosters: dict = {}
+_rosters_lock = threading.Lock()
+
+def get_roster(db_path) -> Roster:
+    key = os.path.abspath(db_path)
+    r = _rosters.get(key)
+    if r is None:
+        with _rosters_lock:
+            r = _rosters.setdefault(key, Roster(key))
+    return r
@@ -0,0 +1,226 @@
+# extras/search.py
+# 記録メモ / 引継ぎ本文の全文検索（SQLite FTS5 + trigram。トリガーで同期）
+# trigram は 3 文字未満の語を引けないので、本文を 2 文字ずつ区切った索引（*_grams）も持ち、短い語はそちらで引く
+from __future__ import annotations
+import argparse, os, sqlite3
+
+# これより短い語は 2 文字索引で引く（候補の行だけ LIKE で確かめる）
+MIN_MATCH_LEN = 3
+# 引継ぎの本文は系統ごとに note / body / content のどれかに入る（migrations で相互に埋める）ので最初の 1 つを使う
+HANDOVER_TITLE_COL = "title"
+HANDOVER_TEXT_COLS = ("note", "body", "content")
+
+def _columns(conn, table):
+    rows = conn.execute("SELECT name FROM pragma_table_info(?)", (table,)).fetchall()
+    return [r["name"] if isinstance(r, dict) else r[0] for r in rows]
+
+def _handover_text(conn, ref):
+    have = _columns(conn, "handover")
+    body = [f"{ref}.{c}" for c in HANDOVER_TEXT_COLS if c in have] or [f"{ref}.note"]
+    text = f"coalesce({', '.join(body)}, '')"
+    if HANDOVER_TITLE_COL in have:
+        text = f"coalesce({ref}.{HANDOVER_TITLE_COL}, '') || ' ' || " + text
+    return text
+
+def _grams(expr):
+    # expr を 1 文字ずつずらして 2 文字ずつ切り出し、空白区切りにする（最後は 1 文字）
+    # 例: '転倒あり' → '転倒 倒あ あり り'。トリガー内では WITH が使えないので json_each で 0..長さ-1 を作る
+    return f"""
+      SELECT group_concat(substr(t.s, p.key + 1, 2), ' ') AS g
+        FROM (SELECT {expr} AS s) t,
+             json_each('[' || rtrim(replace(hex(zeroblob(length(t.s))), '00', '0,'), ',') || ']') p
+      HAVING count(*) > 0"""
+
+def _install_grams(conn):
+    # 短い語用の索引。新しく作ったときは True
+    created = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name='records_grams'").fetchone() is None
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS records_grams USING fts5(grams, tokenize='unicode61 remove_diacritics 0')")
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS handover_grams USING fts5(grams, tokenize='unicode61 remove_diacritics 0')")
+    text = _handover_text(conn, "NEW")
+    for tbl, when, expr in (("records", "AFTER INSERT", "NEW.memo"),
+                            ("records", "AFTER UPDATE OF memo", "NEW.memo"),
+                            ("handover", "AFTER INSERT", text),
+                            ("handover", "AFTER UPDATE", text)):
+        op = when.split()[1].lower()
+        delete = f"DELETE FROM {tbl}_grams WHERE rowid = OLD.id;" if op == "update" else ""
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {tbl}_grams_{op} {when} ON {tbl} BEGIN
+          {delete}
+          INSERT INTO {tbl}_grams(rowid, grams) SELECT NEW.id, g FROM ({_grams(expr)}) WHERE g IS NOT NULL;
+        END""")
+    for tbl in ("records", "handover"):
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {tbl}_grams_delete AFTER DELETE ON {tbl} BEGIN
+          DELETE FROM {tbl}_grams WHERE rowid = OLD.id;
+        END""")
+    return created
+
+def _rebuild_grams(conn):
+    conn.execute("DELETE FROM records_grams")
+    conn.execute(f"""
+      INSERT INTO records_grams(rowid, grams)
+      SELECT r.id, ({_grams("r.memo")}) FROM records r WHERE r.memo IS NOT NULL AND r.memo != ''""")
+    conn.execute("DELETE FROM handover_grams")
+    conn.execute(f"""
+      INSERT INTO handover_grams(rowid, grams)
+      SELECT h.id, g FROM (SELECT h.id, ({_grams(_handover_text(conn, "h"))}) AS g FROM handover h) h
+       WHERE g IS NOT NULL""")
+    conn.execute("INSERT INTO records_grams(records_grams) VALUES('optimize')")
+    conn.execute("INSERT INTO handover_grams(handover_grams) VALUES('optimize')")
+
+def install(conn):
+    # FTS5 が無いビルドでは何もしない（False を返す）。新規作成時は既存行から索引を作る
+    created = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name='records_fts'").fetchone() is None
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(memo, tokenize='trigram')")
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS handover_fts USING fts5(text, tokenize='trigram')")
+    except sqlite3.OperationalError as e:
+        print(f"[search] FTS5 unavailable: {e}")
+        return False
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS records_fts_insert AFTER INSERT ON records BEGIN
+      INSERT INTO records_fts(rowid, memo) VALUES (NEW.id, NEW.memo);
+    END""")
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS records_fts_update AFTER UPDATE OF memo ON records BEGIN
+      DELETE FROM records_fts WHERE rowid = OLD.id;
+      INSERT INTO records_fts(rowid, memo) VALUES (NEW.id, NEW.memo);
+    END""")
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS records_fts_delete AFTER DELETE ON records BEGIN
+      DELETE FROM records_fts WHERE rowid = OLD.id;
+    END""")
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS handover_fts_insert AFTER INSERT ON handover BEGIN
+      INSERT INTO handover_fts(rowid, text) VALUES (NEW.id, {_handover_text(conn, "NEW")});
+    END""")
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS handover_fts_update AFTER UPDATE ON handover BEGIN
+      DELETE FROM handover_fts WHERE rowid = OLD.id;
+      INSERT INTO handover_fts(rowid, text) VALUES (NEW.id, {_handover_text(conn, "NEW")});
+    END""")
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS handover_fts_delete AFTER DELETE ON handover BEGIN
+      DELETE FROM handover_fts WHERE rowid = OLD.id;
+    END""")
+    grams_created = _install_grams(conn)
+    if created:
+        rebuild(conn)
+    elif grams_created:
+        _rebuild_grams(conn)
+    return True
+
+def rebuild(conn):
+    # 既存 DB 向け：索引を作り直す
+    conn.execute("DELETE FROM records_fts")
+    conn.execute("INSERT INTO records_fts(rowid, memo) SELECT id, memo FROM records WHERE memo IS NOT NULL AND memo != ''")
+    conn.execute("DELETE FROM handover_fts")
+    conn.execute(f"INSERT INTO handover_fts(rowid, text) SELECT h.id, {_handover_text(conn, 'h')} FROM handover h")
+    conn.execute("INSERT INTO records_fts(records_fts) VALUES('optimize')")
+    conn.execute("INSERT INTO handover_fts(handover_fts) VALUES('optimize')")
+    _rebuild_grams(conn)
+
+def _quote(t):
+    return '"' + t.replace('"', '""') + '"'
+
+def _terms(q):
+    # 空白区切りの語を AND。長い語は trigram の MATCH（フレーズ）
+    # 短い語は 2 文字索引の MATCH（2 文字は完全一致、1 文字は前方一致）で候補を絞り、LIKE で確かめる
+    match, grams, like = [], [], []
+    for t in (q or "").split():
+        if len(t) >= MIN_MATCH_LEN:
+            match.append(_quote(t))
+            continue
+        if all(ch.isalnum() for ch in t):
+            # 記号は unicode61 では区切り扱いで索引に無いので LIKE だけ
+            grams.append(_quote(t) + ("" if len(t) == 2 else "*"))
+        like.append("%" + t.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+    return " AND ".join(match), " AND ".join(grams), like
+
+def search(conn, kind, q, user_id=None, staff=None, date_from=None, date_to=None,
+           limit=20, offset=0):
+    # (rows, has_more) を返す。rows は dict
+    match, grams, like = _terms(q)
+    if not match and not like:
+        return [], False
+    fts = "records_fts" if kind == "records" else "handover_fts"
+    col = "memo" if kind == "records" else "text"
+    where, params = [], []
+    # 長い語があればその MATCH で絞り、短い語は LIKE で確かめるだけ（2 文字索引も引くと行ごとに MATCH し直して遅い）
+    # 短い語だけのときは 2 文字索引を新しい順に読む（一致が多い語でも全件を並べ替えずに LIMIT で止まる）
+    by_grams = bool(grams) and not match
+    source = f"{kind}_grams JOIN {fts} ON {fts}.rowid = {kind}_grams.rowid" if by_grams else fts
+    if match:
+        where.append(f"{fts} MATCH ?"); params.append(match)
+    if by_grams:
+        where.append(f"{kind}_grams MATCH ?"); params.append(grams)
+    for pat in like:
+        where.append(f"{fts}.{col} LIKE ? ESCAPE '\\'"); params.append(pat)
+    if kind == "records":
+        select = f"""
+        SELECT r.id, r.user_id, u.name AS user_name, r.staff_name AS staff, r.created_at,
+               {"snippet(records_fts, 0, '[', ']', '…', 16)" if match else "substr(records_fts.memo, 1, 80)"} AS snippet
+          FROM {source}
+          JOIN records r ON r.id = records_fts.rowid
+          JOIN users u ON u.id = r.user_id"""
+        if user_id is not None:
+            where.append("r.user_id = ?"); params.append(user_id)
+        if staff:
+            where.append("r.staff_name = ?"); params.append(staff)
+        date_col = "r.created_at"
+        id_col = "r.id"
+    else:
+        select = f"""
+        SELECT h.id, h.h_date, h.shift, h.staff, h.created_at,
+               {"snippet(handover_fts, 0, '[', ']', '…', 16)" if match else "substr(handover_fts.text, 1, 80)"} AS snippet
+          FROM {source}
+          JOIN handover h ON h.id = handover_fts.rowid"""
+        if user_id is not None:
+            where.append("h.resident_id = ?"); params.append(user_id)
+        if staff:
+            where.append("h.staff = ?"); params.append(staff)
+        date_col = "h.h_date"
+        id_col = "h.id"
+    if date_from:
+        where.append(f"{date_col} >= ?"); params.append(date_from)
+    if date_to:
+        where.append(f"{date_col} < date(?, '+1 day')"); params.append(date_to)
+    order = (f"bm25({fts}), {id_col} DESC" if match else
+             f"{kind}_grams.rowid DESC" if by_grams else f"{id_col} DESC")
+    sql = select + " WHERE " + " AND ".join(where) + f" ORDER BY {order} LIMIT ? OFFSET ?"
+    cur = conn.execute(sql, params + [limit + 1, offset])
+    rows = cur.fetchall()
+    if rows and not isinstance(rows[0], dict):
+        names = [d[0] for d in cur.description]
+        rows = [dict(zip(names, r)) for r in rows]
+    return rows[:limit], len(rows) > limit
+
+
+def main():
+    p = argparse.ArgumentParser(description="全文検索索引の作成・再構築")
+    p.add_argument("command", choices=["rebuild", "query"])
+    p.add_argument("q", nargs="?", help="query 時の検索語")
+    p.add_argument("--kind", choices=["records", "handover"], default="records")
+    p.add_argument("--db", default=os.environ.get("DB_PATH") or "care.db", help="DBパス（既定: care.db）")
+    args = p.parse_args()
+    conn = sqlite3.connect(args.db)
+    try:
+        if not install(conn):
+            raise SystemExit(1)
+        if args.command == "rebuild":
+            rebuild(conn)
+            conn.commit()
+            n = conn.execute("SELECT COUNT(*) FROM records_fts").fetchone()[0]
+            m = conn.execute("SELECT COUNT(*) FROM handover_fts").fetchone()[0]
+            print(f"[OK] rebuild: records={n} handover={m}")
+        else:
+            rows, _ = search(conn, args.kind, args.q)
+            for r in rows:
+                print(r)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# extras/sse.py
+# Server-Sent Events の簡易ブロードキャスタ（プロセス内ファンアウト）
+from __future__ import annotations
+import collections, json, os, queue, threading
+
+MAX_SUBSCRIBERS = int(os.environ.get("SSE_MAX_SUBSCRIBERS") or 50)
+HEARTBEAT_SEC = float(os.environ.get("SSE_HEARTBEAT_SEC") or 15)
+RETRY_MS = 3000
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Broadcaster:
+    def __init__(self, max_subscribers=MAX_SUBSCRIBERS, backlog=200, queue_size=100):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subs: set[queue.Queue] = set()
+        # 再接続（Last-Event-ID）用に直近のイベントを保持
+        self._recent = collections.deque(maxlen=backlog)
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, event_id, data, **attrs):
+        ev = (event_id, data, attrs)
+        with self._lock:
+            self._recent.append(ev)
+            self.published += 1
+            subs = list(self._subs)
+        for q in subs:
+            try:
+                q.put_nowait(ev)
+            except queue.Full:
+                # 読まない購読者は切る（次回 Last-Event-ID で取り直してもらう）
+                self.dropped += 1
+                self.unsubscribe(q)
+
+    def subscribe(self):
+        with self._lock:
+            if len(self._subs) >= self.max_subscribers:
+                raise TooManySubscribers()
+            q = queue.Queue(maxsize=self.queue_size)
+            self._subs.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subs.discard(q)
+        # ストリーム側に終了を知らせる（詰まっていれば古いものを捨てて入れる）
+        while True:
+            try:
+                q.put_nowait(None)
+                return
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def replay(self, last_id):
+        # バッファで賄えれば last_id より後のイベントを返す。賄えなければ None（呼び出し側は DB から取る）
+        # 賄える = バッファが last_id の次から途切れずに持っている。空（再起動直後）や、
+        # 他ワーカーの書き込みで id が飛んでいるときは取りこぼしがあり得るので None
+        with self._lock:
+            recent = sorted(self._recent, key=lambda ev: ev[0])
+        if not recent or recent[0][0] > last_id + 1:
+            return None
+        out, expect = [], None
+        for ev in recent:
+            if ev[0] <= last_id:
+                continue
+            if ev[0] != (last_id + 1 if expect is None else expect):
+                return None
+            out.append(ev)
+            expect = ev[0] + 1
+        return out
+
+    def stats(self):
+        with self._lock:
+            n = len(self._subs)
+        return {"subscribers": n, "max_subscribers": self.max_subscribers,
+                "published": self.published, "dropped": self.dropped}
+
+
+def format_event(event_id, data, event="message"):
+    body = json.dumps(data, ensure_ascii=False)
+    return f"id: {event_id}\nevent: {event}\ndata: {body}\n\n"
+
+def stream(broadcaster, q, match, initial=(), event="message", last_id=None, heartbeat=HEARTBEAT_SEC):
+    # 購読キューを読み出して SSE テキストを返すジェネレータ
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        sent = last_id if last_id is not None else -1
+        for event_id, data, attrs in initial:
+            if event_id > sent and match(attrs):
+                sent = event_id
+                yield format_event(event_id, data, event)
+        while True:
+            try:
+                ev = q.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+            if ev is None:
+                return
+            event_id, data, attrs = ev
+            # replay と購読キューの重複は id で除く
+            if event_id > sent and match(attrs):
+                sent = event_id
+                yield format_event(event_id, data, event)
+    finally:
+        broadcaster.unsubscribe(q)
+
+
+# 引継ぎボード用（app.py と handover_bp で共有）
+handover_events = Broadcaster()
+
+# 配信する引継ぎの形（どちらの書き込み経路でもこの SELECT で読み直して同じ形で流す）
+HANDOVER_SELECT = """
+        SELECT id, h_date, shift, note, staff, created_at
+          FROM handover"""
+
+def publish_handover(conn, handover_id):
+    # 追加した引継ぎを読み直して配信する。dict で返す（見つからなければ None）
+    cur = conn.execute(HANDOVER_SELECT + " WHERE id=?", (handover_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    if not isinstance(row, dict):
+        row = dict(zip([d[0] for d in cur.description], row))
+    handover_events.publish(row["id"], row, date=row["h_date"], shift=row["shift"])
+    return row
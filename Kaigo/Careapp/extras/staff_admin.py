@@ -1,9 +1,15 @@
 # extras/staff_admin.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, session, current_app
-import sqlite3, secrets, qrcode, io, os
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
+import sqlite3, secrets, os
 from functools import wraps
+from extras import pool as db_pool
+from extras import qrcache
+from extras.qrcache import qr_cache
+from extras import fragcache
 
 staff_admin_bp = Blueprint("staff_admin", __name__, url_prefix="/admin/staff")
+db_pool.init_blueprint(staff_admin_bp)
+fragcache.init_blueprint(staff_admin_bp)
 
 # -------------------------
 # adminチェック（app.pyと独立させるためここで定義）
@@ -24,8 +30,8 @@ def _db_path():
     # app.config['DB_PATH'] があればそれを使う。なければプロジェクト直下の care.db
     return current_app.config.get("DB_PATH", os.path.join(current_app.root_path, "care.db"))
 
-def get_connection():
-    return sqlite3.connect(_db_path(), timeout=10, check_same_thread=False)
+def get_connection(readonly=False):
+    return db_pool.get_db(db_pool.get_pool(_db_path(), readonly=readonly))
 
 # -------------------------
 # 一覧
@@ -33,11 +39,12 @@ def get_connection():
 @staff_admin_bp.route("/", methods=["GET"])
 @admin_required
 def list():
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn, fragcache.snapshot(conn, ("staff",)) as versions:
         c = conn.cursor()
+        c.row_factory = sqlite3.Row  # テンプレは s.id / s.name で読む
         c.execute("SELECT id, name, password, role, login_token FROM staff ORDER BY id")
         staff = c.fetchall()
-    return render_template("staff_list.html", staff_list=staff)
+    return render_template("staff_list.html", staff_list=staff, versions=versions)
 
 # -------------------------
 # 新規追加（GETフォーム & POST登録）
@@ -123,17 +130,14 @@ def qr(sid):
     token = secrets.token_hex(8)
     with get_connection() as conn:
         c = conn.cursor()
+        old = c.execute("SELECT login_token FROM staff WHERE id=?", (sid,)).fetchone()
         c.execute("UPDATE staff SET login_token=? WHERE id=?", (token, sid))
         conn.commit()
-    # ログインURLをQR化
-    host = request.host.split(":")[0]
-    login_url = f"http://{host}:5000/login/{token}"
-
-    img = qrcode.make(login_url)
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
-    return send_file(buf, mimetype="image/png")
+    # 旧トークンの画像はキャッシュから捨てる
+    if old:
+        qr_cache.invalidate_token(old[0])
+    # ログインURLをQR化（GET のたびに再発行なのでブラウザにはキャッシュさせない）
+    return qrcache.png_response(qrcache.login_url(token), max_age=0)
 
 # -------------------------
 # 削除
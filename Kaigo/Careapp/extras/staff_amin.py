@@ -1,10 +1,15 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, send_file, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session
 from functools import wraps
-from extras.db import get_conn
+from extras.db import get_conn, init_blueprint
 from extras.i18n import _
-import secrets, qrcode, io
+from extras import qrcache
+from extras.qrcache import qr_cache
+from extras import fragcache
+import secrets, sqlite3
 
 staff_admin_bp = Blueprint("staff_admin_bp", __name__)
+init_blueprint(staff_admin_bp)
+fragcache.init_blueprint(staff_admin_bp)
 
 def admin_required(f):
     @wraps(f)
@@ -24,11 +29,12 @@ def admin_page():
 @staff_admin_bp.route("/staff_list")
 @admin_required
 def staff_list():
-    with get_conn() as conn:
+    with get_conn(readonly=True) as conn, fragcache.snapshot(conn, ("staff",)) as versions:
         c = conn.cursor()
+        c.row_factory = sqlite3.Row  # テンプレは s.id / s.name で読む
         c.execute("SELECT id, name, password, role, login_token FROM staff ORDER BY id")
         staff = c.fetchall()
-    return render_template("staff_list.html", staff_list=staff)
+    return render_template("staff_list.html", staff_list=staff, versions=versions)
 
 @staff_admin_bp.route("/qr/<name>")
 @admin_required
@@ -36,8 +42,11 @@ def qr_reissue(name):
     token = secrets.token_hex(8)
     with get_conn() as conn:
         c = conn.cursor()
+        old = c.execute("SELECT login_token FROM staff WHERE name=?", (name,)).fetchone()
         c.execute("UPDATE staff SET login_token=? WHERE name=?", (token, name))
         conn.commit()
+    if old:
+        qr_cache.invalidate_token(old[0])
     flash("OK")
     return redirect(url_for("staff_admin_bp.staff_list"))
 
@@ -60,21 +69,18 @@ def generate_qr():
         token = secrets.token_hex(8)
         with get_conn() as conn:
             c = conn.cursor()
+            old = c.execute("SELECT login_token FROM staff WHERE name=?", (name,)).fetchone()
             c.execute("INSERT OR REPLACE INTO staff(name, role, login_token) VALUES(?,?,?)",
                       (name, role, token))
             conn.commit()
-        host = request.host.split(":")[0]
-        login_url = f"http://{host}:5000/login/{token}"
-        img = qrcode.make(login_url)
-        buf = io.BytesIO()
-        img.save(buf, format="PNG")
-        buf.seek(0)
-        return send_file(buf, mimetype="image/png")
+        if old:
+            qr_cache.invalidate_token(old[0])
+        return qrcache.png_response(qrcache.login_url(token), max_age=0)
     return render_template("generate_qr.html")
 
 @staff_admin_bp.route("/login/<token>")
 def login_by_qr(token):
-    with get_conn() as conn:
+    with get_conn(readonly=True) as conn:
         c = conn.cursor()
         c.execute("SELECT name, role FROM staff WHERE login_token=?", (token,))
         row = c.fetchone()
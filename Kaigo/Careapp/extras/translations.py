@@ -0,0 +1,291 @@
+# extras/translations.py
+# 翻訳カタログの一元管理（プロセスで 1 回だけ読み込み、ロケールはリクエストごとに 1 回だけ決める）
+# 読み込み元: extras/i18n.T（記号キー） + ja.json / en.json（日本語原文キー） + translations/<lang>/LC_MESSAGES/messages.mo
+from __future__ import annotations
+import argparse, gettext as _gettext, hashlib, json, marshal, os, sqlite3, tempfile, threading, time
+
+from flask import g, has_request_context, request, session
+
+from extras import pool as db_pool
+from extras import versions
+
+LANGUAGES = ["ja", "en"]
+DEFAULT_LANG = "ja"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 事前コンパイル済みカタログ（marshal）の置き場所。ソースツリーの外（読み取り専用で配置されても動くように）
+# 既定は一時ディレクトリの下。同じマシンの別チェックアウトと混ざらないよう ROOT ごとに分ける
+COMPILED_DIR = os.environ.get("I18N_CACHE_DIR") or os.path.join(
+    tempfile.gettempdir(), f"careapp-i18n-{hashlib.sha1(ROOT.encode()).hexdigest()[:8]}")
+FORMAT = 1
+# 他ワーカーでの更新やファイル編集を拾う確認間隔（秒）。リクエストごとにはこの間隔でしか stat / DB を見ない
+CHECK_INTERVAL = float(os.environ.get("I18N_CHECK_INTERVAL") or 2)
+# 共有版数は table_versions の 1 行として持つ（管理者の再読み込みで +1）
+VERSION_KEY = "i18n"
+# 未翻訳キーを言語ごとに何種類まで数えるか
+MISSING_MAX = 500
+
+
+def json_path(lang, root=ROOT):
+    for p in (os.path.join(root, "translations", f"{lang}.json"), os.path.join(root, f"{lang}.json")):
+        if os.path.exists(p):
+            return p
+    return None
+
+def compiled_path(lang):
+    return os.path.join(COMPILED_DIR, f"i18n.{lang}.marshal")
+
+def _signature(paths):
+    # 元ファイルが変わったらコンパイル済みを使わない
+    sig = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+            sig.append((p, st.st_mtime_ns, st.st_size))
+        except OSError:
+            pass
+    return sig
+
+
+def _sources(lang, root=ROOT):
+    # extras/i18n.py（T）と JSON。mo は translations/ 以下を見る
+    paths = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "i18n.py")]
+    p = json_path(lang, root)
+    mo = os.path.join(root, "translations", lang, "LC_MESSAGES", "messages.mo")
+    return paths + [x for x in (p, mo) if x]
+
+def _load_sources(lang, root=ROOT):
+    from extras.i18n import T  # extras.i18n からも import されるのでここで読む
+    catalog = dict(T.get(lang, {}))
+    p = json_path(lang, root)
+    if p:
+        try:
+            with open(p, encoding="utf-8") as f:
+                catalog.update(json.load(f))
+        except Exception as e:
+            print(f"[i18n] load fail {p}: {e}")
+    return catalog
+
+def _load_mo(lang, root=ROOT):
+    # i18n.py の gettext 系。見つからなければ NullTranslations（キーをそのまま返す）
+    return _gettext.translation("messages", localedir=os.path.join(root, "translations"),
+                               languages=[lang], fallback=True)
+
+def compile_catalog(lang, root=ROOT):
+    # JSON を読んで marshal で書き出す（起動時は json.load より速く読める）
+    sources = _sources(lang, root)
+    catalog = _load_sources(lang, root)
+    os.makedirs(COMPILED_DIR, exist_ok=True)
+    # 一時ファイル名はワーカーごとに別（同時に書いても途中のファイルを読ませない）
+    fd, tmp = tempfile.mkstemp(prefix=f"i18n.{lang}.", suffix=".tmp", dir=COMPILED_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            marshal.dump((FORMAT, _signature(sources), catalog), f)
+        os.replace(tmp, compiled_path(lang))
+    except BaseException:
+        try: os.remove(tmp)
+        except OSError: pass
+        raise
+    return catalog
+
+def load_catalog(lang, root=ROOT):
+    # コンパイル済みが新しければそれを、古ければ JSON から作り直す
+    sources = _sources(lang, root)
+    try:
+        with open(compiled_path(lang), "rb") as f:
+            fmt, sig, catalog = marshal.load(f)
+        if fmt == FORMAT and sig == _signature(sources):
+            return catalog
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    try:
+        return compile_catalog(lang, root)
+    except OSError:
+        # 書けない場所で動いていても読み込みだけはする
+        return _load_sources(lang, root)
+
+
+class Catalogs:
+    def __init__(self, languages=LANGUAGES, root=ROOT, check_interval=CHECK_INTERVAL):
+        self.languages = list(languages)
+        self.root = root
+        self.check_interval = check_interval
+        self.db_path = None  # init_app で設定。None なら共有版数は見ない
+        self._lock = threading.Lock()
+        self._data: dict = {}
+        self._bound: dict = {}
+        self._sig = None
+        self._version = None
+        self._next_check = 0.0
+        self.missing: dict = {}
+        self.loads = 0
+        self.loaded_at = None
+
+    def _ensure(self):
+        if self._data:
+            return
+        with self._lock:
+            if not self._data:
+                self._load()
+
+    def _signature(self):
+        return [_signature(_sources(lang, self.root)) for lang in self.languages]
+
+    def _load(self, version=None):
+        self.missing = {lang: {} for lang in self.languages}
+        data = {lang: load_catalog(lang, self.root) for lang in self.languages}
+        bound = {lang: self._bind(lang, data[lang], _load_mo(lang, self.root)) for lang in self.languages}
+        self._data, self._bound = data, bound
+        self._sig = self._signature()
+        self._version = self.shared_version() if version is None else version
+        self._next_check = time.monotonic() + self.check_interval
+        self.loads += 1
+        self.loaded_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    def reload(self):
+        with self._lock:
+            self._load()
+        return {lang: len(c) for lang, c in self._data.items()}
+
+    def check(self):
+        # 間隔が来ていればファイルの mtime と共有版数を見て、変わっていれば読み直す
+        if not self._data or time.monotonic() < self._next_check:
+            return False
+        with self._lock:
+            if time.monotonic() < self._next_check:
+                return False
+            self._next_check = time.monotonic() + self.check_interval
+            version = self.shared_version()
+            changed = self._signature() != self._sig
+            if not changed and version == self._version:
+                return False
+            print(f"[i18n] reload ({'files changed' if changed else f'version {self._version} -> {version}'})")
+            self._load(version)
+        return True
+
+    def shared_version(self):
+        if not self.db_path:
+            return None
+        # リクエスト中はそのリクエストの読み取り接続で読む（プールから 2 本目を借りない）
+        try:
+            with db_pool.borrow(db_pool.get_pool(self.db_path, readonly=True)) as conn:
+                return versions.get_versions(conn, [VERSION_KEY]).get(VERSION_KEY, (0, None))[0]
+        except sqlite3.Error:
+            return None
+
+    def _bind(self, lang, catalog, mo):
+        # ロケール固定の検索関数。テンプレの _() はこれを直接呼ぶ（ロケールを毎回解決しない）
+        lookup, fallback = catalog.get, mo.gettext
+        missing = self.missing[lang]
+
+        def _(key, **kwargs):
+            s = lookup(key)
+            if s is None:
+                s = fallback(key)
+                if s == key and (key in missing or len(missing) < MISSING_MAX):
+                    # 未翻訳の記録（ロックなしの概算）
+                    missing[key] = missing.get(key, 0) + 1
+            if kwargs:
+                try: s = s % kwargs
+                except Exception: pass
+            return s
+        return _
+
+    def catalog(self, lang):
+        self._ensure()
+        return self._data.get(lang) or self._data[DEFAULT_LANG]
+
+    def bound(self, lang):
+        self._ensure()
+        return self._bound.get(lang) or self._bound[DEFAULT_LANG]
+
+    def stats(self, top=20):
+        self._ensure()
+        missing = {}
+        for lang, m in self.missing.items():
+            items = sorted(m.items(), key=lambda kv: -kv[1])
+            missing[lang] = {"keys": len(m), "lookups": sum(m.values()), "top": dict(items[:top])}
+        return {"loads": self.loads, "loaded_at": self.loaded_at, "version": self._version,
+                "keys": {lang: len(c) for lang, c in self._data.items()}, "missing": missing}
+
+
+def bump(db_path):
+    # 共有版数を +1（各ワーカーは次の check で読み直す）
+    with db_pool.borrow(db_pool.get_pool(db_path)) as conn:
+        conn.execute("""
+        INSERT INTO table_versions(tbl, version) VALUES(?, 1)
+        ON CONFLICT(tbl) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP""",
+                     (VERSION_KEY,))
+        conn.commit()
+        return versions.get_versions(conn, [VERSION_KEY])[VERSION_KEY][0]
+
+
+# プロセス全体で共有
+catalogs = Catalogs()
+
+
+# ===== ロケール（リクエスト中は g にキャッシュ） =====
+def _resolve():
+    lang = session.get("lang")
+    if lang in LANGUAGES:
+        return lang
+    return request.accept_languages.best_match(LANGUAGES) or DEFAULT_LANG
+
+def get_locale():
+    if not has_request_context():
+        return DEFAULT_LANG
+    lang = g.get("_locale")
+    if lang is None:
+        lang = g._locale = _resolve()
+    return lang
+
+def set_locale(lang):
+    # 言語切替。同じリクエスト内の flash も新しい言語で出す
+    lang = (lang or DEFAULT_LANG).lower()
+    if lang not in LANGUAGES:
+        return None
+    session["lang"] = lang
+    g._locale = lang
+    g.pop("_gettext", None)
+    return lang
+
+def bound():
+    # 現在のリクエストの言語に束縛した検索関数（g にキャッシュ）
+    if not has_request_context():
+        return catalogs.bound(DEFAULT_LANG)
+    fn = g.get("_gettext")
+    if fn is None:
+        catalogs.check()
+        fn = g._gettext = catalogs.bound(get_locale())
+    return fn
+
+def gettext(key, **kwargs):
+    return bound()(key, **kwargs)
+
+
+def init_app(app, db_path=None):
+    # テンプレには束縛済みの _ を渡す（描画 1 回につき 1 回だけ）
+    catalogs.db_path = db_path or app.config.get("DB_PATH")
+    app.jinja_env.globals.update(_=gettext, get_locale=get_locale)
+
+    @app.context_processor
+    def inject_translations():
+        lang = get_locale()
+        return {"_": bound(), "get_locale": get_locale, "current_lang": lang,
+                "CURRENT_LANG": lang, "LANGS": LANGUAGES}
+
+
+def main():
+    p = argparse.ArgumentParser(description="翻訳カタログの事前コンパイル（ja.json / en.json → marshal）")
+    p.add_argument("command", choices=["compile", "status"])
+    args = p.parse_args()
+    for lang in LANGUAGES:
+        if args.command == "compile":
+            n = len(compile_catalog(lang))
+            print(f"[OK] {lang}: {n} keys -> {compiled_path(lang)}")
+        else:
+            path = compiled_path(lang)
+            state = f"{os.path.getsize(path)} bytes" if os.path.exists(path) else "not compiled"
+            print(f"{lang}: {len(load_catalog(lang))} keys  {path} ({state})")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from functools import wraps
-from extras.db import get_conn
+from extras.db import get_conn, get_roster, init_blueprint
 from extras.i18n import _
+from extras import fragcache
 
 users_bp = Blueprint("users_bp", __name__)
+init_blueprint(users_bp)
+fragcache.init_blueprint(users_bp)
 
 def admin_required(f):
     @wraps(f)
@@ -16,11 +19,11 @@ def admin_required(f):
 @users_bp.route("/users")
 @admin_required
 def users_page():
-    with get_conn() as conn:
+    with get_conn(readonly=True) as conn, fragcache.snapshot(conn, ("users",)) as versions:
         c = conn.cursor()
         c.execute("SELECT id, name, age, gender, room_number, notes FROM users ORDER BY id")
         users = c.fetchall()
-    return render_template("users.html", users=users)
+    return render_template("users.html", users=users, versions=versions)
 
 @users_bp.route("/add_user", methods=["GET","POST"])
 @admin_required
@@ -36,6 +39,7 @@ def add_user():
             c.execute("INSERT INTO users(name,age,gender,room_number,notes) VALUES(?,?,?,?,?)",
                       (name,age,gender,room,notes))
             conn.commit()
+        get_roster().invalidate()
         flash(_("user_added"))
         return redirect(url_for("users_bp.users_page"))
     return render_template("add_user.html")
@@ -47,5 +51,6 @@ def delete_user(user_id):
         c = conn.cursor()
         c.execute("DELETE FROM users WHERE id=?", (user_id,))
         conn.commit()
+    get_roster().invalidate()
     flash(_("user_deleted"))
     return redirect(url_for("users_bp.users_page"))
@@ -0,0 +1,35 @@
+# extras/versions.py
+# テーブルごとの変更カウンタ（トリガーで更新。ETag やキャッシュキーに使う）
+from __future__ import annotations
+
+VERSIONED_TABLES = ("users", "staff", "records", "handover")
+
+def install(conn, tables=VERSIONED_TABLES):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS table_versions(
+      tbl TEXT PRIMARY KEY,
+      version INTEGER NOT NULL DEFAULT 0,
+      updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""")
+    for t in tables:
+        conn.execute("INSERT OR IGNORE INTO table_versions(tbl) VALUES(?)", (t,))
+        for op in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {t}_version_{op.lower()}
+            AFTER {op} ON {t}
+            BEGIN
+              UPDATE table_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+               WHERE tbl = '{t}';
+            END""")
+
+def get_versions(conn, tables):
+    # {tbl: (version, updated_at)} を返す（1 クエリ）
+    tables = tuple(tables)
+    rows = conn.execute(
+        f"SELECT tbl, version, updated_at FROM table_versions WHERE tbl IN ({','.join('?' * len(tables))})",
+        tables).fetchall()
+    out = {}
+    for r in rows:
+        tbl, version, updated_at = tuple(r.values()) if isinstance(r, dict) else tuple(r)
+        out[tbl] = (version, updated_at)
+    return out
@@ -0,0 +1,203 @@
+# extras/writequeue.py
+# グループコミット用の書き込みキュー（専用の書き込みスレッドが小さな束で 1 トランザクションにまとめる）
+from __future__ import annotations
+import atexit, os, queue, sqlite3, threading, time
+
+from extras import pool as db_pool
+
+ENABLED = os.environ.get("WRITE_BEHIND", "").lower() in ("1", "true", "on")
+QUEUE_SIZE = int(os.environ.get("WRITE_QUEUE_SIZE") or 256)
+MAX_BATCH = int(os.environ.get("WRITE_MAX_BATCH") or 64)
+# 最初の 1 件を受けてから後続を待つ時間（秒）。0 なら溜まっている分だけ
+LINGER = float(os.environ.get("WRITE_LINGER") or 0.002)
+SUBMIT_TIMEOUT = float(os.environ.get("WRITE_SUBMIT_TIMEOUT") or 5)
+# コミット完了を待つ上限（秒）。書き込みスレッドが止まっても要求側が永久に待たないように
+WAIT_TIMEOUT = float(os.environ.get("WRITE_WAIT_TIMEOUT") or db_pool.DEFAULT_TIMEOUT)
+
+
+class QueueFull(Exception):
+    """キューが詰まっていて受け付けられない（呼び出し側は 503 を返す）"""
+
+
+class WriteTimeout(Exception):
+    """書き込みスレッドが時間内にコミットを返さない・DB がロックされている（呼び出し側は 503 を返す）"""
+
+
+def is_busy(e):
+    # 他の書き手がロックを持ったまま busy_timeout を過ぎた
+    return isinstance(e, sqlite3.OperationalError) and ("locked" in str(e) or "busy" in str(e))
+
+
+PENDING, RUNNING, CANCELLED = "pending", "running", "cancelled"
+_state_lock = threading.Lock()
+
+class Job:
+    __slots__ = ("fn", "done", "result", "error", "state")
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.state = PENDING
+
+    def claim(self):
+        # 書き込みスレッドが実行直前に呼ぶ。取り消し済みなら False（実行しない）
+        with _state_lock:
+            if self.state == CANCELLED:
+                return False
+            self.state = RUNNING
+            return True
+
+    def wait(self, timeout=WAIT_TIMEOUT):
+        # コミット完了（= 永続化）まで待つ。時間切れのときはまだ始まっていなければ取り消す
+        # （WriteTimeout を受けた側が再送しても二重に入らない）
+        if not self.done.wait(timeout):
+            with _state_lock:
+                if self.state == PENDING:
+                    self.state = CANCELLED
+                    raise WriteTimeout(f"write not started within {timeout}s (cancelled)")
+            # 実行中なら残りは束の続きと COMMIT だけなので、もう一度だけ待つ
+            if not self.done.wait(timeout):
+                raise WriteTimeout(f"write not acknowledged within {timeout * 2}s")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class WriteQueue:
+    def __init__(self, path, queue_size=QUEUE_SIZE, max_batch=MAX_BATCH, linger=LINGER):
+        self.path = path
+        self.max_batch = max_batch
+        self.linger = linger
+        self._q: queue.Queue[Job] = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._stats = {"submitted": 0, "rejected": 0, "committed": 0, "failed": 0, "cancelled": 0,
+                       "batches": 0, "max_batch": 0, "max_depth": 0, "commit_time": 0.0}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, timeout=SUBMIT_TIMEOUT):
+        # fn(conn) は書き込み専用接続上で実行される。戻り値が Job.wait() の結果になる
+        if not self._thread.is_alive():
+            raise WriteTimeout("writer thread is not running")
+        job = Job(fn)
+        try:
+            self._q.put(job, timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise QueueFull("write queue is full")
+        with self._lock:
+            self._stats["submitted"] += 1
+            self._stats["max_depth"] = max(self._stats["max_depth"], self._q.qsize())
+        return job
+
+    def run(self, fn, timeout=WAIT_TIMEOUT):
+        return self.submit(fn).wait(timeout)
+
+    def _take_batch(self):
+        try:
+            first = self._q.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.max_batch:
+            left = deadline - time.monotonic()
+            try:
+                batch.append(self._q.get_nowait() if left <= 0 else self._q.get(timeout=left))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = db_pool.connect(self.path)
+        conn.isolation_level = None  # トランザクションはここで明示的に管理する
+        try:
+            while not (self._stop.is_set() and self._q.empty()):
+                batch = self._take_batch()
+                if batch:
+                    self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        t0 = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for job in batch:
+                # 待ち手が時間切れで取り消したものは実行しない（ロックを取ってから確かめる）
+                if not job.claim():
+                    continue
+                # 1 件の失敗で束全体を巻き戻さないよう SAVEPOINT で包む
+                conn.execute("SAVEPOINT job")
+                try:
+                    job.result = job.fn(conn)
+                    conn.execute("RELEASE job")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    job.error = e
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            # ロック待ちの時間切れは 503（再送してよい）として返す
+            err = WriteTimeout(f"database is locked: {e}") if is_busy(e) else e
+            for job in batch:
+                job.result, job.error = None, err
+        elapsed = time.perf_counter() - t0
+        with self._lock:
+            s = self._stats
+            s["batches"] += 1
+            s["max_batch"] = max(s["max_batch"], len(batch))
+            s["commit_time"] += elapsed
+            for job in batch:
+                s["cancelled" if job.state == CANCELLED else
+                  "failed" if job.error is not None else "committed"] += 1
+        for job in batch:
+            job.done.set()
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        s["depth"] = self._q.qsize()
+        s["avg_batch"] = round((s["committed"] + s["failed"]) / s["batches"], 2) if s["batches"] else 0
+        s["commit_time"] = round(s["commit_time"], 4)
+        return s
+
+    def close(self, timeout=5):
+        self._stop.set()
+        self._thread.join(timeout)
+
+
+# ===== プロセス全体で DB パスごとに 1 本 =====
+_queues: dict[str, WriteQueue] = {}
+_queues_lock = threading.Lock()
+
+def get_queue(path):
+    # WRITE_BEHIND が無効なら None（呼び出し側は従来どおり直接書く）
+    if not ENABLED:
+        return None
+    key = os.path.abspath(path)
+    q = _queues.get(key)
+    if q is None:
+        with _queues_lock:
+            q = _queues.get(key)
+            if q is None:
+                q = _queues[key] = WriteQueue(key)
+    return q
+
+def queue_stats():
+    return {path: q.stats() for path, q in list(_queues.items())}
+
+def close_all():
+    with _queues_lock:
+        qs = list(_queues.values())
+        _queues.clear()
+    for q in qs:
+        q.close()
+
+atexit.register(close_all)
@@ -1,30 +1,18 @@
 # i18n.py
-from flask import Blueprint, session, redirect, request, url_for, current_app, g
-import gettext
-import os
+from flask import Blueprint, redirect, request, url_for, g
+from extras import translations
 
 i18n_bp = Blueprint("i18n", __name__)
 
-SUPPORTED_LANGS = ["ja", "en"]
-DEFAULT_LANG = "ja"
+SUPPORTED_LANGS = translations.LANGUAGES
+DEFAULT_LANG = translations.DEFAULT_LANG
 
 def get_lang():
-    lang = session.get("lang") or request.accept_languages.best_match(SUPPORTED_LANGS) or DEFAULT_LANG
-    if lang not in SUPPORTED_LANGS:
-        lang = DEFAULT_LANG
-    return lang
+    return translations.get_locale()
 
 def _get_translator(lang):
-    # translations/<lang>/LC_MESSAGES/messages.mo を読む
-    localedir = os.path.join(current_app.root_path, "translations")
-    try:
-        trans = gettext.translation("messages", localedir=localedir, languages=[lang])
-        trans.install()
-        _ = trans.gettext
-    except Exception:
-        gettext.install("messages")
-        _ = gettext.gettext
-    return _
+    # カタログ（JSON + translations/<lang>/LC_MESSAGES/messages.mo）は初回に 1 回だけ読む（builtins は書き換えない）
+    return translations.catalogs.bound(lang)
 
 @i18n_bp.before_app_request
 def inject_lang():
@@ -38,9 +26,7 @@ def expose_i18n():
 
 @i18n_bp.route("/set_language/<lang>")
 def set_language(lang):
-    if lang not in SUPPORTED_LANGS:
-        lang = DEFAULT_LANG
-    session["lang"] = lang
+    translations.set_locale(lang if lang in SUPPORTED_LANGS else DEFAULT_LANG)
     # 直前ページに戻る（なければホーム）
     ref = request.referrer or url_for("home")
     return redirect(ref)
@@ -0,0 +1,151 @@
+# seed_data.py
+# 負荷試験用の合成データを投入する（利用者・スタッフ・数年分の記録・引継ぎ）。--seed が同じなら同じデータになる
+import os, sys, argparse, random, textwrap, time
+from datetime import date, datetime, timedelta
+
+from extras import migrations
+from extras import pool as db_pool
+from extras.i18n import T
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.environ.get("DB_PATH") or os.path.join(APP_ROOT, "care.db")
+BATCH = 5000
+
+SURNAMES = ["佐藤", "鈴木", "高橋", "田中", "伊藤", "渡辺", "山本", "中村", "小林", "加藤",
+            "吉田", "山田", "佐々木", "山口", "松本", "井上", "木村", "林", "斎藤", "清水",
+            "山崎", "森", "池田", "橋本", "阿部", "石川", "山下", "中島", "石井", "小川"]
+GIVEN_F = ["ハナ", "キヨ", "トミ", "フミ", "ヨシ子", "和子", "幸子", "節子", "恵子", "久子", "美代子", "千代"]
+GIVEN_M = ["正雄", "清", "実", "茂", "勇", "博", "進", "弘", "武", "昭", "一郎", "三郎"]
+STAFF_GIVEN = ["翔", "美咲", "大輔", "彩", "健太", "由美", "拓也", "愛", "直樹", "舞", "亮", "香織"]
+MEMOS = ["", "", "", "特変なし", "日中は穏やかに過ごされた", "午後から微熱あり、経過観察",
+         "家族の面会あり", "入浴実施", "リハビリ参加", "食欲やや低下", "夜間よく眠れていた",
+         "水分摂取を促した", "転倒なし、歩行は安定", "皮膚の発赤あり、看護師へ報告"]
+HANDOVER_NOTES = ["{name}さん 夕食後の服薬を確認してください", "{name}さん 夜間のトイレ誘導をお願いします",
+                  "{name}さん 37.6℃、翌朝も検温", "{name}さん ご家族から連絡あり、明日面会予定",
+                  "{name}さん 食事量が少なめ、水分補給を", "備品（おむつ）の補充が必要です",
+                  "{name}さん 受診予定 10:00", "{name}さん 入浴は明日に変更"]
+SHIFTS = ["day", "evening", "night"]
+# 記録の時刻（朝・昼・夕・就寝前）
+HOURS = [8, 12, 18, 21]
+
+
+def _choices(key):
+    # 画面の選択肢（extras/i18n.T）。「その他」は除き、たまに空欄にする
+    return [v for v in T["ja"][key] if v != "その他"] + [None]
+
+def residents(rng, n):
+    out = []
+    for _ in range(n):
+        gender = rng.choice(["男", "女"])
+        given = rng.choice(GIVEN_M if gender == "男" else GIVEN_F)
+        out.append((f"{rng.choice(SURNAMES)} {given}", rng.randint(68, 101), gender,
+                    f"{rng.randint(1, 4)}{rng.randint(1, 30):02d}", rng.choice(["", "", "車椅子", "糖尿病食", "難聴"])))
+    return out
+
+def staff(rng, n):
+    out, seen = [], set()
+    while len(out) < n:
+        name = f"{rng.choice(SURNAMES)} {rng.choice(STAFF_GIVEN)}"
+        if name in seen:
+            name = f"{name}{len(out)}"
+        seen.add(name)
+        out.append((name, "pass", "admin" if len(out) < max(1, n // 10) else "caregiver"))
+    return out
+
+def record_rows(rng, user_ids, staff_names, days, per_day, end):
+    # 1 日ずつ、利用者ごとに per_day 件（時刻は HOURS から）
+    meal, med, toilet, cond = (_choices(k) for k in ("meal_choices", "med_choices", "toilet_choices", "cond_choices"))
+    hours = HOURS[:per_day] if per_day <= len(HOURS) else HOURS + [rng.randint(0, 23) for _ in range(per_day - len(HOURS))]
+    for d in range(days, 0, -1):
+        day = end - timedelta(days=d - 1)
+        for uid in user_ids:
+            for h in hours:
+                ts = datetime(day.year, day.month, day.day, h, rng.randint(0, 59), rng.randint(0, 59))
+                # created_at は UTC で持つ（CURRENT_TIMESTAMP と同じ）
+                yield (uid, rng.choice(meal), rng.choice(med), rng.choice(toilet), rng.choice(cond),
+                       rng.choice(MEMOS), rng.choice(staff_names), (ts - timedelta(hours=9)).strftime("%Y-%m-%d %H:%M:%S"))
+
+def handover_rows(rng, residents_, staff_names, days, per_day, end):
+    for d in range(days, 0, -1):
+        day = end - timedelta(days=d - 1)
+        for _ in range(per_day):
+            rid, name = rng.choice(residents_)
+            note = rng.choice(HANDOVER_NOTES).format(name=name.split()[0])
+            ts = datetime(day.year, day.month, day.day, rng.randint(7, 22), rng.randint(0, 59)) - timedelta(hours=9)
+            yield (day.isoformat(), rng.choice(SHIFTS), note, rng.choice(staff_names), rid,
+                   rng.randint(1, 3), ts.strftime("%Y-%m-%d %H:%M:%S"))
+
+def _insert(conn, sql, rows):
+    n, batch = 0, []
+    for r in rows:
+        batch.append(r)
+        if len(batch) >= BATCH:
+            conn.executemany(sql, batch); conn.commit()
+            n += len(batch); batch = []
+            print(f"  ... {n}", end="\r", flush=True)
+    if batch:
+        conn.executemany(sql, batch); conn.commit()
+        n += len(batch)
+    return n
+
+
+def seed(db_path, n_residents=100, n_staff=30, years=1.0, per_day=3, handovers=6, seed_value=42, end=None):
+    rng = random.Random(seed_value)
+    end = end or date.today()
+    days = max(1, int(round(365 * years)))
+    migrations.upgrade_path(db_path)
+    conn = db_pool.connect(db_path)
+    try:
+        t0 = time.monotonic()
+        conn.executemany("INSERT INTO users(name, age, gender, room_number, notes) VALUES(?,?,?,?,?)",
+                         residents(rng, n_residents))
+        conn.executemany("INSERT OR IGNORE INTO staff(name, password, role) VALUES(?,?,?)", staff(rng, n_staff))
+        conn.commit()
+        rs = [tuple(r) for r in conn.execute("SELECT id, name FROM users ORDER BY id DESC LIMIT ?", (n_residents,))]
+        staff_names = [r[0] for r in conn.execute("SELECT name FROM staff")]
+        print(f"[seed] residents={len(rs)} staff={len(staff_names)} days={days}")
+        n_rec = _insert(conn, """
+            INSERT INTO records(user_id, meal, medication, toilet, condition, memo, staff_name, created_at)
+            VALUES(?,?,?,?,?,?,?,?)""", record_rows(rng, [r[0] for r in rs], staff_names, days, per_day, end))
+        print(f"[seed] records={n_rec}")
+        n_ho = _insert(conn, """
+            INSERT INTO handover(h_date, shift, note, staff, resident_id, priority, created_at)
+            VALUES(?,?,?,?,?,?,?)""", handover_rows(rng, rs, staff_names, days, handovers, end))
+        print(f"[seed] handover={n_ho}")
+        conn.execute("ANALYZE")
+        conn.commit()
+        return {"residents": len(rs), "records": n_rec, "handover": n_ho,
+                "seconds": round(time.monotonic() - t0, 1)}
+    finally:
+        conn.close()
+
+
+def main():
+    p = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=textwrap.dedent(
+            """\
+            負荷試験用の合成データを投入します（既存データには追記）。
+            例:  python seed_data.py --db bench.db
+                 python seed_data.py --db bench.db --residents 300 --years 3 --per-day 4
+            """))
+    p.add_argument("--db", default=DEFAULT_DB, help=f"DBパス（既定: {DEFAULT_DB}）")
+    p.add_argument("--residents", type=int, default=100, help="利用者数（既定: 100）")
+    p.add_argument("--staff", type=int, default=30, help="スタッフ数（既定: 30）")
+    p.add_argument("--years", type=float, default=1.0, help="記録の年数（既定: 1）")
+    p.add_argument("--per-day", type=int, default=3, help="利用者 1 人 1 日あたりの記録数（既定: 3）")
+    p.add_argument("--handovers", type=int, default=6, help="1 日あたりの引継ぎ数（既定: 6）")
+    p.add_argument("--seed", type=int, default=42, help="乱数シード（既定: 42）")
+    p.add_argument("--yes", "-y", action="store_true", help="既定の care.db にも確認なしで投入する")
+    args = p.parse_args()
+
+    db_path = os.path.abspath(args.db)
+    if db_path == os.path.abspath(os.path.join(APP_ROOT, "care.db")) and not args.yes:
+        print("[ERROR] 本番の care.db には投入しません。--db で別のファイルを指定してください（強行は --yes）。")
+        sys.exit(1)
+    print(f"[INFO] DB: {db_path}")
+    r = seed(db_path, args.residents, args.staff, args.years, args.per_day, args.handovers, args.seed)
+    print(f"[OK] {r}")
+
+if __name__ == "__main__":
+    main()